@@ -0,0 +1,471 @@
+"""
+Benchmark Suite
+Seeds a synthetic Firestore (InMemoryBackend) and database at a chosen scale,
+then measures sync throughput per collection, page latencies and cache hit
+ratios, and writes the results as JSON so runs can be compared across commits
+"""
+import contextlib
+import io
+import json
+import logging
+import platform
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .firebase_service import FirebaseService
+from .firebase_sync import FirebaseSyncService
+from .firestore_backends import InMemoryBackend
+from .request_profile import CacheCounter
+
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+def parse_scale(value):
+    """Number of documents for '10k', '100k', '1m' or a plain number"""
+    value = str(value).strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        scale = int(value.replace('_', ''))
+    except ValueError:
+        raise ValueError(f"Unknown scale {value!r}: use {', '.join(SCALES)} or a number")
+    if scale < 1:
+        raise ValueError("Scale must be at least 1")
+    return scale
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Synthetic documents, shaped like the app's collections (see the sync_* methods)
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+STATUSES = ['completed', 'completed', 'completed', 'pending', 'failed', 'refunded']
+SYMBOLS = ['EURUSD', 'GBPUSD', 'USDJPY', 'XAUUSD', 'BTCUSD', 'US30']
+
+
+def _moment(number, spread_days=365):
+    return EPOCH + timedelta(minutes=(number * 7919) % (spread_days * 1440))
+
+
+def _user(number, users):
+    # Same IDs as InMemoryBackend.generate gives the users collection
+    return f'users-{number % users:0{len(str(users))}d}'
+
+
+def _documents(collection_name, users):
+    """Factory for a collection's synthetic documents (None for unknown collections)"""
+    def purchase(n):
+        amount = 10 + (n * 37) % 490
+        return {
+            'userId': _user(n, users), 'amount': amount, 'paid': amount, 'total_amount': amount,
+            'purchase_date': _moment(n), 'updated_at': _moment(n), 'status': STATUSES[n % len(STATUSES)],
+            'product_name': f'Course {n % 40}', 'description': 'Synthetic purchase',
+        }
+
+    def payment(n):
+        price = 29 + (n * 13) % 170
+        return {
+            'userId': _user(n, users), 'amount': price, 'paid': price, 'total_amount': price, 'price': price,
+            'payment_date': _moment(n), 'updated_at': _moment(n), 'payment_method': ['card', 'paypal'][n % 2],
+            'status': STATUSES[n % len(STATUSES)], 'signal_type': ['forex', 'crypto', 'indices'][n % 3],
+            'subscription_period': ['monthly', 'yearly'][n % 2],
+        }
+
+    def notification(n):
+        return {
+            'userId': _user(n, users), 'title': f'Signal {SYMBOLS[n % len(SYMBOLS)]}',
+            'message': 'Entry reached', 'type': 'signal', 'signal_data': {'symbol': SYMBOLS[n % len(SYMBOLS)]},
+            'read': n % 3 == 0, 'priority': 'high' if n % 5 == 0 else 'normal',
+            'notification_date': _moment(n), 'updated_at': _moment(n),
+        }
+
+    def progress(n):
+        completed = [f'video-{video}' for video in range(n % 12)]
+        return {
+            'userId': _user(n, users), 'completed_videos': completed,
+            'video_durations': {video: 300 for video in completed},
+            'progress_percentage': round(len(completed) / 12 * 100, 2),
+            'last_activity': _moment(n), 'updated_at': _moment(n),
+        }
+
+    def signal(n):
+        entry = 1 + (n % 1000) / 1000
+        return {
+            'type': ['buy', 'sell'][n % 2], 'symbol': SYMBOLS[n % len(SYMBOLS)], 'entry_price': entry,
+            'stop_loss': entry * 0.99, 'take_profit': entry * 1.02, 'title': f'Signal {n}',
+            'description': 'Synthetic signal', 'status': ['active', 'closed'][n % 2],
+            'signal_date': _moment(n), 'expiry_date': _moment(n) + timedelta(days=1), 'updated_at': _moment(n),
+        }
+
+    def subscription(n):
+        return {
+            'userId': _user(n, users), 'subscription_type': ['monthly', 'yearly'][n % 2],
+            'status': ['active', 'expired'][n % 2], 'start_date': _moment(n),
+            'end_date': _moment(n) + timedelta(days=30), 'auto_renew': n % 2 == 0, 'price': 49,
+            'updated_at': _moment(n),
+        }
+
+    def course(n):
+        return {
+            'title': f'Course {n}', 'description': 'Synthetic course', 'instructor': f'Instructor {n % 7}',
+            'duration': 60 + n % 600, 'level': ['beginner', 'advanced'][n % 2], 'category': 'trading',
+            'video_count': 5 + n % 30, 'price': 99, 'is_free': n % 10 == 0, 'updated_at': _moment(n),
+        }
+
+    def token(n):
+        return {
+            'userId': _user(n, users), 'token': f'token-{n}', 'platform': ['ios', 'android'][n % 2],
+            'device_info': 'Synthetic device', 'is_active': n % 4 != 0, 'last_used': _moment(n),
+            'updated_at': _moment(n),
+        }
+
+    def app_notification(n):
+        return {
+            'title': f'Announcement {n}', 'message': 'Synthetic announcement', 'type': 'news',
+            'target_audience': 'all', 'priority': 'normal', 'scheduled_date': _moment(n),
+            'sent_date': _moment(n), 'is_sent': True, 'updated_at': _moment(n),
+        }
+
+    def testimonial(n):
+        return {
+            'userId': _user(n, users), 'author_name': f'Trader {n}', 'author_email': f'trader{n}@example.com',
+            'content': 'Synthetic testimonial', 'rating': 1 + n % 5, 'updated_at': _moment(n),
+        }
+
+    def firebase_user(n):
+        return {
+            'email': f'user{n}@example.com', 'display_name': f'User {n}', 'is_premium': n % 4 == 0,
+            'last_login': _moment(n, 30), 'account_created': _moment(n), 'updated_at': _moment(n),
+        }
+
+    def watchlist(n):
+        # Not a synced model, so it goes through the generic document mirror
+        return {
+            'userId': _user(n, users), 'symbols': SYMBOLS[:1 + n % len(SYMBOLS)],
+            'alerts': n % 3, 'updated_at': _moment(n),
+        }
+
+    return {
+        'purchases': purchase,
+        'premium_signals_payments': payment,
+        'signal_notifications': notification,
+        'user_progress': progress,
+        'premium_signals': signal,
+        'premium_signals_subscriptions': subscription,
+        'courses': course,
+        'fcm_tokens': token,
+        'app_notifications': app_notification,
+        'testimonials': testimonial,
+        'users': firebase_user,
+        'watchlists': watchlist,
+    }.get(collection_name)
+
+
+# Share of the documents each collection gets
+COLLECTION_SHARES = {
+    'purchases': 0.22,
+    'premium_signals_payments': 0.14,
+    'signal_notifications': 0.2,
+    'user_progress': 0.12,
+    'users': 0.1,
+    'fcm_tokens': 0.06,
+    'watchlists': 0.05,
+    'app_notifications': 0.04,
+    'premium_signals': 0.03,
+    'premium_signals_subscriptions': 0.02,
+    'courses': 0.01,
+    'testimonials': 0.01,
+}
+
+
+def seed_firestore(scale, backend=None):
+    """
+    Fill a backend with `scale` synthetic documents spread over the collections
+
+    Returns:
+        tuple: (backend, collection -> number of documents)
+    """
+    backend = backend or InMemoryBackend(seed=1)
+    users = max(1, int(scale * COLLECTION_SHARES['users']))
+    sizes = {}
+    for collection_name, share in COLLECTION_SHARES.items():
+        count = max(1, int(scale * share))
+        backend.generate(collection_name, count, _documents(collection_name, users))
+        sizes[collection_name] = count
+    return backend, sizes
+
+
+# Measurement
+
+class BenchmarkTimer:
+    """
+    Times calls, with the interface of pytest-benchmark's `benchmark` fixture
+
+    The bench_* cases below take either this or the real fixture.
+    """
+
+    def __init__(self, rounds=1, warmup_rounds=0):
+        self.rounds = rounds
+        self.warmup_rounds = warmup_rounds
+        self.samples = []  # seconds
+
+    def __call__(self, func, *args, **kwargs):
+        return self.pedantic(func, args, kwargs, rounds=self.rounds, warmup_rounds=self.warmup_rounds)
+
+    def pedantic(self, target, args=(), kwargs=None, rounds=1, warmup_rounds=0, iterations=1):
+        kwargs = kwargs or {}
+        for _ in range(warmup_rounds):
+            target(*args, **kwargs)
+        result = None
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                result = target(*args, **kwargs)
+            self.samples.append((time.perf_counter() - started) / iterations)
+        return result
+
+    def stats(self):
+        """Latency statistics of the timed rounds, in milliseconds"""
+        if not self.samples:
+            return {'rounds': 0}
+        samples = [sample * 1000 for sample in self.samples]
+        return {
+            'rounds': len(samples),
+            'min_ms': round(min(samples), 3),
+            'mean_ms': round(sum(samples) / len(samples), 3),
+            'p50_ms': round(percentile(samples, 0.5), 3),
+            'p99_ms': round(percentile(samples, 0.99), 3),
+            'max_ms': round(max(samples), 3),
+        }
+
+
+# Cases (pytest-benchmark style: `benchmark` is the fixture or a BenchmarkTimer)
+
+def bench_sync_collection(benchmark, collection_name):
+    """One full sync of a collection; returns its statistics"""
+    FirebaseService.clear_cache(collection_name)
+    return benchmark.pedantic(FirebaseSyncService.sync_collection, args=(collection_name,), rounds=1)
+
+
+def bench_view(benchmark, client, url, rounds=30, warmup_rounds=2):
+    """Repeated GETs of a page; returns the last response"""
+    return benchmark.pedantic(client.get, args=(url,), rounds=rounds, warmup_rounds=warmup_rounds)
+
+
+class BenchmarkSuite:
+    """Seeds the datasets and runs every case"""
+
+    # Pages measured, by name: (URL name, URL args, query string)
+    VIEWS = {
+        'dashboard_view': ('dashboard', (), ''),
+        'model_list_view': ('model_list', ('purchases',), ''),
+        'firebase_data_view': ('firebase_data', (), '?collection=purchases'),
+        'check_firebase_updates': ('check_firebase_updates', (), '?collection=purchases'),
+    }
+
+    # The cache the suite runs on, so clearing it between pages leaves the real one alone
+    CACHES = {
+        'default': {
+            'BACKEND': 'accounts.cache_backend.InstrumentedLocMemCache',
+            'LOCATION': 'benchmark-cache',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
+    def __init__(self, scale, view_rounds=30, latency=0, quiet=True, log=None):
+        """
+        Args:
+            scale (int): Number of synthetic Firestore documents
+            view_rounds (int): Timed requests per page
+            latency (float): Seconds the backend adds to every Firestore call
+            quiet (bool): Swallow what the services print and log while being measured
+            log (callable): Called with progress messages
+        """
+        self.scale = scale
+        self.view_rounds = view_rounds
+        self.latency = latency
+        self.quiet = quiet
+        self.log = log or (lambda message: None)
+        self.backend = None
+        self.sizes = {}
+
+    @contextlib.contextmanager
+    def _silenced(self):
+        if not self.quiet:
+            yield
+            return
+        logging.disable(logging.CRITICAL)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        finally:
+            logging.disable(logging.NOTSET)
+
+    @contextlib.contextmanager
+    def active(self):
+        """Serve Firestore from the seeded backend and the cache from CACHES in the block"""
+        with override_settings(CACHES=self.CACHES):
+            FirebaseService.set_backend(self.backend)
+            try:
+                yield
+            finally:
+                FirebaseService.set_backend(None)
+                caches['default'].clear()
+
+    def seed(self):
+        started = time.perf_counter()
+        self.backend, self.sizes = seed_firestore(self.scale)
+        self.backend.latency = self.latency
+        self.log(f"Seeded {sum(self.sizes.values())} Firestore documents in {time.perf_counter() - started:.1f}s")
+
+    def run_syncs(self):
+        """
+        Sync every collection twice: into an empty table, then again unchanged
+
+        Returns:
+            dict: Collection -> documents, seconds and docs/sec of both passes
+        """
+        results = {}
+        for collection_name, size in self.sizes.items():
+            row = {'documents': size}
+            for phase in ('initial', 'resync'):
+                timer = BenchmarkTimer()
+                reads = self.backend.reads
+                with self._silenced():
+                    stats = bench_sync_collection(timer, collection_name)
+                seconds = timer.samples[0]
+                row[phase] = {
+                    'seconds': round(seconds, 3),
+                    'docs_per_sec': round(stats['total'] / seconds, 1) if seconds else None,
+                    'changed': stats.get('changed', stats['created'] + stats['updated']),
+                    'errors': stats['errors'],
+                    'firestore_reads': self.backend.reads - reads,
+                }
+            results[collection_name] = row
+            self.log(
+                f"sync {collection_name}: {row['initial']['docs_per_sec']} docs/s initial, "
+                f"{row['resync']['docs_per_sec']} docs/s resync"
+            )
+        return results
+
+    def run_views(self):
+        """
+        Request each page view_rounds times, as a logged-in user, starting
+        each page from an empty cache (run it inside active())
+
+        Returns:
+            tuple: (view -> latency statistics with its cache hits, overall cache statistics)
+        """
+        user, _ = User.objects.get_or_create(username='benchmark')
+        client = Client()
+        client.force_login(user)
+
+        results = {}
+        hits = misses = 0
+        for name, (url_name, url_args, query) in self.VIEWS.items():
+            url = reverse(url_name, args=url_args) + query
+            caches['default'].clear()
+            timer = BenchmarkTimer()
+            with self._silenced(), CacheCounter() as counter:
+                response = bench_view(timer, client, url, rounds=self.view_rounds)
+            results[name] = dict(timer.stats(), status=response.status_code, cache=counter.stats())
+            hits += counter.hits
+            misses += counter.misses
+            self.log(f"{name}: p50 {results[name]['p50_ms']} ms, p99 {results[name]['p99_ms']} ms")
+
+        lookups = hits + misses
+        cache = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / lookups, 4) if lookups else None}
+        return results, cache
+
+    @staticmethod
+    def environment():
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+
+    def run(self):
+        """
+        Seed, then run every case
+
+        Returns:
+            dict: JSON-serializable results
+        """
+        FirebaseService.set_backend(None)
+        self.seed()
+        with self.active():
+            syncs = self.run_syncs()
+            views, cache = self.run_views()
+
+        return {
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'environment': self.environment(),
+            'scale': self.scale,
+            'latency': self.latency,
+            'collections': self.sizes,
+            'sync': syncs,
+            'views': views,
+            'cache': cache,
+        }
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def headline_metrics(results):
+    """Flat metric name -> value of a run, the numbers compared between runs"""
+    metrics = {}
+    for collection_name, row in results.get('sync', {}).items():
+        for phase in ('initial', 'resync'):
+            metrics[f'sync.{collection_name}.{phase}.docs_per_sec'] = row[phase]['docs_per_sec']
+    for name, row in results.get('views', {}).items():
+        metrics[f'views.{name}.p50_ms'] = row.get('p50_ms')
+        metrics[f'views.{name}.p99_ms'] = row.get('p99_ms')
+        metrics[f'views.{name}.cache_hit_ratio'] = row.get('cache', {}).get('hit_ratio')
+    metrics['cache.hit_ratio'] = results.get('cache', {}).get('hit_ratio')
+    return metrics
+
+
+def compare_results(baseline, current):
+    """
+    Metrics of two runs side by side
+
+    Returns:
+        list: (metric, baseline value, current value, change in percent) tuples;
+              the change is None where either value is missing or the baseline is 0
+    """
+    before, after = headline_metrics(baseline), headline_metrics(current)
+    rows = []
+    for metric in sorted(set(before) | set(after)):
+        old, new = before.get(metric), after.get(metric)
+        change = round((new - old) / old * 100, 1) if old and new is not None else None
+        rows.append((metric, old, new, change))
+    return rows
@@ -0,0 +1,34 @@
+"""
+Instrumented Cache Backend
+The local-memory cache, counting hits, misses and evictions in the metrics
+registry (see accounts.metrics)
+"""
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+
+class InstrumentedLocMemCache(LocMemCache):
+    """LocMemCache that reports its hits, misses and culled entries"""
+
+    _MISSING = object()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.metrics_name = name
+
+    def get(self, key, default=None, version=None):
+        # get_many() and get_or_set() go through here too
+        value = super().get(key, self._MISSING, version=version)
+        if value is self._MISSING:
+            metrics.CACHE_REQUESTS.inc(cache=self.metrics_name, result='miss')
+            return default
+        metrics.CACHE_REQUESTS.inc(cache=self.metrics_name, result='hit')
+        return value
+
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        evicted = before - len(self._cache)
+        if evicted:
+            metrics.CACHE_EVICTIONS.inc(evicted, cache=self.metrics_name)
@@ -0,0 +1,293 @@
+"""
+Firestore Change Listener
+Streams document adds, modifications and removals from snapshot listeners into
+the sync writer in micro-batches, reconnecting (and resuming from the synced
+watermark) when a listener drops. The initial snapshot of each subscription
+reconciles the mirror with the collection
+"""
+import logging
+import threading
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from . import metrics
+from .collection_stats import CollectionCounters
+from .firebase_service import DocumentChange, FirebaseService
+from .firebase_sync import FirebaseSyncService
+
+
+logger = logging.getLogger(__name__)
+
+
+class FirestoreListenerSource:
+    """Snapshot listeners on the real Firestore (see FirebaseService.listen)"""
+
+    def subscribe(self, collection_name, on_changes, resume_field=None, resume_after=None):
+        return FirebaseService.listen(collection_name, on_changes, resume_field, resume_after)
+
+
+class FakeWatch:
+    """Subscription handle returned by FakeListenerSource"""
+
+    def __init__(self, on_changes):
+        self.on_changes = on_changes
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class FakeListenerSource:
+    """
+    In-memory listener source for tests and offline runs
+
+    Changes are delivered synchronously by push(); the first push() after a
+    subscription is its initial snapshot, as with Firestore (push() with no
+    changes delivers an empty one). disconnect() drops a subscription the way
+    a failed Firestore stream does.
+    """
+
+    def __init__(self):
+        self.watches = {}
+        self.subscriptions = []  # (collection, resume_field, resume_after) per subscribe()
+        self.fail_subscriptions = 0
+
+    def subscribe(self, collection_name, on_changes, resume_field=None, resume_after=None):
+        self.subscriptions.append((collection_name, resume_field, resume_after))
+        if self.fail_subscriptions:
+            self.fail_subscriptions -= 1
+            raise ConnectionError(f"Fake subscription to {collection_name} failed")
+        watch = self.watches[collection_name] = FakeWatch(on_changes)
+        return watch
+
+    def push(self, collection_name, *changes):
+        """Deliver changes, given as DocumentChange or (kind, document) tuples"""
+        watch = self.watches[collection_name]
+        if not watch.is_active:
+            return
+        batch = []
+        for change in changes:
+            if not isinstance(change, DocumentChange):
+                kind, document = change
+                change = DocumentChange(kind, str(document['id']), document)
+            batch.append(change)
+        watch.on_changes(batch)
+
+    def disconnect(self, collection_name):
+        self.watches[collection_name].is_active = False
+
+
+class ChangeListener:
+    """Micro-batching mirror of the configured collections' snapshot listeners"""
+
+    # Seconds between writes of the buffered changes
+    FLUSH_INTERVAL = 1.0
+
+    # A collection with this many buffered changes is written without waiting
+    BATCH_SIZE = 500
+
+    # Reconnect backoff (seconds), doubled per consecutive failure
+    RECONNECT_DELAY = 1
+    MAX_RECONNECT_DELAY = 60
+
+    def __init__(self, collections=None, source=None):
+        """
+        Args:
+            collections (dict): Collection name -> options ({'resume_field': ...});
+                settings.FIRESTORE_LISTENERS by default
+            source: Listener source (FirestoreListenerSource by default)
+        """
+        if collections is None:
+            collections = getattr(settings, 'FIRESTORE_LISTENERS', {})
+        self.collections = {name: dict(options or {}) for name, options in collections.items()}
+        self.source = source or FirestoreListenerSource()
+
+        self._lock = threading.Lock()
+        self._pending = {}  # collection -> {document id: latest DocumentChange}
+        self._snapshots = set()  # collections whose buffer holds an initial snapshot
+        self._wake = threading.Event()
+        self._watches = {}
+        self._retry_at = {}
+        self._delays = {}
+        self.reconnects = 0
+
+    def _on_changes(self, collection_name, changes, snapshot=False):
+        # Runs on the listener's thread: only buffer, the database is written by flush()
+        with self._lock:
+            if snapshot:
+                self._snapshots.add(collection_name)
+                if not self.collections[collection_name].get('resume_field'):
+                    # The whole collection: whatever was buffered before is superseded
+                    self._pending[collection_name] = {}
+            pending = self._pending.setdefault(collection_name, {})
+            for change in changes:
+                pending[change.document_id] = change  # later changes supersede earlier ones
+            full = len(pending) >= self.BATCH_SIZE
+            metrics.QUEUE_DEPTH.set(len(pending), queue=f'listener:{collection_name}')
+        if full:
+            self._wake.set()
+
+    def _resume_after(self, collection_name):
+        resume_field = self.collections[collection_name].get('resume_field')
+        if not resume_field:
+            return None
+        return CollectionCounters.get(FirebaseSyncService.counter_key(collection_name)).last_remote_watermark
+
+    def connect(self, collection_name):
+        """(Re)subscribe to a collection; failures are retried with backoff"""
+        options = self.collections[collection_name]
+        initial = [True]
+
+        def on_changes(changes):
+            # The first delivery of a subscription is its initial snapshot
+            snapshot, initial[0] = initial[0], False
+            self._on_changes(collection_name, changes, snapshot=snapshot)
+
+        try:
+            watch = self.source.subscribe(
+                collection_name,
+                on_changes,
+                resume_field=options.get('resume_field'),
+                resume_after=self._resume_after(collection_name),
+            )
+            if watch is None:
+                raise ConnectionError("Firebase is not available")
+        except Exception as e:
+            delay = self._delays.get(collection_name, self.RECONNECT_DELAY)
+            logger.error(
+                "Error listening to %s, retrying in %s seconds: %s", collection_name, delay, e,
+                extra={'collection': collection_name},
+            )
+            self._retry_at[collection_name] = time.monotonic() + delay
+            self._delays[collection_name] = min(delay * 2, self.MAX_RECONNECT_DELAY)
+            self._watches.pop(collection_name, None)
+            return False
+
+        self._watches[collection_name] = watch
+        self._delays.pop(collection_name, None)
+        self._retry_at.pop(collection_name, None)
+        return True
+
+    def ensure_connected(self):
+        """Reconnect listeners that dropped (once their backoff has passed)"""
+        now = time.monotonic()
+        for collection_name in self.collections:
+            watch = self._watches.get(collection_name)
+            if watch is not None and getattr(watch, 'is_active', True):
+                continue
+            if now < self._retry_at.get(collection_name, 0):
+                continue
+            if watch is not None:
+                # Changes still buffered are not in the watermark yet, so resuming
+                # from it reads them again rather than skipping anything
+                self.reconnects += 1
+            self.connect(collection_name)
+
+    def flush(self):
+        """
+        Write the buffered changes
+
+        A buffered initial snapshot of a collection without a resume field is
+        the whole collection: it is written as such (replacing the schema
+        statistics instead of adding to them) and documents missing from it are
+        deleted. After a snapshot of a collection with a resume field, which
+        only holds documents updated since the watermark, a count aggregation
+        tells whether documents were deleted meanwhile; if so the collection
+        is synced in full.
+
+        Returns:
+            dict: Collection -> sync statistics plus 'removed'
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            snapshots, self._snapshots = self._snapshots, set()
+            self._wake.clear()
+            for collection_name in pending:
+                metrics.QUEUE_DEPTH.set(0, queue=f'listener:{collection_name}')
+
+        results = {}
+        for collection_name, changes in pending.items():
+            snapshot = collection_name in snapshots
+            complete = snapshot and not self.collections[collection_name].get('resume_field')
+            upserts = [change.document for change in changes.values() if change.kind != 'removed']
+            removed = [change.document_id for change in changes.values() if change.kind == 'removed']
+            try:
+                stats = {}
+                if upserts or complete:
+                    with FirebaseSyncService.complete_documents() if complete else nullcontext():
+                        stats = FirebaseSyncService.sync_collection(collection_name, documents=upserts)
+                stats['removed'] = FirebaseSyncService.remove_documents(collection_name, removed) if removed else 0
+                stats['removed'] += stats.pop('deleted', 0)
+                if snapshot and not complete:
+                    stats['removed'] += self._reconcile(collection_name)
+            except Exception as e:
+                logger.error(
+                    "Error writing changes of %s, will retry: %s", collection_name, e,
+                    extra={'collection': collection_name},
+                )
+                self._requeue(collection_name, changes, snapshot)
+                continue
+            results[collection_name] = stats
+        return results
+
+    def _reconcile(self, collection_name):
+        """
+        Sync a resumed collection in full if it lost documents while disconnected
+
+        Returns:
+            int: Local documents deleted
+        """
+        remote = FirebaseService.count_collection(collection_name)
+        if remote is None or FirebaseSyncService.local_count(collection_name) <= remote:
+            return 0
+        logger.info(
+            "%s has fewer documents than the mirror after reconnecting, syncing it in full", collection_name,
+            extra={'collection': collection_name},
+        )
+        return FirebaseSyncService.sync_collection(collection_name).get('deleted', 0)
+
+    def _requeue(self, collection_name, changes, snapshot=False):
+        with self._lock:
+            if snapshot:
+                self._snapshots.add(collection_name)
+            pending = self._pending.setdefault(collection_name, {})
+            for document_id, change in changes.items():
+                pending.setdefault(document_id, change)  # keep anything newer that arrived meanwhile
+            metrics.QUEUE_DEPTH.set(len(pending), queue=f'listener:{collection_name}')
+
+    def run_once(self):
+        """Reconnect what dropped and write what was buffered"""
+        self.ensure_connected()
+        return self.flush()
+
+    def run(self, duration=None, on_flush=None):
+        """
+        Listen until interrupted (or for `duration` seconds)
+
+        Args:
+            duration (float): Seconds to run for (forever if None)
+            on_flush (callable): Called with the statistics of every non-empty flush
+        """
+        deadline = time.monotonic() + duration if duration is not None else None
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                results = self.run_once()
+                if results and on_flush:
+                    on_flush(results)
+                self._wake.wait(self.FLUSH_INTERVAL)
+        finally:
+            results = self.close()
+            if results and on_flush:
+                on_flush(results)
+
+    def close(self):
+        """Unsubscribe every listener and write what is still buffered"""
+        for watch in self._watches.values():
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.error("Error closing listener: %s", e)
+        self._watches.clear()
+        return self.flush()
@@ -0,0 +1,133 @@
+"""
+Collection Stats Service
+Serves per-model row counts and sync freshness from the CollectionStats table
+so views never have to run COUNT(*) over the large synced tables
+
+Counters are keyed by model, or by a 'mirror:<collection>' label for
+collections stored in the generic MirroredDocument table.
+"""
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import CollectionStats, MirroredDocument
+from .conditional import SyncGeneration
+
+
+class CollectionCounters:
+    """Read and maintain the CollectionStats rows"""
+
+    MIRROR_PREFIX = 'mirror:'
+
+    @staticmethod
+    def key(model):
+        return model if isinstance(model, str) else model._meta.label_lower
+
+    @classmethod
+    def _count_rows(cls, model):
+        if isinstance(model, str):
+            collection_name = model[len(cls.MIRROR_PREFIX):]
+            return MirroredDocument.objects.filter(collection=collection_name).count()
+        return model.objects.count()
+
+    @classmethod
+    def _initialize(cls, model):
+        """Create the stats row for a model from a one-off COUNT(*)"""
+        stats, _ = CollectionStats.objects.get_or_create(
+            model_label=cls.key(model),
+            defaults={'row_count': cls._count_rows(model)},
+        )
+        return stats
+
+    @classmethod
+    def get(cls, model):
+        """
+        Get the stats row for a model, creating it on first use
+
+        Returns:
+            CollectionStats: The stats row
+        """
+        stats = CollectionStats.objects.filter(model_label=cls.key(model)).first()
+        return stats or cls._initialize(model)
+
+    @classmethod
+    def count(cls, model):
+        """Row count of a synced model"""
+        return cls.get(model).row_count
+
+    @classmethod
+    def counts(cls, models):
+        """
+        Row counts for several models in one query
+
+        Returns:
+            dict: model -> row count
+        """
+        rows = dict(
+            CollectionStats.objects.filter(model_label__in=[cls.key(model) for model in models])
+            .values_list('model_label', 'row_count')
+        )
+        return {
+            model: rows[cls.key(model)] if cls.key(model) in rows else cls._initialize(model).row_count
+            for model in models
+        }
+
+    @classmethod
+    def record_write(cls, model, created, watermark=None, updated=0, deleted=0):
+        """
+        Account for a batch written by the sync; call inside the batch transaction
+
+        Args:
+            model: Model that was written
+            created (int): Number of rows inserted
+            watermark (datetime): Latest remote update time in the batch
+            updated (int): Number of existing rows rewritten
+            deleted (int): Number of rows deleted
+        """
+        now = timezone.now()
+        updates = {
+            'row_count': F('row_count') + created - deleted,
+            'last_synced_at': now,
+            'updated_at': now,
+        }
+        changed = bool(created or updated or deleted)
+        if changed:
+            updates['generation'] = F('generation') + 1
+            updates['last_changed_at'] = now
+            # Conditional GET validators are derived from these two fields
+            transaction.on_commit(lambda: SyncGeneration.invalidate(cls.key(model)))
+        if watermark is not None:
+            # Coalesce first: GREATEST() is NULL on MySQL/SQLite if the stored watermark is NULL
+            watermark_value = Value(watermark, output_field=DateTimeField())
+            updates['last_remote_watermark'] = Greatest(
+                Coalesce(F('last_remote_watermark'), watermark_value), watermark_value
+            )
+
+        if not CollectionStats.objects.filter(model_label=cls.key(model)).update(**updates):
+            # First write for this model: the rows just inserted are already visible to COUNT(*)
+            stats = cls._initialize(model)
+            stats.last_synced_at = now
+            stats.last_remote_watermark = watermark
+            if changed:
+                stats.generation += 1
+                stats.last_changed_at = now
+            stats.save(update_fields=['last_synced_at', 'last_remote_watermark', 'generation', 'last_changed_at', 'updated_at'])
+
+    @classmethod
+    def recount(cls, models):
+        """
+        Recompute row counts from the tables (repairs drift after manual edits)
+
+        Returns:
+            dict: model -> row count
+        """
+        counts = {}
+        for model in models:
+            with transaction.atomic():
+                counts[model] = cls._count_rows(model)
+                CollectionStats.objects.update_or_create(
+                    model_label=cls.key(model),
+                    defaults={'row_count': counts[model]},
+                )
+        return counts
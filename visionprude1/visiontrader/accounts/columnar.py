@@ -0,0 +1,365 @@
+"""
+Columnar Snapshot Service
+Exports the synced tables to partitioned Parquet / Arrow IPC files, appending
+only rows changed since the last export plus tombstones for deleted rows, and
+reads them back for analytics
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+
+from .exports import DataExport
+from .models import DeletedRow
+from .numeric_summary import NumericSummary
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for columnar exports
+    pa = pc = ds = pq = None
+
+
+class ColumnarSnapshot:
+    """Incremental columnar mirror of the synced models (one dataset per model)"""
+
+    FORMATS = {
+        'parquet': 'parquet',
+        'arrow': 'arrow',  # Arrow IPC (Feather v2)
+    }
+
+    # Rows fetched per query while exporting
+    CHUNK_SIZE = 10000
+
+    STATE_FILE = '_watermarks.json'
+
+    # Subdirectory of a dataset holding the ids of deleted rows (the leading
+    # underscore keeps it out of the dataset scan)
+    DELETIONS_DIR = '_deleted'
+
+    @staticmethod
+    def is_available():
+        return pa is not None
+
+    @staticmethod
+    def base_dir():
+        return str(getattr(settings, 'COLUMNAR_EXPORT_DIR', os.path.join(settings.BASE_DIR, 'analytics')))
+
+    @classmethod
+    def dataset_dir(cls, model_name):
+        return os.path.join(cls.base_dir(), model_name)
+
+    # --- Schema ---------------------------------------------------------------
+
+    @staticmethod
+    def arrow_type(field):
+        """Arrow type for a model field (decimals and timestamps keep their precision)"""
+        if isinstance(field, models.DecimalField):
+            return pa.decimal128(field.max_digits, field.decimal_places)
+        if isinstance(field, models.DateTimeField):
+            return pa.timestamp('us', tz='UTC')
+        if isinstance(field, models.DateField):
+            return pa.date32()
+        if isinstance(field, models.BooleanField):
+            return pa.bool_()
+        if isinstance(field, (models.AutoField, models.IntegerField, models.ForeignKey)):
+            return pa.int64()
+        if isinstance(field, models.FloatField):
+            return pa.float64()
+        return pa.string()
+
+    @classmethod
+    def schema(cls, model):
+        return pa.schema([
+            pa.field(field.attname, cls.arrow_type(field), nullable=not field.primary_key)
+            for field in model._meta.concrete_fields
+        ])
+
+    @staticmethod
+    def _column_value(field, value):
+        if value is None:
+            return None
+        if isinstance(field, models.JSONField):
+            return json.dumps(value)
+        if isinstance(field, models.FileField):
+            return str(value) or None
+        if isinstance(field, models.DateTimeField):
+            return value.astimezone(dt_timezone.utc)
+        return value
+
+    # --- Watermarks -------------------------------------------------------------
+
+    @classmethod
+    def load_state(cls):
+        path = os.path.join(cls.base_dir(), cls.STATE_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, encoding='utf-8') as state_file:
+            return json.load(state_file)
+
+    @classmethod
+    def save_state(cls, state):
+        os.makedirs(cls.base_dir(), exist_ok=True)
+        path = os.path.join(cls.base_dir(), cls.STATE_FILE)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file, indent=2)
+        os.replace(tmp_path, path)
+
+    # --- Deletions ------------------------------------------------------------
+
+    @staticmethod
+    def record_deletions(model, pks):
+        """
+        Remember rows deleted by the sync until the next export of their model
+
+        Call inside the transaction that deletes them.
+
+        Args:
+            model: Model the rows were deleted from
+            pks (list): Primary keys of the deleted rows
+        """
+        DeletedRow.objects.bulk_create(
+            [DeletedRow(model_label=model._meta.label_lower, row_id=pk) for pk in pks],
+            batch_size=1000,
+        )
+
+    # --- Export ---------------------------------------------------------------
+
+    @classmethod
+    def _iter_chunks(cls, model, watermark):
+        """Yield lists of model rows ordered by (synced_at, id), after the watermark"""
+        queryset = model.objects.order_by('synced_at', 'id')
+        synced_at, pk = watermark if watermark else (None, None)
+
+        while True:
+            window = queryset
+            if synced_at is not None:
+                window = window.filter(Q(synced_at__gt=synced_at) | Q(synced_at=synced_at, id__gt=pk))
+            rows = list(window[:cls.CHUNK_SIZE])
+            if not rows:
+                return
+            yield rows
+            synced_at, pk = rows[-1].synced_at, rows[-1].pk
+            if len(rows) < cls.CHUNK_SIZE:
+                return
+
+    @classmethod
+    def export_model(cls, model_name, export_format='parquet', full=False):
+        """
+        Append the rows synced since the last export of a model
+
+        Rows are partitioned by the day they were synced
+        (<model>/synced_date=YYYY-MM-DD/part-<run>.<ext>). A changed row is
+        appended again; read() keeps the newest copy of each id. Rows deleted
+        from the table since the last export are recorded as tombstones that
+        read() leaves out.
+
+        Args:
+            model_name (str): Key from DataExport.MODELS
+            export_format (str): 'parquet' or 'arrow'
+            full (bool): Discard the existing files and export everything
+
+        Returns:
+            tuple: (rows written, deleted rows recorded)
+        """
+        model = DataExport.MODELS[model_name][0]
+        fields = model._meta.concrete_fields
+        schema = cls.schema(model)
+        directory = cls.dataset_dir(model_name)
+
+        state = cls.load_state()
+        if full:
+            shutil.rmtree(directory, ignore_errors=True)
+            state.pop(model_name, None)
+            # The new export holds only rows that still exist
+            DeletedRow.objects.filter(model_label=model._meta.label_lower).delete()
+        exported_before = os.path.isdir(directory)
+
+        watermark = None
+        if model_name in state:
+            entry = state[model_name]
+            watermark = (parse_datetime(entry['synced_at']), entry['id'])
+
+        run_id = uuid.uuid4().hex[:12]
+        extension = cls.FORMATS[export_format]
+        writers = {}
+        written = 0
+        last_row = None
+
+        try:
+            for rows in cls._iter_chunks(model, watermark):
+                partitions = {}
+                for row in rows:
+                    day = row.synced_at.astimezone(dt_timezone.utc).date().isoformat()
+                    partitions.setdefault(day, []).append(row)
+
+                for day, partition_rows in partitions.items():
+                    batch = pa.RecordBatch.from_arrays([
+                        pa.array([cls._column_value(field, getattr(row, field.attname)) for row in partition_rows],
+                                 type=schema.field(field.attname).type)
+                        for field in fields
+                    ], schema=schema)
+
+                    writer = writers.get(day)
+                    if writer is None:
+                        partition_dir = os.path.join(directory, f'synced_date={day}')
+                        os.makedirs(partition_dir, exist_ok=True)
+                        path = os.path.join(partition_dir, f'part-{run_id}.{extension}')
+                        if export_format == 'parquet':
+                            writer = pq.ParquetWriter(path, schema)
+                        else:
+                            writer = pa.ipc.new_file(path, schema)
+                        writers[day] = writer
+                    writer.write_batch(batch)
+
+                written += len(rows)
+                last_row = rows[-1]
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+        # Only advance the watermark once every file of the run is complete
+        if last_row is not None:
+            state = cls.load_state()
+            state[model_name] = {
+                'synced_at': last_row.synced_at.isoformat(),
+                'id': last_row.pk,
+                'format': export_format,
+            }
+            cls.save_state(state)
+        elif full:
+            cls.save_state(state)
+
+        return written, cls._export_deletions(model, model_name, run_id, exported_before)
+
+    @classmethod
+    def _export_deletions(cls, model, model_name, run_id, exported_before=True):
+        """
+        Write the tombstones of the rows deleted since the last export
+
+        The ids come from the DeletedRow table (see record_deletions), so the
+        cost follows the number of deletions rather than the size of the table.
+        Rows deleted outside the sync are not tracked: --verify reports them and
+        --full drops them.
+        """
+        tombstones = DeletedRow.objects.filter(model_label=model._meta.label_lower)
+        last_id = tombstones.aggregate(last=Max('id'))['last']
+        if last_id is None:
+            return 0
+        tombstones = tombstones.filter(id__lte=last_id)
+        if not exported_before:
+            # This run exported the table as it is now, so there is nothing to leave out
+            tombstones.delete()
+            return 0
+
+        deleted = pa.array(
+            tombstones.order_by('id').values_list('row_id', flat=True).iterator(chunk_size=cls.CHUNK_SIZE),
+            type=pa.int64(),
+        )
+        export_format = cls.load_state().get(model_name, {}).get('format', 'parquet')
+        schema = pa.schema([pa.field('id', pa.int64(), nullable=False)])
+        table = pa.table({'id': deleted}, schema=schema)
+        deletions_dir = os.path.join(cls.dataset_dir(model_name), cls.DELETIONS_DIR)
+        os.makedirs(deletions_dir, exist_ok=True)
+        path = os.path.join(deletions_dir, f'part-{run_id}.{cls.FORMATS[export_format]}')
+        if export_format == 'parquet':
+            pq.write_table(table, path)
+        else:
+            with pa.ipc.new_file(path, schema) as writer:
+                writer.write_table(table)
+
+        # Only forget the deletions once their file is complete
+        tombstones.delete()
+        return len(deleted)
+
+    # --- Read -----------------------------------------------------------------
+
+    @classmethod
+    def read(cls, model_name, columns=None, filter=None):
+        """
+        Load an exported model as an Arrow table (newest copy of each row, deleted rows left out)
+
+        Args:
+            model_name (str): Key from DataExport.MODELS
+            columns (list): Columns to load (all if None)
+            filter: pyarrow.dataset expression applied while scanning
+
+        Returns:
+            pyarrow.Table: The rows, or None if the model was never exported
+        """
+        directory = cls.dataset_dir(model_name)
+        if not os.path.isdir(directory):
+            return None
+
+        export_format = cls.load_state().get(model_name, {}).get('format', 'parquet')
+        dataset = ds.dataset(
+            directory,
+            format='ipc' if export_format == 'arrow' else 'parquet',
+            partitioning='hive',
+        )
+        load_columns = None
+        if columns is not None:
+            load_columns = list(dict.fromkeys(list(columns) + ['id', 'synced_at']))
+        table = dataset.to_table(columns=load_columns, filter=filter)
+
+        deletions_dir = os.path.join(directory, cls.DELETIONS_DIR)
+        if os.path.isdir(deletions_dir):
+            deleted = ds.dataset(deletions_dir, format='ipc' if export_format == 'arrow' else 'parquet')
+            deleted_ids = deleted.to_table(columns=['id']).column('id')
+            table = table.filter(pc.invert(pc.is_in(table.column('id'), value_set=deleted_ids.combine_chunks())))
+
+        # Keep the last synced copy of every id
+        table = table.sort_by([('id', 'ascending'), ('synced_at', 'descending')])
+        if table.num_rows > 1:
+            ids = table.column('id')
+            changed = pc.not_equal(ids.slice(1), ids.slice(0, table.num_rows - 1))
+            table = table.filter(pa.concat_arrays([pa.array([True]), changed.combine_chunks()]))
+
+        if columns is not None:
+            table = table.select(list(columns))
+        return table
+
+    @classmethod
+    def numeric_summary(cls, model_name):
+        """
+        Summary of an exported model's numeric columns, computed by Arrow from the files
+
+        Answers the same question as NumericSummary.aggregate() without a query
+        on the synced table, as of the last export.
+
+        Returns:
+            dict: Same shape as NumericSummary.aggregate(), or None if the model
+                  was never exported
+        """
+        fields = NumericSummary.model_fields(DataExport.MODELS[model_name][0])
+        table = cls.read(model_name, columns=fields)
+        if table is None:
+            return None
+
+        summary = {}
+        for field in sorted(fields):
+            column = table.column(field)
+            count = len(column) - column.null_count
+            if not count:
+                continue
+            values = pc.cast(column, pa.float64())
+            extremes = pc.min_max(values)
+            summary[field.replace('_', ' ').title()] = {
+                'field': field,
+                'sum': pc.sum(values).as_py(),
+                'count': count,
+                'mean': pc.mean(values).as_py(),
+                'min': extremes['min'].as_py(),
+                'max': extremes['max'].as_py(),
+                'null_rate': (table.num_rows - count) / table.num_rows,
+            }
+        return summary
@@ -0,0 +1,86 @@
+"""
+Conditional Responses
+ETag validators for the data views, derived from the sync generation of
+each collection, so unchanged pages are answered with
+304 Not Modified before the view (and the ORM or templates) runs
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Max, Sum
+
+from .models import CollectionStats
+
+
+class SyncGeneration:
+    """Cached (generation, last change, remote watermark) per CollectionStats label"""
+
+    # How long a process may serve a cached state; writers in the same process
+    # (or sharing the cache backend) invalidate it on commit, others see the
+    # change after at most this many seconds
+    CACHE_TIMEOUT = 10
+
+    ALL = '*'
+
+    # Validators never predate the running code, so a deploy invalidates cached pages
+    STARTED_AT = time.time()
+
+    @staticmethod
+    def cache_key(label):
+        return f'sync_generation_{label}'
+
+    @staticmethod
+    def _timestamp(value):
+        return value.timestamp() if value else 0
+
+    @classmethod
+    def get(cls, labels):
+        """
+        Sync state of several collections (one query for those not cached)
+
+        Args:
+            labels (list): CollectionStats labels (see CollectionCounters.key)
+
+        Returns:
+            dict: label -> (generation, last change timestamp, remote watermark timestamp)
+        """
+        keys = {cls.cache_key(label): label for label in labels}
+        states = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+        missing = [label for label in labels if label not in states]
+        if missing:
+            rows = {
+                label: (generation, cls._timestamp(changed), cls._timestamp(watermark))
+                for label, generation, changed, watermark in CollectionStats.objects.filter(
+                    model_label__in=missing
+                ).values_list('model_label', 'generation', 'last_changed_at', 'last_remote_watermark')
+            }
+            fresh = {label: rows.get(label, (0, 0, 0)) for label in missing}
+            cache.set_many({cls.cache_key(label): state for label, state in fresh.items()}, cls.CACHE_TIMEOUT)
+            states.update(fresh)
+
+        return states
+
+    @classmethod
+    def get_all(cls):
+        """Combined sync state of every collection"""
+        state = cache.get(cls.cache_key(cls.ALL))
+        if state is None:
+            totals = CollectionStats.objects.aggregate(
+                generation=Sum('generation'),
+                changed=Max('last_changed_at'),
+                watermark=Max('last_remote_watermark'),
+            )
+            state = (totals['generation'] or 0, cls._timestamp(totals['changed']), cls._timestamp(totals['watermark']))
+            cache.set(cls.cache_key(cls.ALL), state, cls.CACHE_TIMEOUT)
+        return state
+
+    @classmethod
+    def invalidate(cls, label):
+        cache.delete_many([cls.cache_key(label), cls.cache_key(cls.ALL)])
+
+    @classmethod
+    def etag(cls, *parts):
+        """Strong ETag value for content determined by `parts`"""
+        return hashlib.sha256(repr((cls.STARTED_AT,) + parts).encode()).hexdigest()[:32]
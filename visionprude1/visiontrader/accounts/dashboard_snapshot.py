@@ -0,0 +1,288 @@
+"""
+Dashboard Snapshot Service
+Computes the dashboard statistics in a handful of grouped queries and keeps
+the result in the cache so the dashboard renders from a single cache hit
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Func, IntegerField, Subquery
+from django.utils import timezone
+
+from .models import (
+    Purchase, PremiumSignalPayment, SignalNotification, UserProgress,
+    PremiumSignal, PremiumSignalSubscription, Course, FCMToken,
+    AppNotification, Testimonial, FirebaseUser, DashboardSnapshotRecord, CollectionStats
+)
+from .rollups import RevenueRollups
+from .collection_stats import CollectionCounters
+
+
+class DashboardSnapshot:
+    """Cached, incrementally refreshed dashboard statistics"""
+
+    CACHE_KEY = 'dashboard_snapshot'
+    CACHE_TIMEOUT = 900  # 15 minutes, bounds how stale the "last 7 days" counts can get
+    RECENT_DAYS = 7
+
+    # Section key (as used by the dashboard template's db_stats) -> model
+    SECTIONS = {
+        'purchases': Purchase,
+        'premium_payments': PremiumSignalPayment,
+        'signal_notifications': SignalNotification,
+        'user_progress': UserProgress,
+        'premium_signals': PremiumSignal,
+        'premium_signal_subscriptions': PremiumSignalSubscription,
+        'courses': Course,
+        'fcm_tokens': FCMToken,
+        'app_notifications': AppNotification,
+        'testimonials': Testimonial,
+        'firebase_users': FirebaseUser,
+    }
+
+    @staticmethod
+    def filtered_querysets(key, since):
+        """Querysets of a section whose row counts it shows besides its total"""
+        if key == 'purchases':
+            return {'recent': Purchase.objects.filter(purchase_date__gte=since)}
+        if key == 'premium_payments':
+            return {'recent': PremiumSignalPayment.objects.filter(payment_date__gte=since)}
+        if key == 'signal_notifications':
+            return {
+                'recent': SignalNotification.objects.filter(notification_date__gte=since),
+                'unread': SignalNotification.objects.filter(read=False),
+            }
+        if key == 'premium_signal_subscriptions':
+            return {'active': PremiumSignalSubscription.objects.filter(status='active')}
+        return {}
+
+    @classmethod
+    def counts(cls, keys, since):
+        """
+        Row counts and filtered counts of the given sections in one query
+
+        The totals come from CollectionStats; the filtered counts ride along as
+        scalar subqueries of the same statement.
+
+        Returns:
+            dict: Section key -> {'count': ..., plus its filtered counts}
+        """
+        subqueries = {}
+        for key in keys:
+            for name, queryset in cls.filtered_querysets(key, since).items():
+                subqueries[f'{key}__{name}'] = Subquery(
+                    queryset.order_by()
+                    .annotate(rows=Func(F('pk'), function='COUNT', output_field=IntegerField()))
+                    .values('rows')
+                )
+
+        labels = {CollectionCounters.key(cls.SECTIONS[key]): key for key in keys}
+        query = CollectionStats.objects.filter(model_label__in=list(labels)).annotate(**subqueries)
+        rows = list(query.values('model_label', 'row_count', *subqueries))
+        if len(rows) < len(labels):
+            # First use: create the missing counters from a one-off COUNT(*)
+            seen = {row['model_label'] for row in rows}
+            CollectionCounters.counts([cls.SECTIONS[key] for label, key in labels.items() if label not in seen])
+            rows = list(query.values('model_label', 'row_count', *subqueries))
+
+        counts = {labels[row['model_label']]: {'count': row['row_count']} for row in rows}
+        for alias in subqueries:
+            key, name = alias.rsplit('__', 1)
+            counts[key][name] = rows[0][alias] or 0
+        return counts
+
+    @classmethod
+    def compute_section(cls, key, counts):
+        """
+        Compute the statistics for one section
+
+        Args:
+            key (str): Section key from SECTIONS
+            counts (dict): The section's row count and filtered counts (see counts())
+
+        Returns:
+            dict: Section statistics (always contains 'count')
+        """
+        section = dict(counts)
+        if key == 'purchases':
+            revenue = RevenueRollups.totals(source='purchase')
+            section['total_revenue'] = revenue['amount_total']
+            section['total_paid'] = revenue['paid_total']
+            section['avg_purchase'] = revenue['avg_amount']
+            section['latest'] = list(Purchase.objects.values(
+                'firebase_user_id', 'product_name', 'amount', 'status'
+            )[:5])
+            return section
+
+        if key == 'premium_payments':
+            revenue = RevenueRollups.totals(source='premium_payment')
+            section['total_revenue'] = revenue['amount_total']
+            section['total_paid'] = revenue['paid_total']
+            section['avg_payment'] = revenue['avg_amount']
+            section['latest'] = list(PremiumSignalPayment.objects.values(
+                'firebase_user_id', 'signal_type', 'amount', 'status'
+            )[:5])
+            return section
+
+        if key == 'premium_signals':
+            section['latest'] = list(PremiumSignal.objects.values('symbol', 'signal_type', 'status')[:5])
+            return section
+
+        if key == 'firebase_users':
+            section['latest'] = list(FirebaseUser.objects.values('email', 'display_name', 'is_premium')[:10])
+            return section
+
+        return section
+
+    @classmethod
+    def compute(cls, keys=None, snapshot=None):
+        """
+        Compute a snapshot, optionally only refreshing some sections of an existing one
+
+        Args:
+            keys (iterable): Section keys to recompute, or None for all
+            snapshot (dict): Existing snapshot to update in place
+
+        Returns:
+            dict: The snapshot
+        """
+        now = timezone.now()
+        if snapshot is None:
+            snapshot = {'sections': {}}
+            keys = None
+
+        since = now - timedelta(days=cls.RECENT_DAYS)
+        keys = list(keys if keys is not None else cls.SECTIONS)
+        counts = cls.counts(keys, since)
+        for key in keys:
+            snapshot['sections'][key] = cls.compute_section(key, counts[key])
+
+        if len(keys) == len(cls.SECTIONS):
+            snapshot['computed_at'] = now
+        snapshot['updated_at'] = now
+        return snapshot
+
+    @classmethod
+    def get(cls):
+        """
+        Get the current snapshot, computing it on a cache miss
+
+        Returns:
+            dict: The snapshot
+        """
+        snapshot = cache.get(cls.CACHE_KEY)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = cls._load_record()
+        if snapshot is not None:
+            cache.set(cls.CACHE_KEY, snapshot, cls.CACHE_TIMEOUT)
+            return snapshot
+
+        snapshot = cls.compute()
+        cls._save(snapshot)
+        return snapshot
+
+    @classmethod
+    def refresh(cls, keys=None):
+        """
+        Recompute the given sections of the cached snapshot (all sections if None)
+
+        Returns:
+            dict: The refreshed snapshot, or None if there was nothing cached to refresh
+        """
+        if keys is None:
+            snapshot = cls.compute()
+        else:
+            snapshot = cache.get(cls.CACHE_KEY)
+            if snapshot is None:
+                # Nobody has looked at the dashboard since it expired; compute lazily
+                # on the next view instead, but don't let a stale copy be loaded
+                cls.invalidate()
+                return None
+            snapshot = cls.compute(keys=keys, snapshot=snapshot)
+        cls._save(snapshot)
+        return snapshot
+
+    @classmethod
+    def refresh_for_model(cls, model):
+        """Recompute the sections that depend on a synced model"""
+        keys = [key for key, section_model in cls.SECTIONS.items() if section_model is model]
+        if keys:
+            cls.refresh(keys)
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.CACHE_KEY)
+        if cls._use_table():
+            DashboardSnapshotRecord.objects.filter(key=cls.CACHE_KEY).delete()
+
+    @classmethod
+    def context(cls):
+        """
+        Build the dashboard template context from the snapshot
+
+        Returns:
+            dict: Context keys used by accounts/dashboard.html
+        """
+        sections = cls.get()['sections']
+        purchases = sections['purchases']
+        payments = sections['premium_payments']
+
+        db_stats = {key: section['count'] for key, section in sections.items()}
+
+        return {
+            'db_stats': db_stats,
+            'total_records': sum(db_stats.values()),
+            'total_revenue': cls._decimal(purchases['total_revenue']) + cls._decimal(payments['total_revenue']),
+            'total_paid': cls._decimal(purchases['total_paid']) + cls._decimal(payments['total_paid']),
+            'purchase_stats': {
+                'total_revenue': purchases['total_revenue'],
+                'total_paid': purchases['total_paid'],
+                'avg_purchase': purchases['avg_purchase'],
+            },
+            'premium_stats': {
+                'total_revenue': payments['total_revenue'],
+                'total_paid': payments['total_paid'],
+                'avg_payment': payments['avg_payment'],
+            },
+            'recent_purchases': purchases['recent'],
+            'recent_payments': payments['recent'],
+            'recent_notifications': sections['signal_notifications']['recent'],
+            'latest_purchases': purchases['latest'],
+            'latest_payments': payments['latest'],
+            'latest_signals': sections['premium_signals']['latest'],
+            'latest_users': sections['firebase_users']['latest'],
+            'active_subscriptions': sections['premium_signal_subscriptions']['active'],
+            'unread_notifications': sections['signal_notifications']['unread'],
+        }
+
+    @staticmethod
+    def _decimal(value):
+        # Snapshots loaded from the table carry decimals as JSON strings
+        return Decimal(str(value)) if value is not None else Decimal(0)
+
+    @classmethod
+    def _use_table(cls):
+        return getattr(settings, 'DASHBOARD_SNAPSHOT_TABLE', False)
+
+    @classmethod
+    def _save(cls, snapshot):
+        cache.set(cls.CACHE_KEY, snapshot, cls.CACHE_TIMEOUT)
+        if cls._use_table():
+            DashboardSnapshotRecord.objects.update_or_create(
+                key=cls.CACHE_KEY,
+                defaults={'data': snapshot, 'computed_at': snapshot['computed_at']},
+            )
+
+    @classmethod
+    def _load_record(cls):
+        """Load a still-fresh snapshot persisted by another process"""
+        if not cls._use_table():
+            return None
+
+        fresh_after = timezone.now() - timedelta(seconds=cls.CACHE_TIMEOUT)
+        record = DashboardSnapshotRecord.objects.filter(key=cls.CACHE_KEY, computed_at__gte=fresh_after).first()
+        return record.data if record else None
@@ -0,0 +1,248 @@
+"""
+Data Browser Service
+Pages through a collection for the Firebase data browser, reading the local
+mirror (the collection's model or the generic MirroredDocument table) when the
+collection is synced and a cursor-paged Firestore query otherwise, and formats
+the table cells. A "Load more" session stays on the source of its first page
+"""
+from .collection_stats import CollectionCounters
+from .document_mirror import DocumentMirror
+from .firebase_service import FirebaseService
+from .firebase_sync import FirebaseSyncService
+from .numeric_summary import NumericSummary
+from .schema_inference import SchemaInference
+
+
+class DataBrowser:
+    """Cursor-paged, column-projected pages of a collection"""
+
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
+    OVERVIEW_PAGE_SIZE = 10  # per collection in the "all collections" view
+
+    # Keys never shown as columns
+    HIDDEN_FIELDS = {'id', 'uid', 'userId', 'user_id'}
+
+    # Mirror columns that only make sense inside the database
+    MIRROR_EXCLUDED_FIELDS = {'id', 'user'}
+
+    # Cell kind -> CSS class used by firebase_data.html
+    CELL_CLASSES = {
+        'yes': 'badge badge-success',
+        'no': 'badge badge-info',
+        'empty': 'badge badge-warning',
+        'completed': 'badge-count',
+        'videos': 'badge badge-info',
+        'date': 'date-value',
+        'text': '',
+    }
+
+    @staticmethod
+    def display_name(key):
+        return key.replace('_', ' ').title()
+
+    @classmethod
+    def mirror_model(cls, collection_name):
+        """Model a collection is synced into (None for the generic mirror)"""
+        return FirebaseSyncService.COLLECTION_MODELS.get(collection_name.lower())
+
+    @classmethod
+    def is_synced(cls, collection_name):
+        """Whether the collection has documents in its local mirror"""
+        model = cls.mirror_model(collection_name)
+        if model is not None:
+            return CollectionCounters.count(model) > 0
+        return DocumentMirror.has_documents(collection_name)
+
+    @classmethod
+    def document_count(cls, collection_name):
+        """Number of locally mirrored documents of a collection"""
+        model = cls.mirror_model(collection_name)
+        if model is not None:
+            return CollectionCounters.count(model)
+        return CollectionCounters.count(DocumentMirror.counter_key(collection_name))
+
+    @classmethod
+    def source(cls, collection_name, requested=None):
+        """
+        Source to read a collection's pages from
+
+        Mapped collections are always read from their model (whose columns are
+        model fields, not document keys). Other collections are read from the
+        generic mirror once synced and from Firestore before; both are keyed by
+        document keys. A valid `requested` source (the one the first page of a
+        "Load more" session came from) is kept so the session doesn't switch.
+        """
+        if cls.mirror_model(collection_name) is not None:
+            return 'model'
+        if requested in ('mirror', 'firestore'):
+            return requested
+        return 'mirror' if DocumentMirror.has_documents(collection_name) else 'firestore'
+
+    @classmethod
+    def mirror_columns(cls, model):
+        return [
+            field.name for field in model._meta.concrete_fields
+            if field.name not in cls.MIRROR_EXCLUDED_FIELDS and field.name != 'firebase_id'
+        ]
+
+    @classmethod
+    def _mirror_page(cls, model, cursor, limit, columns):
+        available = cls.mirror_columns(model)
+        selected = [column for column in columns if column in available] if columns else available
+
+        queryset = model.objects.order_by('firebase_id')
+        if cursor:
+            queryset = queryset.filter(firebase_id__gt=cursor)
+        rows = list(queryset.values('firebase_id', *selected)[:limit + 1])
+
+        documents = []
+        for row in rows:
+            row['id'] = row.pop('firebase_id')
+            documents.append(row)
+        return documents, selected
+
+    @classmethod
+    def _generic_mirror_page(cls, collection_name, cursor, limit, columns):
+        """Documents of a page of the generic mirror (columns must be known fields)"""
+        queryset = DocumentMirror.queryset(collection_name).order_by('firebase_id')
+        if cursor:
+            queryset = queryset.filter(firebase_id__gt=cursor)
+
+        documents = []
+        if columns:
+            # Only the selected keys are extracted from the JSON payload
+            lookups = {f'data__{column}': column for column in columns}
+            for row in queryset.values('firebase_id', *lookups)[:limit + 1]:
+                doc = {lookups[key]: value for key, value in row.items() if key in lookups}
+                doc['id'] = row['firebase_id']
+                documents.append(doc)
+        else:
+            for firebase_id, data in queryset.values_list('firebase_id', 'data')[:limit + 1]:
+                documents.append(dict(data, id=firebase_id))
+        return documents
+
+    @classmethod
+    def _firestore_page(cls, collection_name, cursor, limit):
+        return FirebaseService.get_collection_page(collection_name, limit + 1, start_after=cursor)
+
+    @classmethod
+    def page(cls, collection_name, cursor=None, columns=None, limit=None, source=None):
+        """
+        One page of a collection, in document ID order
+
+        Args:
+            collection_name (str): Firestore collection name
+            cursor (str): ID of the last document of the previous page
+            columns (list): Columns to include (all columns of the page if None)
+            limit (int): Page size (PAGE_SIZE by default)
+            source (str): Source of the session's first page (see source())
+
+        Returns:
+            dict: 'columns' [(key, display name)], 'available' (every column that
+                  can be selected), 'rows' [{'id', 'cells'}], 'next_cursor' (None
+                  on the last page) and 'source' (to pass back with the cursor)
+        """
+        limit = min(limit or cls.PAGE_SIZE, cls.MAX_PAGE_SIZE)
+
+        source = cls.source(collection_name, source)
+        if source == 'model':
+            model = cls.mirror_model(collection_name)
+            documents, keys = cls._mirror_page(model, cursor, limit, columns)
+            available = cls.mirror_columns(model)
+        elif source == 'mirror':
+            # Requested columns become JSON lookups, so only the schema's fields are allowed
+            available = SchemaInference.columns(collection_name) or []
+            columns = [column for column in columns if column in available] if columns else None
+            documents = cls._generic_mirror_page(collection_name, cursor, limit, columns)
+            available = available or cls._document_keys(documents[:limit])
+            keys = columns or available
+        else:
+            documents = cls._firestore_page(collection_name, cursor, limit)
+            # The inferred schema gives every page the same columns
+            available = SchemaInference.columns(collection_name) or cls._document_keys(documents[:limit])
+            keys = columns or available
+
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+        keys = [key for key in keys if key not in cls.HIDDEN_FIELDS]
+
+        return {
+            'columns': [(key, cls.display_name(key)) for key in keys],
+            'column_keys': keys,
+            'available': [(key, cls.display_name(key)) for key in available if key not in cls.HIDDEN_FIELDS],
+            'rows': [
+                {'id': doc.get('id'), 'cells': [cls.cell(key, doc.get(key)) for key in keys]}
+                for doc in documents
+            ],
+            'next_cursor': str(documents[-1].get('id')) if has_more and documents else None,
+            'source': source,
+        }
+
+    @classmethod
+    def numeric_summary(cls, collection_name, use_cache=True):
+        """
+        Numeric summary of a synced collection, computed from its local mirror
+
+        Returns:
+            dict: See NumericSummary.summarize() (empty if the collection isn't synced)
+        """
+        model = cls.mirror_model(collection_name)
+        if model is not None:
+            return NumericSummary.for_model(collection_name, model, use_cache=use_cache)
+        if not DocumentMirror.has_documents(collection_name):
+            return {}
+
+        return NumericSummary.for_collection(
+            collection_name,
+            lambda: list(DocumentMirror.queryset(collection_name).values_list('data', flat=True)),
+            use_cache=use_cache,
+            fields=SchemaInference.numeric_fields(collection_name),
+        )
+
+    @staticmethod
+    def _document_keys(documents):
+        """Union of the documents' keys, in order of first appearance"""
+        keys = {}
+        for doc in documents:
+            for key in doc:
+                keys.setdefault(key, None)
+        return list(keys)
+
+    @classmethod
+    def cell(cls, key, value):
+        """
+        Format one value for the table
+
+        Returns:
+            dict: 'kind' (yes, no, empty, completed, videos, date, text), display
+                  'text' and the 'css' class of the cell
+        """
+        cell = cls._cell(key, value)
+        cell['css'] = cls.CELL_CLASSES[cell['kind']]
+        return cell
+
+    @staticmethod
+    def _cell(key, value):
+        lowered = key.lower()
+        if value is True:
+            return {'kind': 'yes', 'text': '✓ Yes'}
+        if value is False:
+            return {'kind': 'no', 'text': '✗ No'}
+        if value is None:
+            return {'kind': 'empty', 'text': '-'}
+        if 'completed' in lowered:
+            return {'kind': 'completed', 'text': f'{value} completed'}
+        if 'video' in lowered or 'duration' in lowered:
+            count = len(value) if hasattr(value, '__len__') else 0
+            return {'kind': 'videos', 'text': f'{count} videos'}
+        if 'date' in lowered or 'updated' in lowered or 'created' in lowered or 'timestamp' in lowered:
+            return {'kind': 'date', 'text': str(value)[:10]}
+        return {'kind': 'text', 'text': str(value)}
+
+    @staticmethod
+    def parse_columns(value):
+        """Columns from a comma-separated query parameter (None if not given)"""
+        if not value:
+            return None
+        return [column.strip() for column in value.split(',') if column.strip()]
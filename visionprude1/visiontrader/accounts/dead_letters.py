@@ -0,0 +1,164 @@
+"""
+Sync Dead Letters
+Documents that fail to map or write are kept in SyncDeadLetter with the error
+and a hash of their content. Later syncs skip them until the content changes,
+and `manage.py dead_letters` inspects, retries or discards them in bulk
+"""
+import contextvars
+import hashlib
+import json
+import logging
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .document_mirror import DocumentMirror
+from .models import SyncDeadLetter
+
+
+logger = logging.getLogger(__name__)
+
+_retrying = contextvars.ContextVar('dead_letter_retry', default=False)
+
+
+class DeadLetters:
+    """Record, skip and retry documents that failed to sync"""
+
+    @staticmethod
+    def content_hash(doc):
+        """SHA-256 of a document's content (its ID excluded), as the mirror computes it"""
+        return hashlib.sha256(DocumentMirror.canonical_json(doc).encode()).hexdigest()
+
+    @staticmethod
+    @contextmanager
+    def retrying():
+        """Write dead-lettered documents in the block even if their content is unchanged"""
+        token = _retrying.set(True)
+        try:
+            yield
+        finally:
+            _retrying.reset(token)
+
+    @staticmethod
+    def has_any(collection_name):
+        return SyncDeadLetter.objects.filter(collection=collection_name).exists()
+
+    @classmethod
+    def partition(cls, collection_name, documents, get_id):
+        """
+        Split a batch into the documents to write and the unchanged failures
+
+        Returns:
+            tuple: (documents to write, {document ID: content hash} of the
+                   dead letters among them, number of documents skipped)
+        """
+        ids = [str(get_id(doc)) for doc in documents if get_id(doc)]
+        letters = dict(
+            SyncDeadLetter.objects.filter(collection=collection_name, document_id__in=ids)
+            .values_list('document_id', 'content_hash')
+        )
+        if not letters or _retrying.get():
+            return documents, letters, 0
+
+        to_write = []
+        skipped = 0
+        for doc in documents:
+            document_id = str(get_id(doc)) if get_id(doc) else None
+            if document_id in letters and letters[document_id] == cls.content_hash(doc):
+                skipped += 1
+            else:
+                to_write.append(doc)
+        return to_write, letters, skipped
+
+    @classmethod
+    def record(cls, collection_name, document_id, doc, error):
+        """Add a failed document, or count another attempt of one already there"""
+        if not document_id:
+            return
+        try:
+            canonical = DocumentMirror.canonical_json(doc)
+            values = {
+                'error_class': type(error).__name__,
+                'error_message': str(error),
+                'content_hash': hashlib.sha256(canonical.encode()).hexdigest(),
+                'document': json.loads(canonical),
+            }
+            lookup = {'collection': collection_name, 'document_id': str(document_id)}
+            with transaction.atomic():
+                letters = SyncDeadLetter.objects.filter(**lookup)
+                if letters.update(attempts=F('attempts') + 1, last_failed_at=timezone.now(), **values):
+                    return
+                try:
+                    with transaction.atomic():
+                        SyncDeadLetter.objects.create(**lookup, **values)
+                except IntegrityError:
+                    # Another process recorded it in the meantime
+                    letters.update(attempts=F('attempts') + 1, last_failed_at=timezone.now(), **values)
+        except Exception as e:
+            logger.error(
+                "Error recording dead letter %s/%s: %s", collection_name, document_id, e,
+                extra={'collection': collection_name, 'document_id': document_id},
+            )
+
+    @staticmethod
+    def resolve(collection_name, document_ids):
+        """Forget the dead letters of documents that were written after all"""
+        SyncDeadLetter.objects.filter(collection=collection_name, document_id__in=list(document_ids)).delete()
+
+    @staticmethod
+    def matching(collection_name=None, error_class=None, document_ids=None):
+        letters = SyncDeadLetter.objects.all()
+        if collection_name:
+            letters = letters.filter(collection=collection_name)
+        if error_class:
+            letters = letters.filter(error_class=error_class)
+        if document_ids:
+            letters = letters.filter(document_id__in=document_ids)
+        return letters
+
+    @classmethod
+    def retry(cls, collection_name=None, error_class=None, document_ids=None, refetch=False):
+        """
+        Sync the matching dead-lettered documents again
+
+        Documents that now succeed leave the table; those that fail again count
+        another attempt.
+
+        Args:
+            refetch (bool): Read the current documents from Firestore (one read
+                each) instead of retrying the stored copies
+
+        Returns:
+            dict: Collection -> sync statistics, plus 'missing' (documents no
+                  longer found when refetching; their dead letters are kept)
+        """
+        from .firebase_service import FirebaseService
+        from .firebase_sync import FirebaseSyncService
+
+        if refetch and FirebaseService.get_backend() is None:
+            raise RuntimeError("Firestore is not available (or the read budget is used up)")
+
+        letters = cls.matching(collection_name, error_class, document_ids)
+        results = {}
+        for collection in sorted(set(letters.values_list('collection', flat=True))):
+            documents = []
+            missing = 0
+            for letter in letters.filter(collection=collection):
+                if refetch:
+                    doc = FirebaseService.get_document(collection, letter.document_id)
+                    if doc is None:
+                        missing += 1
+                        continue
+                else:
+                    doc = letter.document
+                documents.append(dict(doc, id=letter.document_id))
+
+            stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
+            if documents:
+                with cls.retrying():
+                    stats = FirebaseSyncService.sync_collection(collection, documents=documents)
+            stats['missing'] = missing
+            results[collection] = stats
+        return results
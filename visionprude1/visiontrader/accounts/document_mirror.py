@@ -0,0 +1,262 @@
+"""
+Generic Document Mirror
+Syncs collections without a dedicated model into the MirroredDocument table
+as JSON, skipping documents whose content hash has not changed, and copies
+configured fields into indexed columns for filtering
+"""
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MirroredDocument
+from .collection_stats import CollectionCounters
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class MirrorJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that falls back to str() for Firestore-specific values (GeoPoint, references)"""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+class DocumentMirror:
+    """Read and write the generic mirror of unmapped collections"""
+
+    # Documents written per transaction
+    WRITE_BATCH_SIZE = 500
+
+    # Generic indexed columns the configured fields are copied into
+    EXTRACTED_COLUMNS = ('field_1', 'field_2', 'field_3')
+
+    @classmethod
+    def extracted_fields(cls, collection_name):
+        """
+        Document fields copied into indexed columns for a collection
+
+        Configured in settings.MIRROR_EXTRACTED_FIELDS, e.g.
+        {'orders': ['status', 'userId']}; at most len(EXTRACTED_COLUMNS) fields.
+
+        Returns:
+            dict: Document field -> column name
+        """
+        configured = getattr(settings, 'MIRROR_EXTRACTED_FIELDS', {}).get(collection_name, [])
+        return dict(zip(configured, cls.EXTRACTED_COLUMNS))
+
+    @staticmethod
+    def canonical_json(doc):
+        payload = {key: value for key, value in doc.items() if key != 'id'}
+        return json.dumps(payload, cls=MirrorJSONEncoder, sort_keys=True, separators=(',', ':'))
+
+    @staticmethod
+    def _column_value(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, cls=MirrorJSONEncoder, sort_keys=True)
+        return str(value)[:255]
+
+    @classmethod
+    def _row_values(cls, collection_name, doc, remote_updated_at):
+        canonical = cls.canonical_json(doc)
+        data = json.loads(canonical)
+        values = {
+            'data': data,
+            'content_hash': hashlib.sha256(canonical.encode()).hexdigest(),
+            'remote_updated_at': remote_updated_at,
+        }
+        extracted = cls.extracted_fields(collection_name)
+        for column in cls.EXTRACTED_COLUMNS:
+            values[column] = ''
+        for field, column in extracted.items():
+            values[column] = cls._column_value(data.get(field))
+        return values
+
+    @staticmethod
+    def counter_key(collection_name):
+        """CollectionStats label of a mirrored collection"""
+        return f'{CollectionCounters.MIRROR_PREFIX}{collection_name}'
+
+    @classmethod
+    def write(cls, collection_name, documents, remote_update_time=None):
+        """
+        Upsert documents of a collection into the mirror
+
+        Unchanged documents (same content hash) are not written at all.
+
+        Args:
+            collection_name (str): Firestore collection name
+            documents (list): Document dictionaries with an 'id'
+            remote_update_time (callable): Extracts a document's remote update time
+
+        Returns:
+            dict: Statistics about the write ('unchanged' counts skipped documents,
+                  'changed' created and updated ones)
+        """
+        stats = {'created': 0, 'updated': 0, 'changed': 0, 'unchanged': 0, 'errors': 0, 'total': len(documents)}
+        counter_key = cls.counter_key(collection_name)
+        remote_update_time = remote_update_time or (lambda doc: None)
+
+        if not documents:
+            CollectionCounters.record_write(counter_key, 0)
+
+        for start in range(0, len(documents), cls.WRITE_BATCH_SIZE):
+            batch = documents[start:start + cls.WRITE_BATCH_SIZE]
+            watermark = None
+            rows = {}
+
+            for doc in batch:
+                firebase_id = doc.get('id')
+                if not firebase_id:
+                    stats['errors'] += 1
+                    continue
+                try:
+                    updated_at = remote_update_time(doc)
+                    rows[str(firebase_id)] = cls._row_values(collection_name, doc, updated_at)
+                except Exception as e:
+                    logger.error(
+                        "Error mirroring %s document %s: %s", collection_name, firebase_id, e,
+                        extra={'collection': collection_name, 'document_id': firebase_id},
+                    )
+                    stats['errors'] += 1
+                    continue
+                if updated_at and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+
+            batch_started = time.perf_counter()
+            with transaction.atomic():
+                existing = {
+                    obj.firebase_id: obj
+                    for obj in MirroredDocument.objects.select_for_update()
+                    .filter(collection=collection_name, firebase_id__in=list(rows))
+                    .only('id', 'firebase_id', 'content_hash')
+                }
+
+                to_create = []
+                to_update = []
+                for firebase_id, values in rows.items():
+                    obj = existing.get(firebase_id)
+                    if obj is None:
+                        to_create.append(MirroredDocument(collection=collection_name, firebase_id=firebase_id, **values))
+                    elif obj.content_hash != values['content_hash']:
+                        for field, value in values.items():
+                            setattr(obj, field, value)
+                        to_update.append(obj)
+                    else:
+                        stats['unchanged'] += 1
+
+                MirroredDocument.objects.bulk_create(to_create)
+                if to_update:
+                    # synced_at is auto_now, but bulk_update doesn't apply it
+                    now = timezone.now()
+                    for obj in to_update:
+                        obj.synced_at = now
+                    MirroredDocument.objects.bulk_update(
+                        to_update,
+                        ['data', 'content_hash', 'remote_updated_at', *cls.EXTRACTED_COLUMNS, 'synced_at'],
+                    )
+
+                stats['created'] += len(to_create)
+                stats['updated'] += len(to_update)
+                stats['changed'] += len(to_create) + len(to_update)
+                CollectionCounters.record_write(counter_key, len(to_create), watermark, updated=len(to_update))
+            metrics.SYNC_BATCH_SECONDS.observe(time.perf_counter() - batch_started, target=counter_key)
+
+        return stats
+
+    @classmethod
+    def remove(cls, collection_name, firebase_ids):
+        """
+        Delete mirrored documents that were removed from the collection
+
+        Returns:
+            int: Number of documents deleted
+        """
+        with transaction.atomic():
+            deleted, _ = MirroredDocument.objects.filter(
+                collection=collection_name, firebase_id__in=[str(firebase_id) for firebase_id in firebase_ids]
+            ).delete()
+            CollectionCounters.record_write(cls.counter_key(collection_name), 0, deleted=deleted)
+        return deleted
+
+    @classmethod
+    def prune(cls, collection_name, seen_ids):
+        """
+        Delete the mirrored documents a full read of the collection didn't return
+
+        Args:
+            seen_ids (iterable): IDs of every document in the collection
+
+        Returns:
+            int: Number of documents deleted
+        """
+        seen = {str(firebase_id) for firebase_id in seen_ids}
+        mirrored = MirroredDocument.objects.filter(collection=collection_name).values_list('firebase_id', flat=True)
+        removed = [firebase_id for firebase_id in mirrored.iterator() if firebase_id not in seen]
+
+        deleted = 0
+        for start in range(0, len(removed), cls.WRITE_BATCH_SIZE):
+            deleted += cls.remove(collection_name, removed[start:start + cls.WRITE_BATCH_SIZE])
+        return deleted
+
+    @classmethod
+    def has_documents(cls, collection_name):
+        return CollectionCounters.count(cls.counter_key(collection_name)) > 0
+
+    @classmethod
+    def queryset(cls, collection_name, **filters):
+        """
+        Mirrored documents of a collection, filtered by document fields
+
+        Filters on configured (extracted) fields use their indexed column;
+        any other field is filtered through the JSON payload.
+        """
+        extracted = cls.extracted_fields(collection_name)
+        lookups = {}
+        for field, value in filters.items():
+            if field in extracted:
+                lookups[extracted[field]] = cls._column_value(value)
+            else:
+                lookups[f'data__{field}'] = value
+        return MirroredDocument.objects.filter(collection=collection_name, **lookups)
+
+    @classmethod
+    def reextract(cls, collection_name):
+        """
+        Refill the extracted columns after MIRROR_EXTRACTED_FIELDS changed
+
+        Returns:
+            int: Number of documents updated
+        """
+        extracted = cls.extracted_fields(collection_name)
+        updated = 0
+        batch = []
+        queryset = MirroredDocument.objects.filter(collection=collection_name).only('id', 'data', *cls.EXTRACTED_COLUMNS)
+        for obj in queryset.iterator(chunk_size=cls.WRITE_BATCH_SIZE):
+            for column in cls.EXTRACTED_COLUMNS:
+                setattr(obj, column, '')
+            for field, column in extracted.items():
+                setattr(obj, column, cls._column_value(obj.data.get(field)))
+            batch.append(obj)
+            if len(batch) >= cls.WRITE_BATCH_SIZE:
+                MirroredDocument.objects.bulk_update(batch, list(cls.EXTRACTED_COLUMNS))
+                updated += len(batch)
+                batch = []
+        if batch:
+            MirroredDocument.objects.bulk_update(batch, list(cls.EXTRACTED_COLUMNS))
+            updated += len(batch)
+        return updated
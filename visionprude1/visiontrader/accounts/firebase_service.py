@@ -2,21 +2,31 @@
 Firebase Service Module
 Handles all Firebase Firestore interactions with caching and rate limiting
 """
+import logging
 import os
 import time
 import firebase_admin
 from firebase_admin import credentials, firestore
 from django.conf import settings
 from django.core.cache import cache
+from django.utils.module_loading import import_string
 from google.api_core.exceptions import ResourceExhausted, DeadlineExceeded
 from functools import wraps
 
+from . import metrics
+from .firestore_backends import DocumentChange, TrackedBackend, record_wait  # noqa: F401 (listeners import DocumentChange from here)
+from .read_quota import ReadQuota
+
+
+logger = logging.getLogger(__name__)
+
 
 class FirebaseService:
     """Service class for Firebase operations with caching and rate limiting"""
 
     _initialized = False
     _db = None
+    _backend = None
 
     # Cache timeouts (in seconds)
     CACHE_TIMEOUT_COLLECTIONS = 300  # 5 minutes for collection list
@@ -37,18 +47,18 @@ class FirebaseService:
             cred_path = os.path.join(settings.BASE_DIR, 'firebase-credentials.json')
 
             if not os.path.exists(cred_path):
-                print(f"Warning: Firebase credentials not found at {cred_path}")
+                logger.warning("Firebase credentials not found at %s", cred_path)
                 return None
 
             cred = credentials.Certificate(cred_path)
             firebase_admin.initialize_app(cred)
             cls._db = firestore.client()
             cls._initialized = True
-            print("Firebase initialized successfully")
+            logger.info("Firebase initialized successfully")
             return cls._db
 
         except Exception as e:
-            print(f"Error initializing Firebase: {e}")
+            logger.error("Error initializing Firebase: %s", e)
             return None
 
     @classmethod
@@ -58,6 +68,41 @@ class FirebaseService:
             return cls.initialize()
         return cls._db
 
+    @classmethod
+    def get_backend(cls):
+        """
+        Backend documents are read from, configured by settings.FIRESTORE_BACKEND
+
+        Returns:
+            The backend, or None if it is unavailable (e.g. no credentials) or a
+            read budget is used up (callers then serve what is cached)
+        """
+        if cls._backend is None:
+            config = dict(getattr(settings, 'FIRESTORE_BACKEND', None) or {})
+            engine = import_string(config.pop('ENGINE', 'accounts.firestore_backends.FirestoreBackend'))
+            backend = engine(**{key.lower(): value for key, value in config.items()})
+
+            capture = getattr(settings, 'FIRESTORE_CAPTURE', None)
+            if capture:
+                from .firestore_capture import RecordingBackend
+                backend = RecordingBackend(
+                    backend, capture['DIR'],
+                    payloads=capture.get('PAYLOADS', 'anonymized'),
+                    compress=capture.get('COMPRESS', True),
+                    anonymize_key=capture.get('ANONYMIZE_KEY'),
+                )
+            cls._backend = TrackedBackend(backend)
+        available = cls._backend.is_available()
+        metrics.FIRESTORE_AVAILABLE.set(1 if available else 0)
+        if not available or ReadQuota.exhausted():
+            return None
+        return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend):
+        """Read from another backend, e.g. an InMemoryBackend (None restores the configured one)"""
+        cls._backend = TrackedBackend(backend) if backend is not None else None
+
     @classmethod
     def _rate_limit(cls):
         """Enforce rate limiting between requests"""
@@ -67,6 +112,7 @@ class FirebaseService:
         if time_since_last_request < cls._min_request_interval:
             sleep_time = cls._min_request_interval - time_since_last_request
             time.sleep(sleep_time)
+            record_wait(sleep_time)
 
         cls._last_request_time = time.time()
 
@@ -84,21 +130,30 @@ class FirebaseService:
             Result of the function or None on failure
         """
         delay = initial_delay
+        # The in-memory backend has no quota to protect
+        rate_limited = getattr(cls._backend, 'rate_limited', True)
 
         for attempt in range(max_retries):
             try:
-                cls._rate_limit()  # Apply rate limiting before each attempt
+                if rate_limited:
+                    cls._rate_limit()  # Apply rate limiting before each attempt
                 return func()
             except (ResourceExhausted, DeadlineExceeded) as e:
+                metrics.FIRESTORE_QUOTA_ERRORS.inc(error=type(e).__name__)
                 if attempt < max_retries - 1:
-                    print(f"Quota error, retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries})")
+                    metrics.FIRESTORE_RETRIES.inc()
+                    logger.warning(
+                        "Quota error, retrying in %s seconds (attempt %d/%d)", delay, attempt + 1, max_retries,
+                        extra={'error': type(e).__name__},
+                    )
                     time.sleep(delay)
+                    record_wait(delay)
                     delay *= 2  # Exponential backoff
                 else:
-                    print(f"Max retries reached. Error: {e}")
+                    logger.error("Max retries reached. Error: %s", e, extra={'error': type(e).__name__})
                     return None
             except Exception as e:
-                print(f"Unexpected error: {e}")
+                logger.exception("Unexpected error: %s", e)
                 return None
 
         return None
@@ -111,7 +166,9 @@ class FirebaseService:
         Args:
             collection_name (str): Name of the Firestore collection
             use_cache (bool): Whether to use cached data
-            limit (int): Optional limit on number of documents to fetch
+            limit (int): Optional limit on number of documents to fetch (a
+                limited read is served from the cached payload but never cached
+                as the collection's payload)
 
         Returns:
             list: List of document dictionaries with 'id' and data
@@ -121,45 +178,67 @@ class FirebaseService:
         if use_cache:
             cached_data = cache.get(cache_key)
             if cached_data is not None:
-                print(f"Returning cached data for collection: {collection_name}")
-                return cached_data
+                logger.debug("Returning cached data for collection: %s", collection_name)
+                return cached_data[:limit] if limit else cached_data
 
-        db = cls.get_db()
-        if not db:
+        backend = cls.get_backend()
+        if not backend:
             return []
 
         def fetch_collection():
             """Internal function to fetch collection data"""
-            query = db.collection(collection_name)
-
-            if limit:
-                query = query.limit(limit)
-
-            docs = query.stream(timeout=30.0)  # Set a 30-second timeout
-            results = []
-
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                results.append(data)
-
-            return results
+            return backend.query(collection_name, limit=limit)
 
         try:
             # Fetch with retry logic
             results = cls._retry_with_backoff(fetch_collection)
 
             if results is not None:
-                # Cache the results
-                cache.set(cache_key, results, cls.CACHE_TIMEOUT_DATA)
-                print(f"Successfully fetched and cached {len(results)} documents from {collection_name}")
+                if not limit:
+                    # Cache the results (the numeric summary of the old payload is now stale)
+                    cache.set(cache_key, results, cls.CACHE_TIMEOUT_DATA)
+                    cache.delete(f'{cache_key}_summary')
+                logger.info(
+                    "Fetched and cached %d documents from %s", len(results), collection_name,
+                    extra={'collection': collection_name, 'documents': len(results)},
+                )
                 return results
             else:
-                print(f"Failed to fetch collection {collection_name} after retries")
+                logger.error(
+                    "Failed to fetch collection %s after retries", collection_name, extra={'collection': collection_name}
+                )
                 return []
 
         except Exception as e:
-            print(f"Error fetching collection {collection_name}: {e}")
+            logger.error("Error fetching collection %s: %s", collection_name, e, extra={'collection': collection_name})
+            return []
+
+    @classmethod
+    def get_collection_page(cls, collection_name, limit, start_after=None):
+        """
+        Get one page of a collection in document ID order (not cached)
+
+        Args:
+            collection_name (str): Name of the Firestore collection
+            limit (int): Maximum number of documents to fetch
+            start_after (str): Return documents after this document ID
+
+        Returns:
+            list: List of document dictionaries with 'id' and data
+        """
+        backend = cls.get_backend()
+        if not backend:
+            return []
+
+        def fetch_page():
+            return backend.query(collection_name, start_after=start_after, limit=limit)
+
+        try:
+            return cls._retry_with_backoff(fetch_page) or []
+        except Exception as e:
+            logger.error(
+                "Error fetching page of collection %s: %s", collection_name, e, extra={'collection': collection_name}
+            )
             return []
 
     @classmethod
@@ -174,22 +253,18 @@ class FirebaseService:
         Returns:
             dict: Document data or None if not found
         """
-        db = cls.get_db()
-        if not db:
+        backend = cls.get_backend()
+        if not backend:
             return None
 
         try:
-            doc_ref = db.collection(collection_name).document(document_id)
-            doc = doc_ref.get()
-
-            if doc.exists:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                return data
-            return None
+            return backend.get(collection_name, document_id)
 
         except Exception as e:
-            print(f"Error fetching document {document_id}: {e}")
+            logger.error(
+                "Error fetching document %s: %s", document_id, e,
+                extra={'collection': collection_name, 'document_id': document_id},
+            )
             return None
 
     @classmethod
@@ -206,25 +281,67 @@ class FirebaseService:
         Returns:
             list: List of matching documents
         """
-        db = cls.get_db()
-        if not db:
+        backend = cls.get_backend()
+        if not backend:
             return []
 
         try:
-            query = db.collection(collection_name).where(field, operator, value)
-            docs = query.stream()
+            return backend.query(collection_name, filters=[(field, operator, value)])
+
+        except Exception as e:
+            logger.error("Error querying collection %s: %s", collection_name, e, extra={'collection': collection_name})
+            return []
+
+    @classmethod
+    def listen(cls, collection_name, on_changes, resume_field=None, resume_after=None):
+        """
+        Subscribe to the changes of a collection with a snapshot listener
+
+        The first call delivers the initial snapshot, every matching document as
+        added (an empty list if there are none); after that only changed
+        documents are read.
+
+        Args:
+            collection_name (str): Name of the Firestore collection
+            on_changes (callable): Called with a list of DocumentChange, on the
+                listener's own thread
+            resume_field (str): Update-time field to resume from; only documents
+                with this field are listened to
+            resume_after: Only listen to documents whose resume_field is at least this
+
+        Returns:
+            Watch: Call unsubscribe() to stop listening (None if Firebase is unavailable)
+        """
+        backend = cls.get_backend()
+        if not backend:
+            return None
+
+        filters = []
+        if resume_field and resume_after is not None:
+            filters.append((resume_field, '>=', resume_after))
+        return backend.listen(collection_name, on_changes, filters)
 
-            results = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                results.append(data)
+    @classmethod
+    def count_collection(cls, collection_name, filters=()):
+        """
+        Count the documents of a collection without reading them
 
-            return results
+        Args:
+            collection_name (str): Name of the Firestore collection
+            filters (list): (field, operator, value) filters
 
+        Returns:
+            int: Number of documents, or None on failure
+        """
+        backend = cls.get_backend()
+        if not backend:
+            return None
+
+        try:
+            return cls._retry_with_backoff(lambda: backend.count(collection_name, filters))
         except Exception as e:
-            print(f"Error querying collection: {e}")
-            return []
+            logger.error("Error counting collection %s: %s", collection_name, e, extra={'collection': collection_name})
+            return None
 
     @classmethod
     def get_all_collections(cls, use_cache=True):
@@ -242,17 +359,16 @@ class FirebaseService:
         if use_cache:
             cached_collections = cache.get(cache_key)
             if cached_collections is not None:
-                print(f"Returning cached collection list ({len(cached_collections)} collections)")
+                logger.debug("Returning cached collection list (%d collections)", len(cached_collections))
                 return cached_collections
 
-        db = cls.get_db()
-        if not db:
+        backend = cls.get_backend()
+        if not backend:
             return []
 
         def fetch_collections():
             """Internal function to fetch collections"""
-            collections = db.collections(timeout=30.0)  # Set a 30-second timeout
-            return [collection.id for collection in collections]
+            return backend.collections()
 
         try:
             # Fetch with retry logic
@@ -261,14 +377,14 @@ class FirebaseService:
             if results is not None:
                 # Cache the results
                 cache.set(cache_key, results, cls.CACHE_TIMEOUT_COLLECTIONS)
-                print(f"Successfully fetched and cached {len(results)} collections")
+                logger.info("Fetched and cached %d collections", len(results))
                 return results
             else:
-                print("Failed to fetch collections after retries")
+                logger.error("Failed to fetch collections after retries")
                 return []
 
         except Exception as e:
-            print(f"Error fetching collections: {e}")
+            logger.error("Error fetching collections: %s", e)
             return []
 
     @classmethod
@@ -281,9 +397,9 @@ class FirebaseService:
         """
         if collection_name:
             cache_key = f'firebase_collection_{collection_name}'
-            cache.delete(cache_key)
-            print(f"Cleared cache for collection: {collection_name}")
+            cache.delete_many([cache_key, f'{cache_key}_summary'])
+            logger.info("Cleared cache for collection: %s", collection_name)
         else:
             # Clear all Firebase-related caches
             cache.delete('firebase_all_collections')
-            print("Cleared all Firebase caches")
+            logger.info("Cleared all Firebase caches")
@@ -2,20 +2,61 @@
 Firebase to MySQL Sync Service
 Handles syncing data from Firebase Firestore to local MySQL database
 """
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from django.utils import timezone
-from django.db import transaction
+from django.db import models, transaction
 from .models import (
     Purchase, PremiumSignalPayment, SignalNotification, UserProgress,
     PremiumSignal, PremiumSignalSubscription, Course, FCMToken,
     AppNotification, Testimonial, FirebaseUser
 )
 from .firebase_service import FirebaseService
+from .dashboard_snapshot import DashboardSnapshot
+from .rollups import RevenueRollups
+from .collection_stats import CollectionCounters
+from .schema_inference import SchemaInference
+from .document_mirror import DocumentMirror
+from .columnar import ColumnarSnapshot
+from .sync_events import SyncEvents
+from .dead_letters import DeadLetters
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_complete = contextvars.ContextVar('sync_complete_documents', default=False)
 
 
 class FirebaseSyncService:
     """Service to sync Firebase data to MySQL database"""
 
+    # Documents written per transaction by write_documents
+    WRITE_BATCH_SIZE = 500
+
+    # Firebase collection name -> local model
+    COLLECTION_MODELS = {
+        'purchases': Purchase,
+        'purchases_collection': Purchase,
+        'premium_signals_payments': PremiumSignalPayment,
+        'premium_signals_payments_collection': PremiumSignalPayment,
+        'signal_notifications': SignalNotification,
+        'signal_notifications_collection': SignalNotification,
+        'user_progress': UserProgress,
+        'user_progress_collection': UserProgress,
+        'premium_signals': PremiumSignal,
+        'premium_signals_subscriptions': PremiumSignalSubscription,
+        'courses': Course,
+        'fcm_tokens': FCMToken,
+        'app_notifications': AppNotification,
+        'testimonials': Testimonial,
+        'users': FirebaseUser,
+    }
+
     @staticmethod
     def parse_date(date_value):
         """Parse various date formats to datetime object"""
@@ -45,536 +86,480 @@ class FirebaseSyncService:
         except (ValueError, TypeError):
             return None
 
+    @staticmethod
+    def round_decimals(model, values):
+        """
+        Round the DecimalField values in `values` to their field's decimal places
+
+        Backends disagree on how they round a float into a DecimalField (SQLite
+        keeps it as is), so synced amounts are rounded half-up before saving;
+        the revenue rollups then add up exactly what rebuild() reads back.
+        """
+        for name, value in values.items():
+            if value is None:
+                continue
+            field = model._meta.get_field(name)
+            if isinstance(field, models.DecimalField):
+                values[name] = field.to_python(str(value)).quantize(
+                    Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP
+                )
+        return values
+
+    @classmethod
+    def remote_update_time(cls, doc):
+        """Remote last-modified time of a document, if it carries one"""
+        return cls.parse_date(doc.get('updated_at') or doc.get('updatedAt'))
+
     @classmethod
-    def sync_purchases(cls, collection_name='purchases'):
+    def _sync_model(cls, collection_name, model, build_defaults, label, description, limit=None, get_id=None,
+                    documents=None):
         """
-        Sync purchases from Firebase to MySQL
+        Fetch a Firebase collection and write it into a local model
+
+        Args:
+            collection_name (str): Name of the Firebase collection
+            model: Django model the documents are mirrored into
+            build_defaults (callable): Maps a document to the model's field values
+            label (str): Singular name used in per-document error messages
+            description (str): Plural name used in fetch error messages
+            limit (int): Optional limit on number of documents to fetch
+            get_id (callable): Extracts the document ID (defaults to doc['id'])
+            documents (list): Changed documents to write instead of fetching the
+                collection (e.g. from a change listener)
 
         Returns:
             dict: Statistics about the sync operation
         """
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
+        if documents is None:
+            try:
+                firebase_data = FirebaseService.get_collection(collection_name, use_cache=False, limit=limit)
+            except Exception as e:
+                logger.error(
+                    "Error fetching %s from Firebase: %s", description, e, extra={'collection': collection_name}
+                )
+                return {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
+        else:
+            firebase_data = documents
 
-        try:
-            # Fetch data from Firebase
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        # Get or create purchase
-                        purchase, created = Purchase.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'amount': cls.parse_decimal(doc.get('amount')),
-                                'paid': cls.parse_decimal(doc.get('paid')),
-                                'total_amount': cls.parse_decimal(doc.get('total_amount') or doc.get('totalAmount')),
-                                'purchase_date': cls.parse_date(doc.get('purchase_date') or doc.get('date') or doc.get('created_at')),
-                                'status': doc.get('status', ''),
-                                'product_name': doc.get('product_name') or doc.get('productName', ''),
-                                'description': doc.get('description', ''),
-                            }
-                        )
+        complete = cls._is_complete(firebase_data, documents, limit)
 
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
+        # The documents are in memory anyway; refreshing the schema from them is one pass
+        cls._observe_schema(collection_name, firebase_data, limit, partial=not complete and documents is not None)
 
-                except Exception as e:
-                    print(f"Error syncing purchase {doc.get('id')}: {e}")
-                    stats['errors'] += 1
+        stats = cls.write_documents(
+            model, firebase_data, build_defaults, label, get_id=get_id, collection_name=collection_name
+        )
+        if complete:
+            get_id = get_id or (lambda doc: doc.get('id'))
+            stats['deleted'] = cls.prune(collection_name, [get_id(doc) for doc in firebase_data])
+        return stats
 
-        except Exception as e:
-            print(f"Error fetching purchases from Firebase: {e}")
+    @staticmethod
+    @contextmanager
+    def complete_documents():
+        """
+        Treat the documents passed to sync_collection() in the block as the whole
+        collection (e.g. a listener's initial snapshot): they replace the schema
+        statistics, and local copies of documents not among them are deleted
+        """
+        token = _complete.set(True)
+        try:
+            yield
+        finally:
+            _complete.reset(token)
 
-        return stats
+    @staticmethod
+    def _is_complete(firebase_data, documents, limit):
+        """Whether the synced documents are the whole collection"""
+        if documents is not None:
+            return _complete.get()
+        # An empty read is not trusted: get_collection() also returns [] when it fails
+        return not limit and bool(firebase_data)
+
+    @staticmethod
+    def _observe_schema(collection_name, documents, limit=None, partial=False):
+        """Refresh a collection's schema from the documents being synced"""
+        try:
+            if partial:
+                # A batch of changes is added to the statistics, not a full read
+                SchemaInference.observe(collection_name, documents, replace=False)
+            else:
+                SchemaInference.observe(
+                    collection_name, documents,
+                    sampled=bool(limit) and len(documents) >= limit,
+                )
+        except Exception as e:
+            logger.error("Error updating schema of %s: %s", collection_name, e, extra={'collection': collection_name})
 
     @classmethod
-    def sync_premium_payments(cls, collection_name='premium_signals_payments'):
+    def write_documents(cls, model, documents, build_defaults, label, get_id=None, collection_name=None):
         """
-        Sync premium signal payments from Firebase to MySQL
+        Upsert documents into a local model in batched transactions
 
-        Returns:
-            dict: Statistics about the sync operation
-        """
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
+        Each batch commits once; every document gets its own savepoint so a bad
+        document only rolls back itself. Derived tables (revenue rollups, row
+        counts) are updated inside the same transaction as the rows they summarize.
+        Documents that fail are recorded as dead letters of `collection_name`
+        and skipped by later writes until their content changes.
 
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        payment, created = PremiumSignalPayment.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'amount': cls.parse_decimal(doc.get('amount')),
-                                'paid': cls.parse_decimal(doc.get('paid')),
-                                'total_amount': cls.parse_decimal(doc.get('total_amount') or doc.get('totalAmount')),
-                                'price': cls.parse_decimal(doc.get('price')),
-                                'payment_date': cls.parse_date(doc.get('payment_date') or doc.get('date') or doc.get('created_at')),
-                                'payment_method': doc.get('payment_method') or doc.get('paymentMethod', ''),
-                                'status': doc.get('status', ''),
-                                'signal_type': doc.get('signal_type') or doc.get('signalType', ''),
-                                'subscription_period': doc.get('subscription_period') or doc.get('subscriptionPeriod', ''),
-                            }
-                        )
+        Args:
+            model: Django model the documents are mirrored into
+            documents (list): Document dictionaries with an 'id'
+            build_defaults (callable): Maps a document to the model's field values
+            label (str): Singular name used in per-document error messages
+            get_id (callable): Extracts the document ID (defaults to doc['id'])
+            collection_name (str): Firebase collection the documents come from
+                (failures are not dead-lettered without it)
 
+        Returns:
+            dict: Statistics about the write ('changed' counts created documents and
+                  those updated remotely since the previous sync, as far as their
+                  update time tells; 'skipped' unchanged dead letters)
+        """
+        stats = {'created': 0, 'updated': 0, 'changed': 0, 'errors': 0, 'skipped': 0, 'total': len(documents)}
+        get_id = get_id or (lambda doc: doc.get('id'))
+
+        if not documents:
+            CollectionCounters.record_write(model, 0)
+            return stats
+
+        # Every existing row is rewritten, so 'updated' says nothing about change
+        previous_watermark = CollectionCounters.get(model).last_remote_watermark
+        dead_letters = bool(collection_name) and DeadLetters.has_any(collection_name)
+
+        for start in range(0, len(documents), cls.WRITE_BATCH_SIZE):
+            batch = documents[start:start + cls.WRITE_BATCH_SIZE]
+            letters = {}
+            if dead_letters:
+                batch, letters, skipped = DeadLetters.partition(collection_name, batch, get_id)
+                stats['skipped'] += skipped
+            resolved = []
+            created_before = stats['created']
+            updated_before = stats['updated']
+            watermark = None
+
+            batch_started = time.perf_counter()
+            with transaction.atomic():
+                rollup = RevenueRollups.delta_for(model, [get_id(doc) for doc in batch])
+
+                for doc in batch:
+                    try:
+                        with transaction.atomic():
+                            firebase_id = get_id(doc)
+                            if not firebase_id:
+                                stats['errors'] += 1
+                                continue
+
+                            defaults = cls.round_decimals(model, build_defaults(doc))
+                            obj, created = model.objects.update_or_create(
+                                firebase_id=firebase_id,
+                                defaults=defaults
+                            )
+
+                        if rollup:
+                            rollup.replace(firebase_id, defaults)
+                        if str(firebase_id) in letters:
+                            resolved.append(str(firebase_id))
+
+                        updated_at = cls.remote_update_time(doc)
                         if created:
                             stats['created'] += 1
+                            stats['changed'] += 1
                         else:
                             stats['updated'] += 1
+                            if updated_at and (previous_watermark is None or updated_at > previous_watermark):
+                                stats['changed'] += 1
 
-                except Exception as e:
-                    print(f"Error syncing payment {doc.get('id')}: {e}")
-                    stats['errors'] += 1
+                        if updated_at and (watermark is None or updated_at > watermark):
+                            watermark = updated_at
 
-        except Exception as e:
-            print(f"Error fetching premium payments from Firebase: {e}")
+                    except Exception as e:
+                        logger.error(
+                            "Error syncing %s %s: %s", label, doc.get('id'), e,
+                            extra={'model': label, 'document_id': doc.get('id')},
+                        )
+                        stats['errors'] += 1
+                        if collection_name:
+                            DeadLetters.record(collection_name, get_id(doc), doc, e)
+
+                if resolved:
+                    DeadLetters.resolve(collection_name, resolved)
+                if rollup:
+                    rollup.apply()
+                CollectionCounters.record_write(
+                    model, stats['created'] - created_before, watermark,
+                    updated=stats['updated'] - updated_before,
+                )
+            metrics.SYNC_BATCH_SECONDS.observe(time.perf_counter() - batch_started, target=model._meta.label_lower)
 
         return stats
 
     @classmethod
-    def sync_signal_notifications(cls, collection_name='signal_notifications'):
+    def sync_purchases(cls, collection_name='purchases', documents=None):
         """
-        Sync signal notifications from Firebase to MySQL
+        Sync purchases from Firebase to MySQL
 
         Returns:
             dict: Statistics about the sync operation
         """
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False, limit=500)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        notification, created = SignalNotification.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'title': doc.get('title', ''),
-                                'message': doc.get('message', ''),
-                                'notification_type': doc.get('type') or doc.get('notification_type', ''),
-                                'signal_data': doc.get('signal_data') or doc.get('signalData'),
-                                'read': doc.get('read', False),
-                                'priority': doc.get('priority', ''),
-                                'notification_date': cls.parse_date(doc.get('notification_date') or doc.get('date') or doc.get('created_at')),
-                                'read_at': cls.parse_date(doc.get('read_at') or doc.get('readAt')),
-                            }
-                        )
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'amount': cls.parse_decimal(doc.get('amount')),
+                'paid': cls.parse_decimal(doc.get('paid')),
+                'total_amount': cls.parse_decimal(doc.get('total_amount') or doc.get('totalAmount')),
+                'purchase_date': cls.parse_date(doc.get('purchase_date') or doc.get('date') or doc.get('created_at')),
+                'status': doc.get('status', ''),
+                'product_name': doc.get('product_name') or doc.get('productName', ''),
+                'description': doc.get('description', ''),
+            }
 
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
+        return cls._sync_model(
+            collection_name, Purchase, build_defaults, 'purchase', 'purchases',
+            documents=documents
+        )
 
-                except Exception as e:
-                    print(f"Error syncing notification {doc.get('id')}: {e}")
-                    stats['errors'] += 1
+    @classmethod
+    def sync_premium_payments(cls, collection_name='premium_signals_payments', documents=None):
+        """
+        Sync premium signal payments from Firebase to MySQL
 
-        except Exception as e:
-            print(f"Error fetching notifications from Firebase: {e}")
+        Returns:
+            dict: Statistics about the sync operation
+        """
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'amount': cls.parse_decimal(doc.get('amount')),
+                'paid': cls.parse_decimal(doc.get('paid')),
+                'total_amount': cls.parse_decimal(doc.get('total_amount') or doc.get('totalAmount')),
+                'price': cls.parse_decimal(doc.get('price')),
+                'payment_date': cls.parse_date(doc.get('payment_date') or doc.get('date') or doc.get('created_at')),
+                'payment_method': doc.get('payment_method') or doc.get('paymentMethod', ''),
+                'status': doc.get('status', ''),
+                'signal_type': doc.get('signal_type') or doc.get('signalType', ''),
+                'subscription_period': doc.get('subscription_period') or doc.get('subscriptionPeriod', ''),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, PremiumSignalPayment, build_defaults, 'payment', 'premium payments',
+            documents=documents
+        )
 
     @classmethod
-    def sync_user_progress(cls, collection_name='user_progress'):
+    def sync_signal_notifications(cls, collection_name='signal_notifications', documents=None):
         """
-        Sync user progress from Firebase to MySQL
+        Sync signal notifications from Firebase to MySQL
 
         Returns:
             dict: Statistics about the sync operation
         """
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'title': doc.get('title', ''),
+                'message': doc.get('message', ''),
+                'notification_type': doc.get('type') or doc.get('notification_type', ''),
+                'signal_data': doc.get('signal_data') or doc.get('signalData'),
+                'read': doc.get('read', False),
+                'priority': doc.get('priority', ''),
+                'notification_date': cls.parse_date(doc.get('notification_date') or doc.get('date') or doc.get('created_at')),
+                'read_at': cls.parse_date(doc.get('read_at') or doc.get('readAt')),
+            }
 
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        completed_videos = doc.get('completed_videos') or doc.get('completedVideos')
-                        total_completed = len(completed_videos) if isinstance(completed_videos, list) else doc.get('total_completed', 0)
-
-                        progress, created = UserProgress.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'completed_videos': completed_videos,
-                                'video_durations': doc.get('video_durations') or doc.get('videoDurations'),
-                                'total_completed': total_completed,
-                                'progress_percentage': cls.parse_decimal(doc.get('progress_percentage') or doc.get('progressPercentage')),
-                                'last_activity': cls.parse_date(doc.get('last_activity') or doc.get('lastActivity') or doc.get('updated_at')),
-                            }
-                        )
+        return cls._sync_model(
+            collection_name, SignalNotification, build_defaults, 'notification', 'notifications',
+            limit=500,
+            documents=documents
+        )
 
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
+    @classmethod
+    def sync_user_progress(cls, collection_name='user_progress', documents=None):
+        """
+        Sync user progress from Firebase to MySQL
 
-                except Exception as e:
-                    print(f"Error syncing progress {doc.get('id')}: {e}")
-                    stats['errors'] += 1
+        Returns:
+            dict: Statistics about the sync operation
+        """
+        def build_defaults(doc):
+            completed_videos = doc.get('completed_videos') or doc.get('completedVideos')
+            total_completed = len(completed_videos) if isinstance(completed_videos, list) else doc.get('total_completed', 0)
 
-        except Exception as e:
-            print(f"Error fetching user progress from Firebase: {e}")
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'completed_videos': completed_videos,
+                'video_durations': doc.get('video_durations') or doc.get('videoDurations'),
+                'total_completed': total_completed,
+                'progress_percentage': cls.parse_decimal(doc.get('progress_percentage') or doc.get('progressPercentage')),
+                'last_activity': cls.parse_date(doc.get('last_activity') or doc.get('lastActivity') or doc.get('updated_at')),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, UserProgress, build_defaults, 'progress', 'user progress',
+            documents=documents
+        )
 
     @classmethod
-    def sync_premium_signals(cls, collection_name='premium_signals'):
+    def sync_premium_signals(cls, collection_name='premium_signals', documents=None):
         """Sync premium signals from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        signal, created = PremiumSignal.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'signal_type': doc.get('type') or doc.get('signal_type', ''),
-                                'symbol': doc.get('symbol', ''),
-                                'entry_price': cls.parse_decimal(doc.get('entry_price') or doc.get('entryPrice')),
-                                'stop_loss': cls.parse_decimal(doc.get('stop_loss') or doc.get('stopLoss')),
-                                'take_profit': cls.parse_decimal(doc.get('take_profit') or doc.get('takeProfit')),
-                                'title': doc.get('title', ''),
-                                'description': doc.get('description', ''),
-                                'status': doc.get('status', ''),
-                                'signal_date': cls.parse_date(doc.get('signal_date') or doc.get('date') or doc.get('created_at')),
-                                'expiry_date': cls.parse_date(doc.get('expiry_date') or doc.get('expiryDate')),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing signal {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching premium signals from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'signal_type': doc.get('type') or doc.get('signal_type', ''),
+                'symbol': doc.get('symbol', ''),
+                'entry_price': cls.parse_decimal(doc.get('entry_price') or doc.get('entryPrice')),
+                'stop_loss': cls.parse_decimal(doc.get('stop_loss') or doc.get('stopLoss')),
+                'take_profit': cls.parse_decimal(doc.get('take_profit') or doc.get('takeProfit')),
+                'title': doc.get('title', ''),
+                'description': doc.get('description', ''),
+                'status': doc.get('status', ''),
+                'signal_date': cls.parse_date(doc.get('signal_date') or doc.get('date') or doc.get('created_at')),
+                'expiry_date': cls.parse_date(doc.get('expiry_date') or doc.get('expiryDate')),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, PremiumSignal, build_defaults, 'signal', 'premium signals',
+            documents=documents
+        )
 
     @classmethod
-    def sync_premium_signal_subscriptions(cls, collection_name='premium_signals_subscriptions'):
+    def sync_premium_signal_subscriptions(cls, collection_name='premium_signals_subscriptions', documents=None):
         """Sync premium signal subscriptions from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        subscription, created = PremiumSignalSubscription.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'subscription_type': doc.get('subscription_type') or doc.get('subscriptionType', ''),
-                                'status': doc.get('status', ''),
-                                'start_date': cls.parse_date(doc.get('start_date') or doc.get('startDate')),
-                                'end_date': cls.parse_date(doc.get('end_date') or doc.get('endDate')),
-                                'auto_renew': doc.get('auto_renew', False) or doc.get('autoRenew', False),
-                                'price': cls.parse_decimal(doc.get('price')),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing subscription {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching subscriptions from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'subscription_type': doc.get('subscription_type') or doc.get('subscriptionType', ''),
+                'status': doc.get('status', ''),
+                'start_date': cls.parse_date(doc.get('start_date') or doc.get('startDate')),
+                'end_date': cls.parse_date(doc.get('end_date') or doc.get('endDate')),
+                'auto_renew': doc.get('auto_renew', False) or doc.get('autoRenew', False),
+                'price': cls.parse_decimal(doc.get('price')),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, PremiumSignalSubscription, build_defaults, 'subscription', 'subscriptions',
+            documents=documents
+        )
 
     @classmethod
-    def sync_courses(cls, collection_name='courses'):
+    def sync_courses(cls, collection_name='courses', documents=None):
         """Sync courses from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        course, created = Course.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'title': doc.get('title', ''),
-                                'description': doc.get('description', ''),
-                                'instructor': doc.get('instructor', ''),
-                                'duration': doc.get('duration'),
-                                'level': doc.get('level', ''),
-                                'category': doc.get('category', ''),
-                                'thumbnail_url': doc.get('thumbnail_url') or doc.get('thumbnailUrl', ''),
-                                'video_count': doc.get('video_count', 0) or doc.get('videoCount', 0),
-                                'price': cls.parse_decimal(doc.get('price')),
-                                'is_free': doc.get('is_free', False) or doc.get('isFree', False),
-                                'is_published': doc.get('is_published', True) or doc.get('isPublished', True),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing course {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching courses from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'title': doc.get('title', ''),
+                'description': doc.get('description', ''),
+                'instructor': doc.get('instructor', ''),
+                'duration': doc.get('duration'),
+                'level': doc.get('level', ''),
+                'category': doc.get('category', ''),
+                'thumbnail_url': doc.get('thumbnail_url') or doc.get('thumbnailUrl', ''),
+                'video_count': doc.get('video_count', 0) or doc.get('videoCount', 0),
+                'price': cls.parse_decimal(doc.get('price')),
+                'is_free': doc.get('is_free', False) or doc.get('isFree', False),
+                'is_published': doc.get('is_published', True) or doc.get('isPublished', True),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, Course, build_defaults, 'course', 'courses',
+            documents=documents
+        )
 
     @classmethod
-    def sync_fcm_tokens(cls, collection_name='fcm_tokens'):
+    def sync_fcm_tokens(cls, collection_name='fcm_tokens', documents=None):
         """Sync FCM tokens from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False, limit=500)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        token, created = FCMToken.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'token': doc.get('token', firebase_id),
-                                'platform': doc.get('platform', ''),
-                                'device_info': doc.get('device_info') or doc.get('deviceInfo', ''),
-                                'is_active': doc.get('is_active', True) or doc.get('isActive', True),
-                                'last_used': cls.parse_date(doc.get('last_used') or doc.get('lastUsed') or doc.get('updated_at')),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing token {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching FCM tokens from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'token': doc.get('token', doc.get('id')),
+                'platform': doc.get('platform', ''),
+                'device_info': doc.get('device_info') or doc.get('deviceInfo', ''),
+                'is_active': doc.get('is_active', True) or doc.get('isActive', True),
+                'last_used': cls.parse_date(doc.get('last_used') or doc.get('lastUsed') or doc.get('updated_at')),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, FCMToken, build_defaults, 'token', 'FCM tokens',
+            limit=500,
+            documents=documents
+        )
 
     @classmethod
-    def sync_app_notifications(cls, collection_name='app_notifications'):
+    def sync_app_notifications(cls, collection_name='app_notifications', documents=None):
         """Sync app notifications from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        notification, created = AppNotification.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'title': doc.get('title', ''),
-                                'message': doc.get('message', ''),
-                                'notification_type': doc.get('type') or doc.get('notification_type', ''),
-                                'target_audience': doc.get('target_audience') or doc.get('targetAudience', ''),
-                                'priority': doc.get('priority', ''),
-                                'scheduled_date': cls.parse_date(doc.get('scheduled_date') or doc.get('scheduledDate')),
-                                'sent_date': cls.parse_date(doc.get('sent_date') or doc.get('sentDate')),
-                                'is_sent': doc.get('is_sent', False) or doc.get('isSent', False),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing app notification {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching app notifications from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'title': doc.get('title', ''),
+                'message': doc.get('message', ''),
+                'notification_type': doc.get('type') or doc.get('notification_type', ''),
+                'target_audience': doc.get('target_audience') or doc.get('targetAudience', ''),
+                'priority': doc.get('priority', ''),
+                'scheduled_date': cls.parse_date(doc.get('scheduled_date') or doc.get('scheduledDate')),
+                'sent_date': cls.parse_date(doc.get('sent_date') or doc.get('sentDate')),
+                'is_sent': doc.get('is_sent', False) or doc.get('isSent', False),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, AppNotification, build_defaults, 'app notification', 'app notifications',
+            documents=documents
+        )
 
     @classmethod
-    def sync_testimonials(cls, collection_name='testimonials'):
+    def sync_testimonials(cls, collection_name='testimonials', documents=None):
         """Sync testimonials from Firebase to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        testimonial, created = Testimonial.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
-                                'author_name': doc.get('author_name') or doc.get('authorName', ''),
-                                'author_email': doc.get('author_email') or doc.get('authorEmail', ''),
-                                'author_avatar': doc.get('author_avatar') or doc.get('authorAvatar', ''),
-                                'content': doc.get('content', ''),
-                                'rating': doc.get('rating'),
-                                'is_approved': doc.get('is_approved', False) or doc.get('isApproved', False),
-                                'is_featured': doc.get('is_featured', False) or doc.get('isFeatured', False),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing testimonial {doc.get('id')}: {e}")
-                    stats['errors'] += 1
-
-        except Exception as e:
-            print(f"Error fetching testimonials from Firebase: {e}")
+        def build_defaults(doc):
+            return {
+                'firebase_user_id': doc.get('userId') or doc.get('uid') or doc.get('user_id', ''),
+                'author_name': doc.get('author_name') or doc.get('authorName', ''),
+                'author_email': doc.get('author_email') or doc.get('authorEmail', ''),
+                'author_avatar': doc.get('author_avatar') or doc.get('authorAvatar', ''),
+                'content': doc.get('content', ''),
+                'rating': doc.get('rating'),
+                'is_approved': doc.get('is_approved', False) or doc.get('isApproved', False),
+                'is_featured': doc.get('is_featured', False) or doc.get('isFeatured', False),
+            }
 
-        return stats
+        return cls._sync_model(
+            collection_name, Testimonial, build_defaults, 'testimonial', 'testimonials',
+            documents=documents
+        )
 
     @classmethod
-    def sync_firebase_users(cls, collection_name='users'):
+    def sync_firebase_users(cls, collection_name='users', documents=None):
         """Sync Firebase users to MySQL"""
-        stats = {'created': 0, 'updated': 0, 'errors': 0, 'total': 0}
-
-        try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
-            stats['total'] = len(firebase_data)
-
-            for doc in firebase_data:
-                try:
-                    with transaction.atomic():
-                        firebase_id = doc.get('id') or doc.get('uid')
-                        if not firebase_id:
-                            stats['errors'] += 1
-                            continue
-
-                        user, created = FirebaseUser.objects.update_or_create(
-                            firebase_id=firebase_id,
-                            defaults={
-                                'email': doc.get('email', ''),
-                                'display_name': doc.get('display_name') or doc.get('displayName', ''),
-                                'phone_number': doc.get('phone_number') or doc.get('phoneNumber', ''),
-                                'photo_url': doc.get('photo_url') or doc.get('photoUrl', ''),
-                                'is_premium': doc.get('is_premium', False) or doc.get('isPremium', False),
-                                'is_active': doc.get('is_active', True) or doc.get('isActive', True),
-                                'last_login': cls.parse_date(doc.get('last_login') or doc.get('lastLogin') or doc.get('lastSignIn')),
-                                'account_created': cls.parse_date(doc.get('account_created') or doc.get('accountCreated') or doc.get('created_at')),
-                            }
-                        )
-
-                        if created:
-                            stats['created'] += 1
-                        else:
-                            stats['updated'] += 1
-
-                except Exception as e:
-                    print(f"Error syncing user {doc.get('id')}: {e}")
-                    stats['errors'] += 1
+        def build_defaults(doc):
+            return {
+                'email': doc.get('email', ''),
+                'display_name': doc.get('display_name') or doc.get('displayName', ''),
+                'phone_number': doc.get('phone_number') or doc.get('phoneNumber', ''),
+                'photo_url': doc.get('photo_url') or doc.get('photoUrl', ''),
+                'is_premium': doc.get('is_premium', False) or doc.get('isPremium', False),
+                'is_active': doc.get('is_active', True) or doc.get('isActive', True),
+                'last_login': cls.parse_date(doc.get('last_login') or doc.get('lastLogin') or doc.get('lastSignIn')),
+                'account_created': cls.parse_date(doc.get('account_created') or doc.get('accountCreated') or doc.get('created_at')),
+            }
 
-        except Exception as e:
-            print(f"Error fetching users from Firebase: {e}")
+        return cls._sync_model(
+            collection_name, FirebaseUser, build_defaults, 'user', 'users',
+            get_id=lambda doc: doc.get('id') or doc.get('uid'),
+            documents=documents
+        )
 
-        return stats
+    @classmethod
+    def counter_key(cls, collection_name):
+        """CollectionStats label a collection is synced under"""
+        model = cls.COLLECTION_MODELS.get(collection_name.lower())
+        if model is not None:
+            return CollectionCounters.key(model)
+        return DocumentMirror.counter_key(collection_name)
 
     @classmethod
-    def sync_collection(cls, collection_name):
+    def sync_collection(cls, collection_name, documents=None):
         """
         Sync a specific collection based on its name
 
         Args:
             collection_name (str): Name of the Firebase collection
+            documents (list): Changed documents to write instead of fetching the
+                whole collection
 
         Returns:
             dict: Statistics about the sync operation
@@ -600,17 +585,130 @@ class FirebaseSyncService:
 
         # Get the appropriate sync method
         sync_method = collection_map.get(collection_name.lower())
+        started = time.perf_counter()
 
         if sync_method:
-            return sync_method(collection_name)
+            stats = sync_method(collection_name, documents=documents)
+            if stats['created'] or stats['updated']:
+                model = cls.COLLECTION_MODELS[collection_name.lower()]
+                transaction.on_commit(lambda: DashboardSnapshot.refresh_for_model(model))
         else:
-            return {
-                'error': f"No sync method defined for collection: {collection_name}",
-                'created': 0,
-                'updated': 0,
-                'errors': 0,
-                'total': 0
-            }
+            # No dedicated model: keep the documents in the generic JSON mirror
+            stats = cls.sync_mirrored_collection(collection_name, documents=documents)
+
+        elapsed = time.perf_counter() - started
+        for result in ('created', 'updated', 'errors', 'skipped'):
+            if stats.get(result):
+                metrics.SYNC_DOCUMENTS.inc(stats[result], collection=collection_name, result=result)
+        if stats['total'] and elapsed:
+            metrics.SYNC_DOCS_PER_SECOND.set(round(stats['total'] / elapsed, 1), collection=collection_name)
+
+        SyncEvents.publish(
+            SyncEvents.SYNC_COMPLETED, collection_name,
+            changed=bool(stats['created'] or stats['updated'] or stats.get('deleted')),
+            **{key: stats.get(key, 0) for key in ('created', 'updated', 'errors', 'total')},
+        )
+        return stats
+
+    @classmethod
+    def sync_mirrored_collection(cls, collection_name, limit=None, documents=None):
+        """
+        Sync a collection without a dedicated model into MirroredDocument
+
+        Args:
+            collection_name (str): Name of the Firebase collection
+            limit (int): Optional limit on number of documents to fetch
+            documents (list): Changed documents to write instead of fetching the collection
+
+        Returns:
+            dict: Statistics about the sync operation ('deleted' counts the mirrored
+                  documents a full read no longer returned, see prune())
+        """
+        if documents is None:
+            try:
+                firebase_data = FirebaseService.get_collection(collection_name, use_cache=False, limit=limit)
+            except Exception as e:
+                logger.error(
+                    "Error fetching %s from Firebase: %s", collection_name, e, extra={'collection': collection_name}
+                )
+                return {'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0, 'total': 0}
+        else:
+            firebase_data = documents
+
+        complete = cls._is_complete(firebase_data, documents, limit)
+        cls._observe_schema(collection_name, firebase_data, limit, partial=not complete and documents is not None)
+
+        stats = DocumentMirror.write(collection_name, firebase_data, remote_update_time=cls.remote_update_time)
+        if complete:
+            stats['deleted'] = cls.prune(collection_name, [doc.get('id') for doc in firebase_data])
+        return stats
+
+    @classmethod
+    def remove_documents(cls, collection_name, firebase_ids):
+        """
+        Delete the local copies of documents removed from a collection
+
+        Args:
+            collection_name (str): Name of the Firebase collection
+            firebase_ids (list): IDs of the removed documents
+
+        Returns:
+            int: Number of rows deleted
+        """
+        model = cls.COLLECTION_MODELS.get(collection_name.lower())
+        if model is None:
+            return DocumentMirror.remove(collection_name, firebase_ids)
+
+        with transaction.atomic():
+            rollup = RevenueRollups.delta_for(model, firebase_ids)
+            if rollup:
+                for firebase_id in firebase_ids:
+                    rollup.remove(firebase_id)
+                rollup.apply()
+            pks = list(model.objects.filter(firebase_id__in=firebase_ids).values_list('pk', flat=True))
+            deleted = model.objects.filter(pk__in=pks).delete()[1].get(model._meta.label, 0)
+            CollectionCounters.record_write(model, 0, deleted=deleted)
+            ColumnarSnapshot.record_deletions(model, pks)
+
+        if deleted:
+            transaction.on_commit(lambda: DashboardSnapshot.refresh_for_model(model))
+        return deleted
+
+    @classmethod
+    def prune(cls, collection_name, seen_ids):
+        """
+        Delete the local copies of documents missing from a complete read of a collection
+
+        Models that several collections are synced into (e.g. purchases and
+        purchases_collection) are left alone: rows missing from one collection
+        may come from the other.
+
+        Args:
+            seen_ids (iterable): IDs of every document in the collection
+
+        Returns:
+            int: Number of rows deleted
+        """
+        model = cls.COLLECTION_MODELS.get(collection_name.lower())
+        if model is None:
+            return DocumentMirror.prune(collection_name, seen_ids)
+        if list(cls.COLLECTION_MODELS.values()).count(model) > 1:
+            return 0
+
+        seen = {str(firebase_id) for firebase_id in seen_ids}
+        local = model.objects.values_list('firebase_id', flat=True)
+        removed = [firebase_id for firebase_id in local.iterator() if firebase_id not in seen]
+
+        deleted = 0
+        for start in range(0, len(removed), cls.WRITE_BATCH_SIZE):
+            deleted += cls.remove_documents(collection_name, removed[start:start + cls.WRITE_BATCH_SIZE])
+        return deleted
+
+    @classmethod
+    def local_count(cls, collection_name):
+        """Number of documents of a collection synced locally"""
+        model = cls.COLLECTION_MODELS.get(collection_name.lower())
+        return CollectionCounters.count(model if model is not None else DocumentMirror.counter_key(collection_name))
 
     @classmethod
     def sync_all_collections(cls):
@@ -626,9 +724,12 @@ class FirebaseSyncService:
         all_collections = FirebaseService.get_all_collections()
 
         for collection in all_collections:
-            print(f"\nSyncing collection: {collection}")
             stats = cls.sync_collection(collection)
             all_stats[collection] = stats
-            print(f"  Created: {stats['created']}, Updated: {stats['updated']}, Errors: {stats['errors']}, Total: {stats['total']}")
+            logger.info(
+                "Synced collection %s: created %s, updated %s, errors %s, total %s",
+                collection, stats.get('created'), stats.get('updated'), stats.get('errors'), stats.get('total'),
+                extra={'collection': collection},
+            )
 
         return all_stats
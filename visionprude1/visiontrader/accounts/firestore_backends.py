@@ -0,0 +1,476 @@
+"""
+Firestore Backends
+The storage FirebaseService reads from: the real Firestore, or an in-memory
+store (optionally loaded from a fixture file) with injectable latency and quota
+errors, so the sync and view paths can be run and measured offline. Calls made
+through FirebaseService can be observed with a FirestoreCallTracker
+"""
+import bisect
+import contextvars
+import itertools
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+
+from google.api_core.exceptions import ResourceExhausted
+
+from . import metrics
+from .read_quota import ReadQuota
+
+
+# One document change delivered by a listener; kind is 'added', 'modified' or
+# 'removed', and document is the document dict (with 'id')
+DocumentChange = namedtuple('DocumentChange', ['kind', 'document_id', 'document'])
+
+# One backend call seen by a FirestoreCallTracker; documents is the number of
+# documents returned (or counted), error the exception's class name and bytes
+# the JSON size of the result (0 unless a tracker measures bytes)
+FirestoreCall = namedtuple('FirestoreCall', ['op', 'collection', 'documents', 'seconds', 'error', 'bytes'])
+
+_trackers = contextvars.ContextVar('firestore_call_trackers', default=())
+
+
+def billed_reads(op, documents):
+    """Document reads Firestore bills for a successful call that returned `documents`"""
+    if op == 'query':
+        return max(documents, 1)  # an empty result still costs one read
+    if op == 'count':
+        return max(1, -(-documents // 1000))  # one read per 1000 documents counted
+    if op in ('get', 'collections'):
+        return 1
+    return 0  # a listener's reads are its snapshots' documents
+
+
+def payload_bytes(result):
+    """Approximate size of a backend result, as compact JSON"""
+    if result is None:
+        return 0
+    return len(json.dumps(result, default=str, separators=(',', ':')))
+
+
+def record_wait(seconds):
+    """Report time spent waiting on the rate limiter (or a quota backoff) to the active trackers"""
+    for tracker in _trackers.get():
+        tracker.wait += seconds
+
+
+class FirestoreCallTracker:
+    """
+    Collects the backend calls made in its context (e.g. by one request)
+
+    Usage:
+        with FirestoreCallTracker() as tracker:
+            FirebaseService.get_collection('purchases')
+        tracker.count, tracker.calls
+    """
+
+    def __init__(self, measure_bytes=False):
+        """
+        Args:
+            measure_bytes (bool): Also measure the size of every result (costs a
+                serialization per call)
+        """
+        self.calls = []
+        self.measure_bytes = measure_bytes
+        self.wait = 0.0  # seconds spent in the rate limiter and quota backoff
+        self._token = None
+
+    def __enter__(self):
+        self._token = _trackers.set(_trackers.get() + (self,))
+        return self
+
+    def __exit__(self, *exc_info):
+        _trackers.reset(self._token)
+
+    @property
+    def count(self):
+        return len(self.calls)
+
+    @property
+    def documents(self):
+        return sum(call.documents for call in self.calls)
+
+    @property
+    def seconds(self):
+        return sum(call.seconds for call in self.calls)
+
+    @property
+    def bytes(self):
+        return sum(call.bytes for call in self.calls)
+
+
+class TrackedBackend:
+    """Reports every call of the wrapped backend to the active FirestoreCallTrackers"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        # rate_limited, reads, load(), generate()... of the wrapped backend
+        return getattr(self.backend, name)
+
+    def is_available(self):
+        return self.backend.is_available()
+
+    def _track(self, op, collection_name, call):
+        trackers = _trackers.get()
+        started = time.perf_counter()
+        error = None
+        result = None
+        try:
+            result = call()
+            return result
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if isinstance(result, list):
+                documents = len(result)
+            elif isinstance(result, int):
+                documents = result if op == 'count' else 1
+            else:
+                documents = 0 if result is None else 1
+            seconds = time.perf_counter() - started
+
+            label = collection_name or '*'
+            metrics.FIRESTORE_RPCS.inc(collection=label, op=op)
+            reads = billed_reads(op, documents) if error is None else 0
+            metrics.FIRESTORE_READS.inc(reads, collection=label)
+            ReadQuota.record(label, reads)
+
+            if trackers:
+                size = payload_bytes(result) if op != 'listen' and any(tracker.measure_bytes for tracker in trackers) else 0
+                record = FirestoreCall(op, collection_name, documents, seconds, error, size)
+                for tracker in trackers:
+                    tracker.calls.append(record)
+
+    def collections(self):
+        return self._track('collections', None, self.backend.collections)
+
+    def query(self, collection_name, filters=(), start_after=None, limit=None):
+        return self._track(
+            'query', collection_name,
+            lambda: self.backend.query(collection_name, filters, start_after=start_after, limit=limit),
+        )
+
+    def get(self, collection_name, document_id):
+        return self._track('get', collection_name, lambda: self.backend.get(collection_name, document_id))
+
+    def count(self, collection_name, filters=()):
+        return self._track('count', collection_name, lambda: self.backend.count(collection_name, filters))
+
+    def listen(self, collection_name, on_changes, filters=()):
+        def counted(changes):
+            # Every document in a snapshot is a billed read
+            metrics.FIRESTORE_READS.inc(len(changes), collection=collection_name)
+            ReadQuota.record(collection_name, len(changes), calls=0)
+            on_changes(changes)
+
+        return self._track('listen', collection_name, lambda: self.backend.listen(collection_name, counted, filters))
+
+
+class FirestoreBackend:
+    """
+    The real Firestore, through the firebase_admin client
+
+    Every method takes filters as (field, operator, value) tuples and returns
+    document dicts with their 'id'.
+    """
+
+    TIMEOUT = 30.0
+
+    # FirebaseService spaces out requests to this backend
+    rate_limited = True
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def client(self):
+        if self._client is None:
+            from .firebase_service import FirebaseService
+            self._client = FirebaseService.get_db()
+        return self._client
+
+    def is_available(self):
+        return self.client() is not None
+
+    @staticmethod
+    def _to_dict(snapshot):
+        data = snapshot.to_dict() or {}
+        data['id'] = snapshot.id
+        return data
+
+    def _query(self, collection_name, filters=()):
+        query = self.client().collection(collection_name)
+        for field, operator, value in filters:
+            query = query.where(field, operator, value)
+        return query
+
+    def collections(self):
+        return [collection.id for collection in self.client().collections(timeout=self.TIMEOUT)]
+
+    def query(self, collection_name, filters=(), start_after=None, limit=None):
+        """Documents matching all filters, in document ID order when paged"""
+        query = self._query(collection_name, filters)
+        if start_after:
+            query = query.order_by('__name__').start_after({'__name__': start_after})
+        if limit:
+            query = query.limit(limit)
+        return [self._to_dict(snapshot) for snapshot in query.stream(timeout=self.TIMEOUT)]
+
+    def get(self, collection_name, document_id):
+        snapshot = self.client().collection(collection_name).document(document_id).get()
+        return self._to_dict(snapshot) if snapshot.exists else None
+
+    def count(self, collection_name, filters=()):
+        """Number of matching documents (an aggregation query: one read per 1000 documents)"""
+        result = self._query(collection_name, filters).count().get(timeout=self.TIMEOUT)
+        return int(result[0][0].value)
+
+    def listen(self, collection_name, on_changes, filters=()):
+        initial = [True]
+
+        def on_snapshot(snapshot, changes, read_time):
+            batch = [
+                DocumentChange(change.type.name.lower(), change.document.id, self._to_dict(change.document))
+                for change in changes
+            ]
+            # The initial snapshot is delivered even when empty, so listeners can tell it apart
+            if batch or initial[0]:
+                initial[0] = False
+                on_changes(batch)
+
+        return self._query(collection_name, filters).on_snapshot(on_snapshot)
+
+
+class InMemoryWatch:
+    """Listener handle of InMemoryBackend"""
+
+    def __init__(self, backend, collection_name, on_changes, filters):
+        self.backend = backend
+        self.collection_name = collection_name
+        self.on_changes = on_changes
+        self.filters = filters
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+        self.backend._watches.discard(self)
+
+
+class InMemoryBackend:
+    """
+    Firestore stand-in for tests, benchmarks and offline profiling
+
+    Supports the operations FirebaseService uses (collections, where filters,
+    document ID cursors, limits, counts, listeners) with Firestore's semantics for
+    missing fields and mismatched types. Reads are counted the way Firestore bills
+    them, so quota use can be measured too.
+    """
+
+    OPERATORS = {
+        '==': lambda value, operand: value == operand,
+        '!=': lambda value, operand: value != operand,
+        '<': lambda value, operand: value < operand,
+        '<=': lambda value, operand: value <= operand,
+        '>': lambda value, operand: value > operand,
+        '>=': lambda value, operand: value >= operand,
+        'in': lambda value, operand: value in operand,
+        'not-in': lambda value, operand: value not in operand,
+        'array-contains': lambda value, operand: isinstance(value, list) and operand in value,
+        'array-contains-any': lambda value, operand: isinstance(value, list) and any(item in value for item in operand),
+    }
+
+    _MISSING = object()
+
+    rate_limited = False
+
+    def __init__(self, collections=None, fixture=None, latency=0, error_rate=0, seed=None):
+        """
+        Args:
+            collections (dict): Collection name -> list of documents (dicts with 'id')
+            fixture (str): JSON ({collection: [documents]}) or NDJSON
+                ({"collection", "id", "data"} per line) file to load
+            latency (float): Seconds added to every call
+            error_rate (float): Share of calls failing with ResourceExhausted
+            seed (int): Seed of the error injection, for reproducible runs
+        """
+        self._lock = threading.RLock()
+        self._documents = {}  # collection -> {id: data}
+        self._sorted_ids = {}  # collection -> sorted ids, rebuilt after writes
+        self._watches = set()
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._failures = []
+        self.reads = 0
+        self.calls = 0
+
+        for collection_name, documents in (collections or {}).items():
+            self.add(collection_name, documents)
+        if fixture:
+            self.load(fixture)
+
+    # Loading and writing
+
+    def load(self, path):
+        """Add the documents of a JSON or NDJSON fixture file"""
+        with open(path, encoding='utf-8') as handle:
+            if str(path).endswith('.ndjson'):
+                for line in handle:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.set(record['collection'], record['id'], record.get('data', {}))
+            else:
+                for collection_name, documents in json.load(handle).items():
+                    self.add(collection_name, documents)
+
+    def add(self, collection_name, documents):
+        """Add documents (dicts with an 'id') without notifying listeners"""
+        with self._lock:
+            store = self._documents.setdefault(collection_name, {})
+            for document in documents:
+                data = dict(document)
+                store[str(data.pop('id'))] = data
+            self._sorted_ids.pop(collection_name, None)
+
+    def generate(self, collection_name, count, factory):
+        """
+        Add `count` synthetic documents
+
+        Args:
+            factory (callable): Called with the document number, returns its data
+        """
+        width = len(str(count))
+        self.add(collection_name, (
+            dict(factory(number), id=f'{collection_name}-{number:0{width}d}') for number in range(count)
+        ))
+
+    def set(self, collection_name, document_id, data):
+        """Create or replace a document, notifying listeners"""
+        document_id = str(document_id)
+        with self._lock:
+            store = self._documents.setdefault(collection_name, {})
+            previous = store.get(document_id)
+            store[document_id] = dict(data)
+            if previous is None:
+                self._sorted_ids.pop(collection_name, None)
+        self._notify(collection_name, document_id, previous, dict(data))
+
+    def delete(self, collection_name, document_id):
+        """Delete a document, notifying listeners"""
+        document_id = str(document_id)
+        with self._lock:
+            previous = self._documents.get(collection_name, {}).pop(document_id, None)
+            if previous is not None:
+                self._sorted_ids.pop(collection_name, None)
+        if previous is not None:
+            self._notify(collection_name, document_id, previous, None)
+
+    # Fault injection
+
+    def fail_next(self, count=1, error=None):
+        """Make the next `count` calls raise `error` (ResourceExhausted by default)"""
+        self._failures.extend([error or ResourceExhausted('Quota exceeded (injected)')] * count)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._failures:
+            raise self._failures.pop(0)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ResourceExhausted('Quota exceeded (injected)')
+
+    # Reading
+
+    def is_available(self):
+        return True
+
+    def _ids(self, collection_name):
+        ids = self._sorted_ids.get(collection_name)
+        if ids is None:
+            ids = self._sorted_ids[collection_name] = sorted(self._documents.get(collection_name, {}))
+        return ids
+
+    @classmethod
+    def matches(cls, data, filters):
+        for field, operator, operand in filters:
+            value = data.get(field, cls._MISSING)
+            if value is cls._MISSING:
+                return False
+            try:
+                if not cls.OPERATORS[operator](value, operand):
+                    return False
+            except TypeError:
+                # Firestore only compares values of the same type
+                return False
+        return True
+
+    def collections(self):
+        self._call()
+        with self._lock:
+            return [name for name, documents in self._documents.items() if documents]
+
+    def query(self, collection_name, filters=(), start_after=None, limit=None):
+        self._call()
+        return self._query(collection_name, filters, start_after, limit)
+
+    def _query(self, collection_name, filters=(), start_after=None, limit=None):
+        """query() without counting a call (listen() reads its initial documents with it)"""
+        results = []
+        with self._lock:
+            store = self._documents.get(collection_name, {})
+            ids = self._ids(collection_name)
+            start = bisect.bisect_right(ids, start_after) if start_after else 0
+            for document_id in itertools.islice(ids, start, None):
+                data = store[document_id]
+                if filters and not self.matches(data, filters):
+                    continue
+                results.append(dict(data, id=document_id))
+                if limit and len(results) >= limit:
+                    break
+        # Firestore bills one read per returned document, and one for an empty result
+        self.reads += max(len(results), 1)
+        return results
+
+    def get(self, collection_name, document_id):
+        self._call()
+        self.reads += 1
+        with self._lock:
+            data = self._documents.get(collection_name, {}).get(str(document_id))
+        return dict(data, id=str(document_id)) if data is not None else None
+
+    def count(self, collection_name, filters=()):
+        self._call()
+        with self._lock:
+            store = self._documents.get(collection_name, {})
+            total = sum(1 for data in store.values() if self.matches(data, filters)) if filters else len(store)
+        self.reads += max(1, -(-total // 1000))  # one read per 1000 documents counted
+        return total
+
+    # Listening
+
+    def listen(self, collection_name, on_changes, filters=()):
+        """Deliver the matching documents as added (even if there are none), then every later change"""
+        self._call()
+        watch = InMemoryWatch(self, collection_name, on_changes, tuple(filters))
+        initial = self._query(collection_name, filters)
+        self._watches.add(watch)
+        on_changes([DocumentChange('added', document['id'], document) for document in initial])
+        return watch
+
+    def _notify(self, collection_name, document_id, previous, current):
+        for watch in list(self._watches):
+            if watch.collection_name != collection_name or not watch.is_active:
+                continue
+            was_visible = previous is not None and self.matches(previous, watch.filters)
+            is_visible = current is not None and self.matches(current, watch.filters)
+            if is_visible:
+                kind = 'modified' if was_visible else 'added'
+                watch.on_changes([DocumentChange(kind, document_id, dict(current, id=document_id))])
+                self.reads += 1
+            elif was_visible:
+                watch.on_changes([DocumentChange('removed', document_id, dict(previous, id=document_id))])
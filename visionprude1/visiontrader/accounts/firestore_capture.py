@@ -0,0 +1,419 @@
+"""
+Firestore Capture and Replay
+Records every backend call (operation, arguments, latency, result size and,
+optionally anonymized, the payload) to NDJSON segments, and replays those
+recordings as a backend with the original latencies, so a production sync or
+page load can be reproduced offline
+"""
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime
+from pathlib import Path
+
+from google.api_core import exceptions as api_exceptions
+
+from .firestore_backends import DocumentChange
+
+
+def encode_value(value):
+    """JSON-safe form of a Firestore value (timestamps keep their type)"""
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    if isinstance(value, date):
+        return {'$day': value.isoformat()}
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)  # GeoPoint, references, bytes
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if set(value) == {'$date'}:
+            return datetime.fromisoformat(value['$date'])
+        if set(value) == {'$day'}:
+            return date.fromisoformat(value['$day'])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+class Anonymizer:
+    """
+    Replaces strings (document IDs included) with keyed hashes
+
+    The same input always gets the same token for the same key, so cursors,
+    joins and cardinalities survive; numbers, booleans and timestamps are kept
+    because they drive the sums, rollups and date handling being profiled.
+    """
+
+    def __init__(self, key=None):
+        """
+        Args:
+            key (str | bytes): HMAC key; captures made with the same key (e.g. by
+                several worker processes) share their tokens. Random if None
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        self.key = key or secrets.token_bytes(16)
+
+    @classmethod
+    def from_settings(cls, key=None):
+        """
+        Anonymizer with the configured key, or one derived from SECRET_KEY
+
+        Every process of a deployment gets the same tokens, while they can't be
+        reversed without the secret.
+        """
+        if key is None:
+            from django.conf import settings
+
+            key = hmac.new(settings.SECRET_KEY.encode('utf-8'), b'firestore-capture', hashlib.sha256).digest()
+        return cls(key)
+
+    def token(self, text):
+        digest = hmac.new(self.key, text.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f'anon-{digest[:max(8, min(len(text), 24))]}'
+
+    def value(self, value):
+        if isinstance(value, str):
+            return self.token(value)
+        if isinstance(value, dict):
+            return {key: self.value(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.value(item) for item in value]
+        return value
+
+
+def read_records(path):
+    """
+    Records of a capture, in order
+
+    Args:
+        path: A segment file (.ndjson or .ndjson.gz) or a directory of segments
+    """
+    path = Path(path)
+    files = sorted(path.glob('*.ndjson*')) if path.is_dir() else [path]
+    for file in files:
+        opener = gzip.open if file.suffix == '.gz' else open
+        with opener(file, 'rt', encoding='utf-8') as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class RecordingBackend:
+    """Wraps a backend and records every call to rotating NDJSON segments"""
+
+    # Records per segment file
+    SEGMENT_RECORDS = 5000
+
+    PAYLOAD_MODES = ('none', 'anonymized', 'full')
+
+    def __init__(self, backend, directory, payloads='anonymized', compress=True, anonymize_key=None):
+        """
+        Args:
+            backend: Backend whose calls are recorded
+            directory: Where the segments are written
+            payloads (str): 'none' (sizes only), 'anonymized' or 'full'
+            compress (bool): Gzip the segments
+            anonymize_key (str): Key of the anonymized tokens (derived from
+                SECRET_KEY if None, see Anonymizer.from_settings)
+        """
+        if payloads not in self.PAYLOAD_MODES:
+            raise ValueError(f"payloads must be one of {', '.join(self.PAYLOAD_MODES)}")
+        self.backend = backend
+        self.directory = Path(directory)
+        self.payloads = payloads
+        self.compress = compress
+        self.anonymizer = Anonymizer.from_settings(anonymize_key) if payloads == 'anonymized' else None
+        self.rate_limited = getattr(backend, 'rate_limited', True)
+
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._prefix = f"capture-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self._segment = 0
+        self._in_segment = 0
+        self._handle = None
+        atexit.register(self.close)  # gzip only writes its buffer out on close
+
+    def is_available(self):
+        return self.backend.is_available()
+
+    def _open_segment(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment += 1
+        name = f'{self._prefix}-{self._segment:04d}.ndjson'
+        if self.compress:
+            self._handle = gzip.open(self.directory / f'{name}.gz', 'wt', encoding='utf-8')
+        else:
+            self._handle = open(self.directory / name, 'w', encoding='utf-8')
+        self._in_segment = 0
+
+    def _write(self, record):
+        line = json.dumps(record, separators=(',', ':'))
+        with self._lock:
+            if self._handle is None or self._in_segment >= self.SEGMENT_RECORDS:
+                self.close()
+                self._open_segment()
+            self._handle.write(line + '\n')
+            self._in_segment += 1
+
+    def close(self):
+        """Finish the current segment"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _private(self, value):
+        """Argument or payload value as it is stored"""
+        if self.anonymizer is not None:
+            value = self.anonymizer.value(value)
+        return encode_value(value)
+
+    def _payload(self, result):
+        if self.payloads == 'none':
+            return None
+        return self._private(result)
+
+    def _record(self, op, collection_name, args, call):
+        started = time.monotonic()
+        record = {
+            't': round(started - self._started, 6),
+            'op': op,
+            'collection': collection_name,
+            'args': args,
+        }
+        try:
+            result = call()
+        except Exception as e:
+            record['latency_ms'] = round((time.monotonic() - started) * 1000, 3)
+            record['error'] = type(e).__name__
+            record['message'] = str(e)
+            self._write(record)
+            raise
+
+        record['latency_ms'] = round((time.monotonic() - started) * 1000, 3)
+        if isinstance(result, list):
+            record['size'] = len(result)
+        elif isinstance(result, int):
+            record['size'] = 1
+        else:
+            record['size'] = 0 if result is None else 1
+        if op in ('collections', 'count'):
+            record['result'] = result
+        elif op != 'listen':
+            record['result'] = self._payload(result)
+        self._write(record)
+        return result
+
+    def _filters(self, filters):
+        # Field names and operators describe the query shape; only values are private
+        return [[field, operator, self._private(value)] for field, operator, value in filters]
+
+    def collections(self):
+        return self._record('collections', None, {}, self.backend.collections)
+
+    def query(self, collection_name, filters=(), start_after=None, limit=None):
+        args = {'filters': self._filters(filters), 'start_after': self._private(start_after), 'limit': limit}
+        return self._record(
+            'query', collection_name, args,
+            lambda: self.backend.query(collection_name, filters, start_after=start_after, limit=limit),
+        )
+
+    def get(self, collection_name, document_id):
+        return self._record(
+            'get', collection_name, {'document_id': self._private(document_id)},
+            lambda: self.backend.get(collection_name, document_id),
+        )
+
+    def count(self, collection_name, filters=()):
+        return self._record(
+            'count', collection_name, {'filters': self._filters(filters)},
+            lambda: self.backend.count(collection_name, filters),
+        )
+
+    def listen(self, collection_name, on_changes, filters=()):
+        def record_changes(changes):
+            self._write({
+                't': round(time.monotonic() - self._started, 6),
+                'op': 'changes',
+                'collection': collection_name,
+                'size': len(changes),
+                'result': None if self.payloads == 'none' else [
+                    [change.kind, self._private(change.document_id), self._private(change.document)]
+                    for change in changes
+                ],
+            })
+            on_changes(changes)
+
+        return self._record(
+            'listen', collection_name, {'filters': self._filters(filters)},
+            lambda: self.backend.listen(collection_name, record_changes, filters),
+        )
+
+
+class ReplayWatch:
+    is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class ReplayBackend:
+    """
+    Serves the results of a capture, with the recorded latency of each call
+
+    Calls are matched to recorded ones by operation, collection and arguments,
+    in recorded order; a call that was never recorded gets the next recording of
+    the same operation on the same collection (and counts as a miss).
+    Recorded errors are raised again.
+    """
+
+    rate_limited = False
+
+    def __init__(self, path, speed=1.0, timing=True):
+        """
+        Args:
+            path: Capture segment file or directory
+            speed (float): Replay latencies this many times faster
+            timing (bool): Sleep for the recorded latencies at all
+        """
+        self.speed = speed
+        self.timing = timing
+        self.records = list(read_records(path))
+        self._exact = defaultdict(deque)
+        self._loose = defaultdict(deque)
+        self._changes = defaultdict(deque)
+        for record in self.records:
+            if record['op'] == 'changes':
+                self._changes[record['collection']].append(record)
+                continue
+            self._exact[self._key(record['op'], record['collection'], record.get('args', {}))].append(record)
+            self._loose[(record['op'], record['collection'])].append(record)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(op, collection_name, args):
+        return op, collection_name, json.dumps(args, sort_keys=True)
+
+    def is_available(self):
+        return True
+
+    def _replay(self, op, collection_name, args):
+        with self._lock:
+            exact = self._exact.get(self._key(op, collection_name, encode_value(args)))
+            if exact:
+                record = exact.popleft()
+            else:
+                loose = self._loose.get((op, collection_name))
+                if not loose:
+                    self.misses += 1
+                    return None
+                record = loose[0]
+                loose.rotate(-1)
+                self.misses += 1
+            self.served += 1
+
+        if self.timing and record.get('latency_ms'):
+            time.sleep(record['latency_ms'] / 1000 / self.speed)
+        if record.get('error'):
+            error = getattr(api_exceptions, record['error'], None)
+            if isinstance(error, type) and issubclass(error, Exception):
+                raise error(record.get('message', ''))
+            raise RuntimeError(f"{record['error']}: {record.get('message', '')}")
+        return record
+
+    def has_payloads(self, collection_name):
+        """Whether the capture holds the documents its queries of a collection returned"""
+        return any(
+            record.get('result') is not None for record in self._loose.get(('query', collection_name), ())
+        )
+
+    @staticmethod
+    def _documents(record):
+        if record.get('result') is None:
+            # Captured without payloads: documents of the recorded count, IDs only
+            return [{'id': f"{record['collection']}-{number}"} for number in range(record.get('size', 0))]
+        return decode_value(record['result'])
+
+    def collections(self):
+        record = self._replay('collections', None, {})
+        return record['result'] if record else []
+
+    def query(self, collection_name, filters=(), start_after=None, limit=None):
+        args = {'filters': [list(item) for item in filters], 'start_after': start_after, 'limit': limit}
+        record = self._replay('query', collection_name, args)
+        return self._documents(record) if record else []
+
+    def get(self, collection_name, document_id):
+        record = self._replay('get', collection_name, {'document_id': document_id})
+        if not record or not record.get('size'):
+            return None
+        return decode_value(record['result']) if record.get('result') is not None else {'id': document_id}
+
+    def count(self, collection_name, filters=()):
+        record = self._replay('count', collection_name, {'filters': [list(item) for item in filters]})
+        return record['result'] if record else 0
+
+    def listen(self, collection_name, on_changes, filters=()):
+        """Deliver the recorded change batches of the collection, with their original spacing"""
+        self._replay('listen', collection_name, {'filters': [list(item) for item in filters]})
+        batches = list(self._changes.get(collection_name, ()))
+        watch = ReplayWatch()
+
+        def deliver():
+            previous = batches[0]['t'] if batches else 0
+            for record in batches:
+                if not watch.is_active:
+                    return
+                if self.timing:
+                    time.sleep(max(record['t'] - previous, 0) / self.speed)
+                previous = record['t']
+                if record.get('result') is None:
+                    continue
+                on_changes([
+                    DocumentChange(kind, document_id, decode_value(document))
+                    for kind, document_id, document in record['result']
+                ])
+
+        threading.Thread(target=deliver, daemon=True).start()
+        return watch
+
+    def summary(self):
+        """
+        Per-operation statistics of the capture
+
+        Returns:
+            dict: (op, collection) label -> calls, errors, documents, p50/p99/max latency (ms)
+        """
+        groups = defaultdict(list)
+        for record in self.records:
+            groups[f"{record['op']} {record['collection'] or ''}".strip()].append(record)
+
+        summary = {}
+        for label, records in sorted(groups.items()):
+            latencies = sorted(record.get('latency_ms', 0) for record in records)
+            summary[label] = {
+                'calls': len(records),
+                'errors': sum(1 for record in records if record.get('error')),
+                'documents': sum(record.get('size', 0) for record in records),
+                'p50_ms': latencies[len(latencies) // 2],
+                'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+                'max_ms': latencies[-1],
+            }
+        return summary
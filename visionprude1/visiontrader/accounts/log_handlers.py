@@ -0,0 +1,159 @@
+"""
+Logging Handlers
+A queue-based handler that moves log I/O off the request thread, a filter that
+rate-limits repetitive errors, and a JSON formatter for structured log lines
+(configured in settings.LOGGING)
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.module_loading import import_string
+
+
+class _Listener(QueueListener):
+    """QueueListener that waits for room for its stop sentinel instead of failing on a full queue"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Queues records for a background thread that writes them to the target handler
+
+    Logging never blocks the caller: when the queue is full the record is
+    dropped and counted, and a line reporting the drops is logged once there is
+    room again. Records are formatted with this handler's formatter before they
+    are queued; the target writes them as they are.
+    """
+
+    def __init__(self, target='logging.StreamHandler', target_options=None, maxsize=10000):
+        """
+        Args:
+            target (str): Dotted path of the handler doing the I/O
+            target_options (dict): Keyword arguments of the target handler
+            maxsize (int): Records the queue holds before dropping new ones
+        """
+        super().__init__(queue.Queue(maxsize))
+        self.target = import_string(target)(**(target_options or {}))
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+        self.listener = _Listener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def enqueue(self, record):
+        if self.dropped:
+            self._report_drops()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._dropped(1)
+
+    def _dropped(self, count):
+        with self._drop_lock:
+            self.dropped += count
+        from . import metrics
+
+        metrics.LOG_RECORDS_DROPPED.inc(count)
+
+    def _report_drops(self):
+        with self._drop_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            'Dropped %d log records: the logging queue was full', (dropped,), None,
+        )
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += dropped
+
+    def close(self):
+        # Writes what is still queued before the process exits
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        self.target.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `rate` records of the same message per `per` seconds
+
+    Records are "the same" when they come from the same logger with the same
+    unformatted message, e.g. one 'Error syncing %s %s: %s' per failing
+    document. Only records at `level` or above are limited. The first record let
+    through after some were suppressed says how many were.
+    """
+
+    # Message keys kept before the expired ones are forgotten
+    MAX_KEYS = 1000
+
+    def __init__(self, rate=5, per=60, level='ERROR'):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self.level = logging._checkLevel(level)
+        self._windows = {}  # (logger, message) -> [window start, records let through, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, str(record.msg))
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.per:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.MAX_KEYS:
+                    self._forget_expired(now)
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.rate:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f'{record.msg} [{suppressed} similar messages suppressed]'
+        return True
+
+    def _forget_expired(self, now):
+        for key in [key for key, window in self._windows.items() if now - window[0] >= self.per]:
+            del self._windows[key]
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger and message, plus the
+    fields passed in `extra`
+    """
+
+    # Attributes every LogRecord has; anything else came from `extra`
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,93 @@
+"""
+Inspect, retry or discard the documents that failed to sync (see accounts.dead_letters)
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Sum
+
+from accounts.dead_letters import DeadLetters
+
+
+class Command(BaseCommand):
+    help = 'List the dead-lettered documents by collection and error, show them, retry them or discard them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', help='Only this collection')
+        parser.add_argument('--error-class', help='Only documents that failed with this exception class')
+        parser.add_argument('--id', action='append', dest='ids', metavar='DOCUMENT_ID',
+                            help='Only this document (repeatable)')
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--show', action='store_true', help='Print each document with its error')
+        action.add_argument('--retry', action='store_true', help='Sync the documents again')
+        action.add_argument('--discard', action='store_true', help='Delete the dead letters')
+        parser.add_argument('--refetch', action='store_true',
+                            help='With --retry: read the current documents from Firestore instead of the stored copies')
+        parser.add_argument('--limit', type=int, default=20, help='Documents to print with --show (default: 20)')
+
+    def handle(self, *args, **options):
+        if options['refetch'] and not options['retry']:
+            raise CommandError('--refetch only applies to --retry')
+
+        letters = DeadLetters.matching(options['collection'], options['error_class'], options['ids'])
+        if not letters.exists():
+            self.stdout.write(self.style.SUCCESS('No dead letters'))
+            return
+
+        if options['retry']:
+            self.retry(options)
+        elif options['discard']:
+            deleted, _ = letters.delete()
+            self.stdout.write(self.style.SUCCESS(f"Discarded {deleted} dead letters"))
+        elif options['show']:
+            self.show(letters, options['limit'])
+        else:
+            self.summarize(letters)
+
+    def summarize(self, letters):
+        groups = (
+            letters.values('collection', 'error_class')
+            .annotate(documents=Count('id'), attempts=Sum('attempts'), last=Max('last_failed_at'))
+            .order_by('collection', '-documents')
+        )
+        self.stdout.write(f"{'collection':<36} {'error':<28} {'documents':>9} {'attempts':>8}  last failure")
+        for group in groups:
+            self.stdout.write(
+                f"{group['collection']:<36} {group['error_class']:<28} {group['documents']:>9} "
+                f"{group['attempts']:>8}  {group['last']:%Y-%m-%d %H:%M}"
+            )
+        example = letters.order_by('-last_failed_at').first()
+        self.stdout.write(f"\nLatest: {example.collection}/{example.document_id}: {example.error_message}")
+
+    def show(self, letters, limit):
+        for letter in letters.order_by('collection', '-last_failed_at')[:limit]:
+            self.stdout.write(self.style.WARNING(
+                f"{letter.collection}/{letter.document_id}: {letter.error_class} after {letter.attempts} attempts "
+                f"(first {letter.first_failed_at:%Y-%m-%d %H:%M}, last {letter.last_failed_at:%Y-%m-%d %H:%M})"
+            ))
+            self.stdout.write(f"  {letter.error_message}")
+            self.stdout.write(f"  {json.dumps(letter.document, sort_keys=True)}")
+        remaining = letters.count() - limit
+        if remaining > 0:
+            self.stdout.write(f"... {remaining} more")
+
+    def retry(self, options):
+        try:
+            results = DeadLetters.retry(
+                options['collection'], options['error_class'], options['ids'], refetch=options['refetch']
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        written = failed = 0
+        for collection, stats in results.items():
+            line = (
+                f"{collection}: {stats['created']} created, {stats['updated']} updated, "
+                f"{stats['errors']} failed again"
+            )
+            if stats['missing']:
+                line += f", {stats['missing']} no longer in Firestore"
+            self.stdout.write(line)
+            written += stats['created'] + stats['updated']
+            failed += stats['errors']
+        self.stdout.write(self.style.SUCCESS(f"Retried dead letters: {written} written, {failed} still failing"))
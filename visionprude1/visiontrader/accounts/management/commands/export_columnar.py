@@ -0,0 +1,79 @@
+"""
+Export the synced tables to partitioned Parquet / Arrow IPC files for analytics
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.columnar import ColumnarSnapshot
+from accounts.exports import DataExport
+
+
+class Command(BaseCommand):
+    help = 'Append rows synced since the last run to the columnar (Parquet/Arrow) analytics export'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*', metavar='model',
+            help=f"Models to export (all by default): {', '.join(DataExport.MODELS)}"
+        )
+        parser.add_argument(
+            '--format', choices=list(ColumnarSnapshot.FORMATS), default='parquet',
+            help='File format (default: parquet)'
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Discard the existing files and export every row again'
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Read each export back and check it holds the same rows as the table'
+        )
+        parser.add_argument(
+            '--summary', action='store_true',
+            help='Print the sum, mean, min and max of each numeric column, read from the export'
+        )
+
+    def handle(self, *args, **options):
+        if not ColumnarSnapshot.is_available():
+            raise CommandError('pyarrow is required for columnar exports (pip install pyarrow)')
+
+        unknown = set(options['models']) - set(DataExport.MODELS)
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(sorted(unknown))}")
+
+        state = ColumnarSnapshot.load_state()
+        for model_name in options['models'] or DataExport.MODELS:
+            previous_format = state.get(model_name, {}).get('format')
+            full = options['full']
+            if previous_format and previous_format != options['format'] and not full:
+                raise CommandError(
+                    f"{model_name} was exported as {previous_format}; use --full to switch to {options['format']}"
+                )
+
+            written, deleted = ColumnarSnapshot.export_model(model_name, options['format'], full=full)
+            self.stdout.write(f"{model_name}: {written} rows" + (f", {deleted} deleted" if deleted else ''))
+            if options['verify']:
+                self.verify(model_name)
+            if options['summary']:
+                self.summary(model_name)
+
+        self.stdout.write(self.style.SUCCESS(f"Columnar export written to {ColumnarSnapshot.base_dir()}"))
+
+    def verify(self, model_name):
+        model = DataExport.MODELS[model_name][0]
+        table = ColumnarSnapshot.read(model_name, columns=['id'])
+        exported = set(table.column('id').to_pylist()) if table is not None else set()
+        current = set(model.objects.values_list('id', flat=True))
+        if exported == current:
+            self.stdout.write(f"  verified: {len(current)} rows match the table")
+            return
+        raise CommandError(
+            f"{model_name} export differs from the table: {len(current - exported)} rows missing, "
+            f"{len(exported - current)} rows that no longer exist (run with --full to rebuild)"
+        )
+
+    def summary(self, model_name):
+        for name, stats in (ColumnarSnapshot.numeric_summary(model_name) or {}).items():
+            self.stdout.write(
+                f"  {name:<24} sum {stats['sum']:>14.2f}  mean {stats['mean']:>12.2f}  "
+                f"min {stats['min']:>12.2f}  max {stats['max']:>12.2f}  null {stats['null_rate']:.0%}"
+            )
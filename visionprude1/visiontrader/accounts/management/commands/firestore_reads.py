@@ -0,0 +1,49 @@
+"""
+Report where the Firestore read quota went (see accounts.read_quota)
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.read_quota import ReadQuota
+
+
+class Command(BaseCommand):
+    help = 'Show the billed Firestore reads by caller (view or command) and collection, and the budget status'
+
+    GROUPS = {
+        'caller': ('caller',),
+        'collection': ('collection',),
+        'both': ('caller', 'collection'),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='Days to report, today included (default: 1)')
+        parser.add_argument('--by', choices=sorted(self.GROUPS), default='both', help='Grouping (default: both)')
+        parser.add_argument('--limit', type=int, default=30, help='Rows to show (default: 30)')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        group_by = self.GROUPS[options['by']]
+        rows = ReadQuota.report(days=options['days'], group_by=group_by)
+        total = sum(row['reads'] for row in rows)
+
+        hour_reads, day_reads = ReadQuota.usage()
+        daily, hourly = ReadQuota.budgets()
+        self.stdout.write(f"Today: {day_reads} reads" + (f" of {daily} budgeted" if daily is not None else ''))
+        self.stdout.write(f"This hour: {hour_reads} reads" + (f" of {hourly} budgeted" if hourly is not None else ''))
+        exhausted = ReadQuota.exhausted()
+        if exhausted:
+            self.stdout.write(self.style.WARNING(f"The {exhausted} budget is used up: serving cached data only"))
+
+        label = ' / '.join(group_by)
+        self.stdout.write('')
+        self.stdout.write(f"{label:<60} {'reads':>10} {'calls':>8} {'share':>7}")
+        for row in rows[:options['limit']]:
+            name = ' / '.join(str(row[field]) for field in group_by)
+            share = row['reads'] / total * 100 if total else 0
+            self.stdout.write(f"{name:<60} {row['reads']:>10} {row['calls']:>8} {share:>6.1f}%")
+        if len(rows) > options['limit']:
+            self.stdout.write(f"... {len(rows) - options['limit']} more")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} reads in the last {options['days']} day(s)"))
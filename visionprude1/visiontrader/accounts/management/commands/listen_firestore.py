@@ -0,0 +1,44 @@
+"""
+Mirror Firestore collections in real time through snapshot listeners
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.change_listener import ChangeListener
+
+
+class Command(BaseCommand):
+    help = 'Stream changes of the configured collections (FIRESTORE_LISTENERS) into the local mirror'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'collections', nargs='*',
+            help='Collections to listen to (every collection in FIRESTORE_LISTENERS by default)'
+        )
+        parser.add_argument(
+            '--duration', type=float,
+            help='Stop after this many seconds (runs until interrupted by default)'
+        )
+
+    def handle(self, *args, **options):
+        configured = getattr(settings, 'FIRESTORE_LISTENERS', {})
+        collections = {name: configured.get(name, {}) for name in options['collections']} or configured
+        if not collections:
+            raise CommandError("No collections to listen to: configure FIRESTORE_LISTENERS or name them")
+
+        listener = ChangeListener(collections)
+        self.stdout.write(f"Listening to {', '.join(collections)} (Ctrl+C to stop)")
+
+        def report(results):
+            for collection_name, stats in results.items():
+                self.stdout.write(
+                    f"{collection_name}: {stats.get('created', 0)} created, {stats.get('updated', 0)} updated, "
+                    f"{stats['removed']} removed, {stats.get('errors', 0)} errors"
+                )
+
+        try:
+            listener.run(duration=options['duration'], on_flush=report)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f"Stopped listening ({listener.reconnects} reconnects)"))
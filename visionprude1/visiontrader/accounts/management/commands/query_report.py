@@ -0,0 +1,89 @@
+"""
+Report slow or unindexed query shapes recorded at runtime by QueryShapeMiddleware
+"""
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.query_shapes import QueryShapeRecorder
+
+
+class Command(BaseCommand):
+    help = 'Report slow or unindexed SQL query shapes recorded at runtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help='Path to the query shape log (defaults to settings.QUERY_SHAPE_LOG)')
+        parser.add_argument('--limit', type=int, default=20, help='Number of shapes to report')
+        parser.add_argument('--min-ms', type=float, default=0, help='Only report shapes whose slowest run took at least this long')
+        parser.add_argument('--no-explain', action='store_true', help='Skip running EXPLAIN on the sample statements')
+        parser.add_argument('--clear', action='store_true', help='Delete the log after reporting')
+
+    def handle(self, *args, **options):
+        QueryShapeRecorder.flush()
+        log_path = options['log'] or QueryShapeRecorder.log_path()
+        shapes = QueryShapeRecorder.load(log_path)
+
+        if not shapes:
+            self.stdout.write(f"No query shapes recorded in {log_path}")
+            return
+
+        entries = [entry for entry in shapes.values() if entry['max_ms'] >= options['min_ms']]
+        entries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+
+        self.stdout.write(f"{len(shapes)} query shapes recorded, showing top {min(options['limit'], len(entries))} by total time\n")
+
+        for entry in entries[:options['limit']]:
+            avg_ms = entry['total_ms'] / entry['count'] if entry['count'] else 0
+            full_scans = [] if options['no_explain'] else self.find_full_scans(entry)
+
+            if full_scans:
+                label = self.style.ERROR('UNINDEXED')
+            elif entry['slow_count']:
+                label = self.style.WARNING('SLOW')
+            else:
+                label = self.style.SUCCESS('OK')
+
+            self.stdout.write(
+                f"[{label}] count={entry['count']} total={entry['total_ms']:.1f}ms "
+                f"avg={avg_ms:.1f}ms max={entry['max_ms']:.1f}ms slow={entry['slow_count']}"
+            )
+            self.stdout.write(f"  {entry['shape']}")
+            for table in full_scans:
+                self.stdout.write(f"  full scan on: {table}")
+
+        if options['clear'] and os.path.exists(log_path):
+            os.remove(log_path)
+            self.stdout.write(f"\nCleared {log_path}")
+
+    def find_full_scans(self, entry):
+        """EXPLAIN the sample statement and return the tables read without an index"""
+        sql = entry['sample_sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return []
+
+        vendor = connection.vendor
+        try:
+            with connection.cursor() as cursor:
+                if vendor == 'sqlite':
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', entry['sample_params'])
+                    return [
+                        row[-1] for row in cursor.fetchall()
+                        if row[-1].startswith('SCAN') and 'INDEX' not in row[-1]
+                    ]
+
+                cursor.execute(f'EXPLAIN {sql}', entry['sample_params'])
+                columns = [col[0].lower() for col in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+                if vendor == 'mysql':
+                    return [row.get('table') for row in rows if row.get('type') == 'ALL']
+                if vendor == 'postgresql':
+                    return [
+                        line for row in rows for line in row.values()
+                        if isinstance(line, str) and 'Seq Scan' in line
+                    ]
+        except Exception as e:
+            self.stderr.write(f"  could not EXPLAIN shape: {e}")
+
+        return []
@@ -0,0 +1,30 @@
+"""
+Rebuild the revenue rollup table from the Purchase and PremiumSignalPayment tables
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.models import Purchase, PremiumSignalPayment
+from accounts.rollups import RevenueRollups
+from accounts.dashboard_snapshot import DashboardSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (backfill) the revenue rollups from the synced purchase and payment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', choices=['purchase', 'premium_payment'],
+            help='Only rebuild one source (both by default)'
+        )
+
+    def handle(self, *args, **options):
+        models = {
+            'purchase': Purchase,
+            'premium_payment': PremiumSignalPayment,
+        }
+        model = models.get(options['source'])
+
+        written = RevenueRollups.rebuild(model)
+        DashboardSnapshot.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt revenue rollups: {written} rows written"))
@@ -0,0 +1,19 @@
+"""
+Recount the rows of every synced model into the CollectionStats table
+"""
+from django.core.management.base import BaseCommand
+
+from accounts.collection_stats import CollectionCounters
+from accounts.dashboard_snapshot import DashboardSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Recompute the row counters used by the dashboard and data views'
+
+    def handle(self, *args, **options):
+        counts = CollectionCounters.recount(list(DashboardSnapshot.SECTIONS.values()))
+        DashboardSnapshot.invalidate()
+
+        for model, count in counts.items():
+            self.stdout.write(f"{model._meta.label}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Recounted {len(counts)} models"))
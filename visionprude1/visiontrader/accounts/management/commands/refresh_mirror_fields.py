@@ -0,0 +1,31 @@
+"""
+Refill the extracted (indexed) columns of the generic document mirror
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.document_mirror import DocumentMirror
+from accounts.models import MirroredDocument
+
+
+class Command(BaseCommand):
+    help = 'Refill the indexed columns of MirroredDocument after MIRROR_EXTRACTED_FIELDS changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'collections', nargs='*',
+            help='Collections to refresh (every mirrored collection by default)'
+        )
+
+    def handle(self, *args, **options):
+        collections = options['collections'] or list(
+            MirroredDocument.objects.order_by().values_list('collection', flat=True).distinct()
+        )
+        configured = getattr(settings, 'MIRROR_EXTRACTED_FIELDS', {})
+
+        for collection_name in collections:
+            updated = DocumentMirror.reextract(collection_name)
+            fields = ', '.join(configured.get(collection_name, [])) or 'none'
+            self.stdout.write(f"{collection_name}: {updated} documents (extracted fields: {fields})")
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(collections)} mirrored collections"))
@@ -0,0 +1,104 @@
+"""
+Summarize a Firestore capture, or replay a sync against it
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from accounts.firebase_service import FirebaseService
+from accounts.firebase_sync import FirebaseSyncService
+from accounts.firestore_capture import ReplayBackend
+from accounts.read_quota import ReadQuota
+
+
+class Command(BaseCommand):
+    help = 'Summarize a Firestore capture (FIRESTORE_CAPTURE) or replay a sync against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Capture segment file or directory')
+        parser.add_argument(
+            '--sync', nargs='*', metavar='COLLECTION',
+            help='Sync these collections from the capture (every captured collection if none are named)'
+        )
+        parser.add_argument(
+            '--into-database', action='store_true',
+            help='With --sync: write into the configured database (a throwaway test database by default)'
+        )
+        parser.add_argument('--speed', type=float, default=1.0, help='Replay latencies this many times faster')
+        parser.add_argument('--no-timing', action='store_true', help="Don't replay the recorded latencies")
+
+    def handle(self, *args, **options):
+        try:
+            backend = ReplayBackend(options['path'], speed=options['speed'], timing=not options['no_timing'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read capture {options['path']}: {e}")
+
+        self.stdout.write(f"{len(backend.records)} recorded calls")
+        self.stdout.write(f"{'call':<48} {'calls':>7} {'errors':>7} {'docs':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for label, row in backend.summary().items():
+            self.stdout.write(
+                f"{label:<48} {row['calls']:>7} {row['errors']:>7} {row['documents']:>9} "
+                f"{row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+            )
+
+        if options['sync'] is None:
+            if options['into_database']:
+                raise CommandError('--into-database only applies to --sync')
+            return
+
+        collections = options['sync'] or sorted({
+            record['collection'] for record in backend.records if record['op'] == 'query'
+        })
+        # Captured without payloads, queries only return IDs, and every document
+        # would fail to map and end up a dead letter
+        empty = [collection_name for collection_name in collections if not backend.has_payloads(collection_name)]
+        if empty and options['sync']:
+            raise CommandError(
+                f"The capture has no payloads for {', '.join(empty)} (captured with PAYLOADS 'none'?)"
+            )
+        for collection_name in empty:
+            self.stdout.write(self.style.WARNING(f"{collection_name}: skipped, captured without payloads"))
+        collections = [collection_name for collection_name in collections if collection_name not in empty]
+        if not collections:
+            raise CommandError('The capture has no payloads to sync')
+
+        if options['into_database']:
+            self.sync(backend, collections)
+        else:
+            # Never write replayed documents into the real database
+            old_name = connection.settings_dict['NAME']
+            setup_test_environment()
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                self.sync(backend, collections)
+            finally:
+                ReadQuota.flush()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {backend.served} calls ({backend.misses} not matched to a recording)"
+        ))
+
+    def sync(self, backend, collections):
+        FirebaseService.set_backend(backend)
+        try:
+            # Replayed reads were billed when they were captured
+            with ReadQuota.disabled():
+                self.sync_collections(collections)
+        finally:
+            FirebaseService.set_backend(None)
+
+    def sync_collections(self, collections):
+        for collection_name in collections:
+            FirebaseService.clear_cache(collection_name)
+            started = time.perf_counter()
+            stats = FirebaseSyncService.sync_collection(collection_name)
+            elapsed = time.perf_counter() - started
+            rate = stats['total'] / elapsed if elapsed else 0
+            self.stdout.write(
+                f"{collection_name}: {stats['total']} documents in {elapsed:.2f}s ({rate:.0f} docs/s), "
+                f"{stats['created']} created, {stats['updated']} updated, {stats['errors']} errors"
+            )
@@ -0,0 +1,49 @@
+"""
+Report revenue per day, week or product from the revenue rollups (see accounts.rollups)
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.rollups import RevenueRollups
+
+
+class Command(BaseCommand):
+    help = 'Show revenue per day, week or product/signal type, answered from the revenue rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=['day', 'week', 'product'], default='day', help='Grouping (default: day)')
+        parser.add_argument('--days', type=int, default=30, help='Days to report, today included (default: 30)')
+        parser.add_argument('--source', choices=['purchase', 'premium_payment'], help='Only one source (both by default)')
+        parser.add_argument('--status', help='Only rows with this status')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        end = timezone.localdate()
+        filters = {
+            'source': options['source'],
+            'start': end - timedelta(days=options['days'] - 1),
+            'end': end,
+            'status': options['status'],
+        }
+        if options['by'] == 'product':
+            rows = RevenueRollups.breakdown(**filters)
+            labels = [f"{row['source']} / {row['dimension'] or '-'}" for row in rows]
+        else:
+            rows = RevenueRollups.time_series(period=options['by'], **filters)
+            labels = [f"{row['period']:%Y-%m-%d}" for row in rows]
+
+        self.stdout.write(f"{options['by']:<48} {'count':>8} {'revenue':>14} {'paid':>14} {'average':>10}")
+        for label, row in zip(labels, rows):
+            average = f"{row['avg_amount']:.2f}" if row['avg_amount'] is not None else '-'
+            self.stdout.write(
+                f"{label:<48} {row['count']:>8} {row['amount_total']:>14.2f} {row['paid_total']:>14.2f} {average:>10}"
+            )
+
+        totals = RevenueRollups.totals(**filters)
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['count']} rows, {totals['amount_total']:.2f} revenue in the last {options['days']} day(s)"
+        ))
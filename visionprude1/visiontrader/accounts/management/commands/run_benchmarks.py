@@ -0,0 +1,85 @@
+"""
+Run the benchmark suite (see accounts.benchmarks) against a throwaway test database
+"""
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from accounts.benchmarks import BenchmarkSuite, compare_results, load_results, parse_scale, save_results
+from accounts.read_quota import ReadQuota
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sync throughput, page latencies and cache hit ratios on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='10k', help='Synthetic documents: 10k, 100k, 1m or a number (default: 10k)')
+        parser.add_argument('--rounds', type=int, default=30, help='Timed requests per page (default: 30)')
+        parser.add_argument('--latency', type=float, default=0, help='Seconds of simulated latency per Firestore call')
+        parser.add_argument('--output', help='Results file (default: benchmarks/<scale>-<commit>-<time>.json)')
+        parser.add_argument('--compare', metavar='BASELINE', help='Results file of an earlier run to compare with')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+        parser.add_argument('--verbose-services', action='store_true', help="Show what the services print")
+
+    def handle(self, *args, **options):
+        try:
+            scale = parse_scale(options['scale'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['rounds'] < 1:
+            raise CommandError('--rounds must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = load_results(options['compare'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        suite = BenchmarkSuite(
+            scale, view_rounds=options['rounds'], latency=options['latency'],
+            quiet=not options['verbose_services'], log=self.stdout.write,
+        )
+
+        # Never write synthetic data into the real database
+        old_name = connection.settings_dict['NAME']
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            results = suite.run()
+        finally:
+            # The synthetic reads belong to the test database, not the real ledger
+            ReadQuota.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        output = options['output']
+        if not output:
+            commit = results['environment']['commit'] or 'nocommit'
+            output = Path(settings.BASE_DIR) / 'benchmarks' / (
+                f"{options['scale'].lower()}-{commit}-{datetime.now():%Y%m%d-%H%M%S}.json"
+            )
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        save_results(results, output)
+
+        self.stdout.write(
+            f"Cache: {results['cache']['hits']} hits, {results['cache']['misses']} misses "
+            f"(hit ratio {results['cache']['hit_ratio']})"
+        )
+        if baseline is not None:
+            self.print_comparison(baseline, results)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+    def print_comparison(self, baseline, results):
+        commit = baseline.get('environment', {}).get('commit') or 'baseline'
+        if baseline.get('scale') != results['scale']:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline ran at scale {baseline.get('scale')}, this run at {results['scale']}"
+            ))
+        self.stdout.write(f"{'metric':<64} {commit:>12} {'now':>12} {'change':>8}")
+        for metric, old, new, change in compare_results(baseline, results):
+            change = f'{change:+.1f}%' if change is not None else '-'
+            self.stdout.write(f"{metric:<64} {old if old is not None else '-':>12} {new if new is not None else '-':>12} {change:>8}")
@@ -0,0 +1,50 @@
+"""
+Sync collections on their adaptive schedules (see accounts.sync_scheduler)
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.sync_scheduler import SyncScheduler
+
+
+class Command(BaseCommand):
+    help = 'Sync each collection when it is due, adapting intervals to how often it changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Sync what is due now and exit')
+        parser.add_argument('--tick', type=int, default=30, help='Seconds between checks (default: 30)')
+        parser.add_argument('--status', action='store_true', help='Print the schedules and exit')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.print_status()
+            return
+
+        while True:
+            results, deferred = SyncScheduler.run_due()
+            for collection_name, stats in results.items():
+                self.stdout.write(
+                    f"{collection_name}: {stats.get('changed', 0)} changed, {stats['total']} read, {stats['errors']} errors"
+                )
+            if deferred:
+                self.stdout.write(self.style.WARNING(f"Over the read budget, deferred: {', '.join(deferred)}"))
+            if options['once']:
+                break
+            try:
+                time.sleep(options['tick'])
+            except KeyboardInterrupt:
+                break
+
+    def print_status(self):
+        rows = SyncScheduler.status()
+        self.stdout.write(f"{'collection':<32} {'interval':>9} {'changes/h':>10} {'reads/h':>9} {'slo':>6} {'urgency':>8}  next run")
+        for row in rows:
+            slo = f"{row['slo']}s" if row['slo'] else '-'
+            self.stdout.write(
+                f"{row['collection']:<32} {row['interval_seconds']:>8}s {row['change_rate']:>10.1f} "
+                f"{row['reads_per_hour']:>9.0f} {slo:>6} {row['urgency']:>8.2f}  {row['next_run_at']:%Y-%m-%d %H:%M:%S}"
+            )
+        total = sum(row['reads_per_hour'] for row in rows)
+        budget = SyncScheduler.config()['read_budget']
+        self.stdout.write(f"Projected reads: {total:.0f}/h of a {budget}/h budget")
@@ -0,0 +1,381 @@
+"""
+Metrics Registry
+Counters, gauges and histograms for the Firestore, cache and sync paths,
+served in the Prometheus text format at /metrics. Under several worker
+processes each one writes its values to a file in settings.METRICS_DIR and a
+scrape merges them
+"""
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+class Metric:
+    """One metric family; values are kept by the registry, keyed by label values"""
+
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {', '.join(self.labelnames) or '(none)'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry._update(self, self._key(labels), lambda value: (value or 0) + amount)
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down
+
+    Across processes a gauge is merged by its mode: 'last' (most recently set),
+    'max', or 'livesum' (sum over the processes still running, e.g. queue depths).
+    """
+
+    type = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames=(), mode='last'):
+        super().__init__(registry, name, documentation, labelnames)
+        self.mode = mode
+
+    def set(self, value, **labels):
+        self.registry._update(self, self._key(labels), lambda previous: [value, time.time()])
+
+    def inc(self, amount=1, **labels):
+        self.registry._update(
+            self, self._key(labels), lambda previous: [(previous[0] if previous else 0) + amount, time.time()]
+        )
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        def update(previous):
+            counts = previous or [0] * (len(self.buckets) + 2)  # buckets..., sum, count
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+            return counts
+        self.registry._update(self, self._key(labels), update)
+
+
+class MetricsRegistry:
+    """The metrics of this process, shared through METRICS_DIR if it is set"""
+
+    # Seconds between writes of this process's values to METRICS_DIR
+    FLUSH_INTERVAL = 2
+
+    # Seconds a scrape reuses what the collectors set, so frequent scrapes
+    # don't query the database each time
+    COLLECT_INTERVAL = 10
+
+    def __init__(self):
+        self._metrics = {}
+        self._values = {}  # (metric name, label values) -> value
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self._last_collect = None
+
+    # Declaring
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), mode='last'):
+        return self._add(Gauge(self, name, documentation, labelnames, mode))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def collector(self, func):
+        """Register a function called at scrape time to set gauges (e.g. from the database)"""
+        self._collectors.append(func)
+        return func
+
+    # Recording
+
+    @staticmethod
+    def directory():
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def _update(self, metric, labels, update):
+        with self._lock:
+            key = (metric.name, labels)
+            self._values[key] = update(self._values.get(key))
+        if self.directory() and time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR (atomically replacing its file)"""
+        directory = self.directory()
+        if not directory:
+            return
+        with self._lock:
+            values = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+            self._last_flush = time.monotonic()
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # A temporary file of its own, as other threads may be flushing too
+            descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=f'metrics-{os.getpid()}-', suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as handle:
+                    json.dump({'pid': os.getpid(), 'values': values}, handle)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except OSError as e:
+            logger.error("Error writing metrics to %s: %s", directory, e)
+
+    # Reading
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _process_values(self):
+        """(pid, values) of every process, this one included"""
+        directory = self.directory()
+        if not directory:
+            with self._lock:
+                return [(os.getpid(), dict(self._values))]
+
+        self._absorb_exited(directory)
+        self.flush()
+        processes = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path, encoding='utf-8') as handle:
+                    data = json.load(handle)
+            except (OSError, ValueError):
+                continue  # being replaced, or torn
+            values = {(name, tuple(labels)): value for name, labels, value in data['values']}
+            processes.append((data['pid'], values))
+        return processes
+
+    def _absorb_exited(self, directory):
+        """
+        Take over the files of processes that have exited
+
+        Their counters and histograms are added to this process's values (so
+        the totals don't drop) and the files deleted, so METRICS_DIR doesn't
+        grow with every restart. Live-sum gauges of an exited process no longer
+        count and are dropped.
+        """
+        claimed = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid() or self._alive(pid):
+                continue
+            # Renaming claims the file: a process scraping at the same time skips it
+            claim = f'{path}.{os.getpid()}.absorbing'
+            try:
+                os.rename(path, claim)
+            except OSError:
+                continue
+            claimed.append(claim)
+            try:
+                with open(claim, encoding='utf-8') as handle:
+                    values = json.load(handle)['values']
+            except (OSError, ValueError, KeyError):
+                continue
+            with self._lock:
+                for name, labels, value in values:
+                    metric = self._metrics.get(name)
+                    if metric is None:
+                        continue
+                    key = (name, tuple(labels))
+                    absorbed = self._absorbed(metric, self._values.get(key), value)
+                    if absorbed is not None:
+                        self._values[key] = absorbed
+
+        if claimed:
+            self.flush()
+        for claim in claimed:
+            try:
+                os.unlink(claim)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _absorbed(metric, own, exited):
+        """This process's value of a series with an exited process's value folded in"""
+        if own is None:
+            return None if metric.type == 'gauge' and metric.mode == 'livesum' else exited
+        if metric.type == 'counter':
+            return own + exited
+        if metric.type == 'histogram':
+            return [a + b for a, b in zip(own, exited)]
+        if metric.mode == 'max':
+            return own if own[0] >= exited[0] else exited
+        if metric.mode == 'last':
+            return own if own[1] >= exited[1] else exited
+        return own
+
+    def merged(self):
+        """Values of every metric, merged across processes: (name, labels) -> value"""
+        merged = {}
+        gauge_times = {}
+        for pid, values in self._process_values():
+            alive = None
+            for key, value in values.items():
+                metric = self._metrics.get(key[0])
+                if metric is None:
+                    continue
+                if metric.type == 'counter':
+                    merged[key] = merged.get(key, 0) + value
+                elif metric.type == 'histogram':
+                    previous = merged.get(key)
+                    merged[key] = [a + b for a, b in zip(previous, value)] if previous else list(value)
+                elif metric.mode == 'livesum':
+                    if alive is None:
+                        alive = pid == os.getpid() or self._alive(pid)
+                    if alive:
+                        merged[key] = merged.get(key, 0) + value[0]
+                elif metric.mode == 'max':
+                    merged[key] = max(merged.get(key, -math.inf), value[0])
+                elif value[1] >= gauge_times.get(key, 0):  # 'last'
+                    merged[key] = value[0]
+                    gauge_times[key] = value[1]
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        now = time.monotonic()
+        if self._last_collect is None or now - self._last_collect >= self.COLLECT_INTERVAL:
+            self._last_collect = now
+            for collect in self._collectors:
+                try:
+                    collect()
+                except Exception as e:
+                    logger.error("Error collecting metrics: %s", e)
+
+        merged = self.merged()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for (metric_name, labels), value in sorted(item for item in merged.items() if item[0][0] == name):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.type != 'histogram':
+                    lines.append(f'{name}{_labels(pairs)} {_number(value)}')
+                    continue
+                for bound, count in zip(metric.buckets, value):
+                    lines.append(f'{name}_bucket{_labels(pairs + [("le", _number(bound))])} {count}')
+                lines.append(f'{name}_bucket{_labels(pairs + [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{_labels(pairs)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(pairs)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
+
+
+# Firestore
+FIRESTORE_READS = REGISTRY.counter(
+    'firestore_document_reads_total', 'Firestore document reads, as billed', ['collection'])
+FIRESTORE_RPCS = REGISTRY.counter(
+    'firestore_rpcs_total', 'Firestore calls by operation', ['collection', 'op'])
+FIRESTORE_RETRIES = REGISTRY.counter(
+    'firestore_retries_total', 'Firestore calls retried after a quota or deadline error')
+FIRESTORE_QUOTA_ERRORS = REGISTRY.counter(
+    'firestore_quota_errors_total', 'Firestore quota (ResourceExhausted) and deadline errors', ['error'])
+FIRESTORE_AVAILABLE = REGISTRY.gauge(
+    'firestore_available', 'Whether the Firestore backend was available at the last call (1) or not (0)')
+FIRESTORE_CACHE_ONLY = REGISTRY.gauge(
+    'firestore_cache_only', 'Whether a used-up read budget restricts Firestore reads to the cache (1) or not (0)')
+
+# Cache
+CACHE_REQUESTS = REGISTRY.counter('cache_requests_total', 'Cache lookups by result', ['cache', 'result'])
+CACHE_EVICTIONS = REGISTRY.counter('cache_evictions_total', 'Cache entries culled to make room', ['cache'])
+
+# Sync
+SYNC_DOCUMENTS = REGISTRY.counter(
+    'sync_documents_total', 'Documents written by syncs, by result', ['collection', 'result'])
+SYNC_DOCS_PER_SECOND = REGISTRY.gauge(
+    'sync_documents_per_second', 'Throughput of the latest sync of a collection', ['collection'])
+SYNC_BATCH_SECONDS = REGISTRY.histogram(
+    'sync_batch_commit_seconds', 'Time to write and commit one sync batch', ['target'])
+SYNC_LAST_AGE = REGISTRY.gauge(
+    'sync_last_age_seconds', 'Seconds since a synced model was last written', ['model'])
+
+# Queues
+QUEUE_DEPTH = REGISTRY.gauge('queue_depth', 'Items waiting in an in-process queue', ['queue'], mode='livesum')
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    'log_records_dropped_total', 'Log records dropped because the logging queue was full')
+
+
+@REGISTRY.collector
+def collect_sync_age():
+    from django.utils import timezone
+    from .models import CollectionStats
+
+    now = timezone.now()
+    for label, synced_at in CollectionStats.objects.exclude(last_synced_at=None).values_list(
+        'model_label', 'last_synced_at'
+    ):
+        SYNC_LAST_AGE.set(round((now - synced_at).total_seconds(), 3), model=label)
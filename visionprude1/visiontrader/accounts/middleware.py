@@ -0,0 +1,105 @@
+"""
+Request middleware for the accounts app
+"""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .query_budget import QueryBudgetChecker, QueryBudgetExceeded, track_usage
+from .query_shapes import QueryShapeRecorder, query_shape_wrapper
+from .read_quota import ReadQuota
+from .request_profile import RequestProfile, install_template_timing
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryShapeMiddleware:
+    """Record the shape and timing of every SQL statement run by a request"""
+
+    def __init__(self, get_response):
+        if not QueryShapeRecorder.is_enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with connection.execute_wrapper(query_shape_wrapper):
+            return self.get_response(request)
+
+
+class QueryBudgetMiddleware:
+    """
+    Check every request against its view's query budget (see accounts.query_budget)
+
+    Enabled by settings.QUERY_BUDGET_MODE: 'warn' logs the report of a view
+    that went over, 'raise' fails the request with it.
+    """
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', None)
+        if self.mode not in ('warn', 'raise'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.checker = QueryBudgetChecker()
+
+    def __call__(self, request):
+        with track_usage() as usage:
+            response = self.get_response(request)
+        if response.streaming:
+            # Most of a streamed response's work happens after this returns
+            return response
+
+        report = self.checker.check(request, usage)
+        if report:
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(report)
+            logger.warning(report, extra={'path': request.path})
+        return response
+
+
+class RequestProfileMiddleware:
+    """
+    Profile a sample of requests (see accounts.request_profile)
+
+    Sampled requests get a Server-Timing header with the SQL, Firestore,
+    rate-limit, template and cache breakdown, and a JSON line on the
+    accounts.request_profile logger. Enabled by settings.REQUEST_PROFILE_SAMPLE_RATE.
+    """
+
+    def __init__(self, get_response):
+        if not RequestProfile.sample_rate():
+            raise MiddlewareNotUsed()
+        install_template_timing()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not RequestProfile.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        with profile.active():
+            response = self.get_response(request)
+        # For a streamed response this covers the work done before streaming starts
+        response['Server-Timing'] = profile.server_timing()
+        profile.log(request, response)
+        return response
+
+
+class FirestoreCallerMiddleware:
+    """Attribute the Firestore reads of a request to its view in the read ledger (see accounts.read_quota)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        token = getattr(request, '_firestore_caller_token', None)
+        if token is not None:
+            ReadQuota.reset_caller(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        request._firestore_caller_token = ReadQuota.set_caller(f'view:{match.view_name or match._func_path}')
@@ -0,0 +1,151 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_appnotification_course_fcmtoken_firebaseuser_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appnotification',
+            index=models.Index(fields=['synced_at', 'id'], name='appnotif_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appnotification',
+            index=models.Index(fields=['created_at'], name='appnotif_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['synced_at', 'id'], name='course_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at'], name='course_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fcmtoken',
+            index=models.Index(fields=['synced_at', 'id'], name='fcm_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fcmtoken',
+            index=models.Index(fields=['last_used'], name='fcm_last_used_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fcmtoken',
+            index=models.Index(fields=['firebase_user_id', 'is_active'], name='fcm_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='firebaseuser',
+            index=models.Index(fields=['synced_at', 'id'], name='fbuser_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='firebaseuser',
+            index=models.Index(fields=['created_at'], name='fbuser_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignal',
+            index=models.Index(fields=['synced_at', 'id'], name='signal_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignal',
+            index=models.Index(fields=['signal_date'], name='signal_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignal',
+            index=models.Index(fields=['status', 'signal_date'], name='signal_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalpayment',
+            index=models.Index(fields=['synced_at', 'id'], name='payment_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalpayment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalpayment',
+            index=models.Index(fields=['firebase_user_id', 'payment_date'], name='payment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalpayment',
+            index=models.Index(fields=['status', 'payment_date'], name='payment_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalsubscription',
+            index=models.Index(fields=['synced_at', 'id'], name='subscription_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalsubscription',
+            index=models.Index(fields=['start_date'], name='subscription_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalsubscription',
+            index=models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='premiumsignalsubscription',
+            index=models.Index(fields=['firebase_user_id', 'status'], name='subscription_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['synced_at', 'id'], name='purchase_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['firebase_user_id', 'purchase_date'], name='purchase_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['status', 'purchase_date'], name='purchase_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalnotification',
+            index=models.Index(fields=['synced_at', 'id'], name='notif_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalnotification',
+            index=models.Index(fields=['notification_date'], name='notif_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalnotification',
+            index=models.Index(fields=['read', 'notification_date'], name='notif_read_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalnotification',
+            index=models.Index(fields=['firebase_user_id', 'notification_date'], name='notif_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['synced_at', 'id'], name='testimonial_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['created_at'], name='testimonial_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['firebase_user_id'], name='testimonial_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['synced_at', 'id'], name='progress_synced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['last_activity'], name='progress_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['firebase_user_id', 'last_activity'], name='progress_user_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:33
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    RevenueRollup = apps.get_model('accounts', 'RevenueRollup')
+    sources = [
+        ('purchase', apps.get_model('accounts', 'Purchase'), 'purchase_date', 'product_name'),
+        ('premium_payment', apps.get_model('accounts', 'PremiumSignalPayment'), 'payment_date', 'signal_type'),
+    ]
+
+    for source, model, date_field, dimension_field in sources:
+        rows = (
+            model.objects.order_by()
+            .annotate(day=TruncDate(date_field))
+            .values('day', dimension_field, 'status')
+            .annotate(count=Count('id'), amount_count=Count('amount'), amount_total=Sum('amount'), paid_total=Sum('paid'))
+        )
+        RevenueRollup.objects.bulk_create([
+            RevenueRollup(
+                source=source, day=row['day'], dimension=row[dimension_field] or '', status=row['status'] or '',
+                count=row['count'], amount_count=row['amount_count'],
+                amount_total=row['amount_total'] or 0, paid_total=row['paid_total'] or 0,
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_dashboard_snapshot_record'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('purchase', 'Purchase'), ('premium_payment', 'Premium Signal Payment')], max_length=20)),
+                ('day', models.DateField(blank=True, help_text='Day of the purchase/payment (null if undated)', null=True)),
+                ('dimension', models.CharField(blank=True, help_text='Product name or signal type', max_length=255)),
+                ('status', models.CharField(blank=True, max_length=50)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount_count', models.BigIntegerField(default=0, help_text='Rows with a non-null amount (for averages)')),
+                ('amount_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('paid_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'verbose_name': 'Revenue Rollup',
+                'verbose_name_plural': 'Revenue Rollups',
+                'ordering': ['source', 'day'],
+                'constraints': [models.UniqueConstraint(fields=('source', 'day', 'dimension', 'status'), name='revenue_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
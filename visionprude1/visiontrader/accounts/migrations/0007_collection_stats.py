@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:34
+
+from django.db import migrations, models
+
+
+SYNCED_MODELS = [
+    'Purchase', 'PremiumSignalPayment', 'SignalNotification', 'UserProgress',
+    'PremiumSignal', 'PremiumSignalSubscription', 'Course', 'FCMToken',
+    'AppNotification', 'Testimonial', 'FirebaseUser',
+]
+
+
+def backfill_counts(apps, schema_editor):
+    CollectionStats = apps.get_model('accounts', 'CollectionStats')
+    for name in SYNCED_MODELS:
+        model = apps.get_model('accounts', name)
+        CollectionStats.objects.create(
+            model_label=f'accounts.{name.lower()}',
+            row_count=model.objects.count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_label', models.CharField(help_text='app_label.model_name', max_length=100, unique=True)),
+                ('row_count', models.BigIntegerField(default=0)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_remote_watermark', models.DateTimeField(blank=True, help_text='Latest remote update time seen', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Collection Stats',
+                'verbose_name_plural': 'Collection Stats',
+                'ordering': ['model_label'],
+            },
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
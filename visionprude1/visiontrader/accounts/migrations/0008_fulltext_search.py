@@ -0,0 +1,92 @@
+# Text indexes for model_list_view searches: MySQL FULLTEXT indexes, or FTS5
+# external-content tables kept in sync by triggers on SQLite. Other backends
+# keep searching with LIKE.
+
+from django.db import migrations
+
+
+SEARCH_FIELDS = {
+    'accounts_purchase': ['firebase_user_id', 'product_name', 'status', 'description'],
+    'accounts_premiumsignalpayment': ['firebase_user_id', 'signal_type', 'status', 'payment_method'],
+    'accounts_signalnotification': ['firebase_user_id', 'title', 'message'],
+    'accounts_userprogress': ['firebase_user_id'],
+    'accounts_premiumsignal': ['symbol', 'signal_type', 'status', 'title', 'description'],
+    'accounts_premiumsignalsubscription': ['firebase_user_id', 'subscription_type', 'status'],
+    'accounts_course': ['title', 'instructor', 'description'],
+    'accounts_fcmtoken': ['firebase_user_id', 'platform'],
+    'accounts_appnotification': ['title', 'message', 'notification_type', 'target_audience'],
+    'accounts_testimonial': ['author_name', 'author_email', 'content'],
+    'accounts_firebaseuser': ['email', 'display_name'],
+}
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_text_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'mysql':
+        for table, fields in SEARCH_FIELDS.items():
+            schema_editor.execute(
+                f"ALTER TABLE `{table}` ADD FULLTEXT INDEX `{table}_fulltext` "
+                f"({', '.join(f'`{field}`' for field in fields)})"
+            )
+
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            if not sqlite_has_fts5(cursor):
+                return
+
+        for table, fields in SEARCH_FIELDS.items():
+            columns = ', '.join(fields)
+            new_values = ', '.join(f'new.{field}' for field in fields)
+            old_values = ', '.join(f'old.{field}' for field in fields)
+            fts = f'{table}_fts'
+
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', content_rowid='id')"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            )
+            # Index the rows that already exist
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_text_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+
+    if connection.vendor == 'mysql':
+        for table in SEARCH_FIELDS:
+            schema_editor.execute(f"ALTER TABLE `{table}` DROP INDEX `{table}_fulltext`")
+
+    elif connection.vendor == 'sqlite':
+        for table in SEARCH_FIELDS:
+            fts = f'{table}_fts'
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_collection_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_text_indexes, drop_text_indexes),
+    ]
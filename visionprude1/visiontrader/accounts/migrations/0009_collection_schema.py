@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionSchemaRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=200, unique=True)),
+                ('version', models.PositiveIntegerField(default=1, help_text='Incremented whenever fields or types change')),
+                ('fields', models.JSONField(default=dict, help_text='Field name -> position, type counts, present and null counts')),
+                ('document_count', models.PositiveIntegerField(default=0, help_text='Documents the statistics are based on')),
+                ('sampled', models.BooleanField(default=False, help_text='Whether the statistics come from a sample')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Collection Schema',
+                'verbose_name_plural': 'Collection Schemas',
+                'ordering': ['collection'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:45
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_collection_schema'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MirroredDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=200)),
+                ('firebase_id', models.CharField(max_length=200)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Document fields as JSON')),
+                ('content_hash', models.CharField(help_text='SHA-256 of the canonical JSON payload', max_length=64)),
+                ('remote_updated_at', models.DateTimeField(blank=True, help_text='Remote update time, if the document has one', null=True)),
+                ('field_1', models.CharField(blank=True, max_length=255)),
+                ('field_2', models.CharField(blank=True, max_length=255)),
+                ('field_3', models.CharField(blank=True, max_length=255)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Mirrored Document',
+                'verbose_name_plural': 'Mirrored Documents',
+                'ordering': ['collection', 'firebase_id'],
+                'indexes': [models.Index(fields=['collection', 'synced_at', 'id'], name='mirror_coll_synced_idx'), models.Index(fields=['collection', 'field_1'], name='mirror_coll_field1_idx'), models.Index(fields=['collection', 'field_2'], name='mirror_coll_field2_idx'), models.Index(fields=['collection', 'field_3'], name='mirror_coll_field3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('collection', 'firebase_id'), name='mirrored_document_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_last_changed(apps, schema_editor):
+    # Until now every sync rewrote its rows, so the last sync is the last change
+    CollectionStats = apps.get_model('accounts', 'CollectionStats')
+    CollectionStats.objects.filter(last_synced_at__isnull=False).update(
+        generation=1, last_changed_at=F('last_synced_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_mirrored_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collectionstats',
+            name='generation',
+            field=models.BigIntegerField(default=0, help_text='Incremented by every sync batch that wrote rows'),
+        ),
+        migrations.AddField(
+            model_name='collectionstats',
+            name='last_changed_at',
+            field=models.DateTimeField(blank=True, help_text='When a sync last wrote rows', null=True),
+        ),
+        migrations.RunPython(backfill_last_changed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:50
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_collection_stats_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='sync_completed or new_data', max_length=50)),
+                ('collection', models.CharField(blank=True, max_length=200)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Sync Event',
+                'verbose_name_plural': 'Sync Events',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_sync_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=200, unique=True)),
+                ('interval_seconds', models.PositiveIntegerField(help_text='Current time between syncs')),
+                ('change_rate', models.FloatField(default=0, help_text='Smoothed changed documents per hour')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('next_run_at', models.DateTimeField(db_index=True)),
+                ('last_reads', models.PositiveIntegerField(default=0, help_text='Documents read by the last sync')),
+                ('last_changed', models.PositiveIntegerField(default=0, help_text='Documents changed since the sync before it')),
+                ('read_log', models.JSONField(default=list, help_text='[timestamp, reads] of the syncs in the last hour')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sync Schedule',
+                'verbose_name_plural': 'Sync Schedules',
+                'ordering': ['next_run_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_sync_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirestoreReadLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField(help_text='Hour of the day (UTC)')),
+                ('collection', models.CharField(max_length=200)),
+                ('caller', models.CharField(help_text="'view:<url name>', 'command:<name>' or the process", max_length=200)),
+                ('reads', models.BigIntegerField(default=0)),
+                ('calls', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Firestore Read Ledger',
+                'verbose_name_plural': 'Firestore Read Ledger',
+                'ordering': ['-day', '-hour', '-reads'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'hour', 'collection', 'caller'), name='read_ledger_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:16
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_firestore_read_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncDeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=200)),
+                ('document_id', models.CharField(max_length=255)),
+                ('error_class', models.CharField(max_length=200)),
+                ('error_message', models.TextField(blank=True)),
+                ('content_hash', models.CharField(help_text='SHA-256 of the document content that failed', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=1)),
+                ('document', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='The document as it failed')),
+                ('first_failed_at', models.DateTimeField(auto_now_add=True)),
+                ('last_failed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sync Dead Letter',
+                'verbose_name_plural': 'Sync Dead Letters',
+                'ordering': ['collection', '-last_failed_at'],
+                'constraints': [models.UniqueConstraint(fields=('collection', 'document_id'), name='dead_letter_key')],
+            },
+        ),
+    ]
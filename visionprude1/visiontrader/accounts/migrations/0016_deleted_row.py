@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_sync_dead_letter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_label', models.CharField(help_text='app_label.model_name of the deleted row', max_length=100)),
+                ('row_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Deleted Row',
+                'verbose_name_plural': 'Deleted Rows',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['model_label', 'id'], name='deleted_row_model_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_deleted_row'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncschedule',
+            name='consecutive_failures',
+            field=models.PositiveIntegerField(default=0, help_text='Failed syncs since the last success'),
+        ),
+    ]
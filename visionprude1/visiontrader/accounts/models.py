@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -86,6 +87,12 @@ class Purchase(models.Model):
         ordering = ['-purchase_date']
         verbose_name = "Purchase"
         verbose_name_plural = "Purchases"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='purchase_synced_idx'),
+            models.Index(fields=['purchase_date'], name='purchase_date_idx'),
+            models.Index(fields=['firebase_user_id', 'purchase_date'], name='purchase_user_date_idx'),
+            models.Index(fields=['status', 'purchase_date'], name='purchase_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"Purchase {self.firebase_id} - {self.amount}"
@@ -116,6 +123,12 @@ class PremiumSignalPayment(models.Model):
         ordering = ['-payment_date']
         verbose_name = "Premium Signal Payment"
         verbose_name_plural = "Premium Signal Payments"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='payment_synced_idx'),
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+            models.Index(fields=['firebase_user_id', 'payment_date'], name='payment_user_date_idx'),
+            models.Index(fields=['status', 'payment_date'], name='payment_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"Payment {self.firebase_id} - {self.amount}"
@@ -146,6 +159,12 @@ class SignalNotification(models.Model):
         ordering = ['-notification_date']
         verbose_name = "Signal Notification"
         verbose_name_plural = "Signal Notifications"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='notif_synced_idx'),
+            models.Index(fields=['notification_date'], name='notif_date_idx'),
+            models.Index(fields=['read', 'notification_date'], name='notif_read_date_idx'),
+            models.Index(fields=['firebase_user_id', 'notification_date'], name='notif_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"Notification {self.firebase_id} - {self.title}"
@@ -172,6 +191,11 @@ class UserProgress(models.Model):
         ordering = ['-last_activity']
         verbose_name = "User Progress"
         verbose_name_plural = "User Progress"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='progress_synced_idx'),
+            models.Index(fields=['last_activity'], name='progress_activity_idx'),
+            models.Index(fields=['firebase_user_id', 'last_activity'], name='progress_user_activity_idx'),
+        ]
 
     def __str__(self):
         return f"Progress {self.firebase_id} - {self.total_completed} completed"
@@ -202,6 +226,11 @@ class PremiumSignal(models.Model):
         ordering = ['-signal_date']
         verbose_name = "Premium Signal"
         verbose_name_plural = "Premium Signals"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='signal_synced_idx'),
+            models.Index(fields=['signal_date'], name='signal_date_idx'),
+            models.Index(fields=['status', 'signal_date'], name='signal_status_date_idx'),
+        ]
 
     def __str__(self):
         return f"Signal {self.firebase_id} - {self.symbol}"
@@ -229,6 +258,12 @@ class PremiumSignalSubscription(models.Model):
         ordering = ['-start_date']
         verbose_name = "Premium Signal Subscription"
         verbose_name_plural = "Premium Signal Subscriptions"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='subscription_synced_idx'),
+            models.Index(fields=['start_date'], name='subscription_start_idx'),
+            models.Index(fields=['status', 'end_date'], name='subscription_status_end_idx'),
+            models.Index(fields=['firebase_user_id', 'status'], name='subscription_user_status_idx'),
+        ]
 
     def __str__(self):
         return f"Subscription {self.firebase_id} - {self.subscription_type}"
@@ -261,6 +296,10 @@ class Course(models.Model):
         ordering = ['-created_at']
         verbose_name = "Course"
         verbose_name_plural = "Courses"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='course_synced_idx'),
+            models.Index(fields=['created_at'], name='course_created_idx'),
+        ]
 
     def __str__(self):
         return f"Course {self.firebase_id} - {self.title}"
@@ -286,6 +325,11 @@ class FCMToken(models.Model):
         ordering = ['-last_used']
         verbose_name = "FCM Token"
         verbose_name_plural = "FCM Tokens"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='fcm_synced_idx'),
+            models.Index(fields=['last_used'], name='fcm_last_used_idx'),
+            models.Index(fields=['firebase_user_id', 'is_active'], name='fcm_user_active_idx'),
+        ]
 
     def __str__(self):
         return f"Token {self.firebase_id[:20]}..."
@@ -315,6 +359,10 @@ class AppNotification(models.Model):
         ordering = ['-created_at']
         verbose_name = "App Notification"
         verbose_name_plural = "App Notifications"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='appnotif_synced_idx'),
+            models.Index(fields=['created_at'], name='appnotif_created_idx'),
+        ]
 
     def __str__(self):
         return f"Notification {self.firebase_id} - {self.title}"
@@ -343,6 +391,11 @@ class Testimonial(models.Model):
         ordering = ['-created_at']
         verbose_name = "Testimonial"
         verbose_name_plural = "Testimonials"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='testimonial_synced_idx'),
+            models.Index(fields=['created_at'], name='testimonial_created_idx'),
+            models.Index(fields=['firebase_user_id'], name='testimonial_user_idx'),
+        ]
 
     def __str__(self):
         return f"Testimonial by {self.author_name}"
@@ -372,6 +425,224 @@ class FirebaseUser(models.Model):
         ordering = ['-created_at']
         verbose_name = "Firebase User"
         verbose_name_plural = "Firebase Users"
+        indexes = [
+            models.Index(fields=['synced_at', 'id'], name='fbuser_synced_idx'),
+            models.Index(fields=['created_at'], name='fbuser_created_idx'),
+        ]
 
     def __str__(self):
         return f"User {self.email or self.firebase_id}"
+
+
+class DashboardSnapshotRecord(models.Model):
+    """Persisted copy of the cached dashboard statistics snapshot"""
+    key = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Dashboard Snapshot"
+        verbose_name_plural = "Dashboard Snapshots"
+
+    def __str__(self):
+        return f"Snapshot {self.key} at {self.computed_at}"
+
+
+class RevenueRollup(models.Model):
+    """Daily revenue totals per product/signal type and status, maintained by the sync"""
+    SOURCE_CHOICES = [
+        ('purchase', 'Purchase'),
+        ('premium_payment', 'Premium Signal Payment'),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    day = models.DateField(null=True, blank=True, help_text="Day of the purchase/payment (null if undated)")
+    dimension = models.CharField(max_length=255, blank=True, help_text="Product name or signal type")
+    status = models.CharField(max_length=50, blank=True)
+
+    count = models.BigIntegerField(default=0)
+    amount_count = models.BigIntegerField(default=0, help_text="Rows with a non-null amount (for averages)")
+    amount_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['source', 'day']
+        verbose_name = "Revenue Rollup"
+        verbose_name_plural = "Revenue Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'day', 'dimension', 'status'], name='revenue_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.day} {self.dimension} {self.status}: {self.amount_total}"
+
+
+class CollectionStats(models.Model):
+    """Row count and freshness of a synced model, maintained by the sync writer"""
+    model_label = models.CharField(max_length=100, unique=True, help_text="app_label.model_name")
+    row_count = models.BigIntegerField(default=0)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_remote_watermark = models.DateTimeField(null=True, blank=True, help_text="Latest remote update time seen")
+    generation = models.BigIntegerField(default=0, help_text="Incremented by every sync batch that wrote rows")
+    last_changed_at = models.DateTimeField(null=True, blank=True, help_text="When a sync last wrote rows")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['model_label']
+        verbose_name = "Collection Stats"
+        verbose_name_plural = "Collection Stats"
+
+    def __str__(self):
+        return f"{self.model_label}: {self.row_count} rows"
+
+
+class CollectionSchemaRecord(models.Model):
+    """Inferred union schema of a Firestore collection, versioned on every shape change"""
+    collection = models.CharField(max_length=200, unique=True)
+    version = models.PositiveIntegerField(default=1, help_text="Incremented whenever fields or types change")
+    fields = models.JSONField(default=dict, help_text="Field name -> position, type counts, present and null counts")
+    document_count = models.PositiveIntegerField(default=0, help_text="Documents the statistics are based on")
+    sampled = models.BooleanField(default=False, help_text="Whether the statistics come from a sample")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['collection']
+        verbose_name = "Collection Schema"
+        verbose_name_plural = "Collection Schemas"
+
+    def __str__(self):
+        return f"{self.collection} v{self.version} ({len(self.fields)} fields)"
+
+
+class MirroredDocument(models.Model):
+    """Local copy of a document from a collection that has no dedicated model"""
+    collection = models.CharField(max_length=200)
+    firebase_id = models.CharField(max_length=200)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder, help_text="Document fields as JSON")
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the canonical JSON payload")
+    remote_updated_at = models.DateTimeField(null=True, blank=True, help_text="Remote update time, if the document has one")
+    # Values of the fields configured in MIRROR_EXTRACTED_FIELDS, copied out of `data` so they can be indexed
+    field_1 = models.CharField(max_length=255, blank=True)
+    field_2 = models.CharField(max_length=255, blank=True)
+    field_3 = models.CharField(max_length=255, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['collection', 'firebase_id']
+        verbose_name = "Mirrored Document"
+        verbose_name_plural = "Mirrored Documents"
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'firebase_id'], name='mirrored_document_key'),
+        ]
+        indexes = [
+            models.Index(fields=['collection', 'synced_at', 'id'], name='mirror_coll_synced_idx'),
+            models.Index(fields=['collection', 'field_1'], name='mirror_coll_field1_idx'),
+            models.Index(fields=['collection', 'field_2'], name='mirror_coll_field2_idx'),
+            models.Index(fields=['collection', 'field_3'], name='mirror_coll_field3_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.collection}/{self.firebase_id}"
+
+
+class SyncEvent(models.Model):
+    """Sync notification pushed to open data pages (see accounts.sync_events)"""
+    kind = models.CharField(max_length=50, help_text="sync_completed or new_data")
+    collection = models.CharField(max_length=200, blank=True)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Sync Event"
+        verbose_name_plural = "Sync Events"
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.collection}"
+
+
+class SyncSchedule(models.Model):
+    """Adaptive sync cadence of a collection, maintained by accounts.sync_scheduler"""
+    collection = models.CharField(max_length=200, unique=True)
+    interval_seconds = models.PositiveIntegerField(help_text="Current time between syncs")
+    change_rate = models.FloatField(default=0, help_text="Smoothed changed documents per hour")
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    next_run_at = models.DateTimeField(db_index=True)
+    last_reads = models.PositiveIntegerField(default=0, help_text="Documents read by the last sync")
+    last_changed = models.PositiveIntegerField(default=0, help_text="Documents changed since the sync before it")
+    read_log = models.JSONField(default=list, help_text="[timestamp, reads] of the syncs in the last hour")
+    consecutive_failures = models.PositiveIntegerField(default=0, help_text="Failed syncs since the last success")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_run_at']
+        verbose_name = "Sync Schedule"
+        verbose_name_plural = "Sync Schedules"
+
+    def __str__(self):
+        return f"{self.collection} every {self.interval_seconds}s"
+
+
+class FirestoreReadLedger(models.Model):
+    """Billed Firestore document reads of one hour, by collection and caller (see accounts.read_quota)"""
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField(help_text="Hour of the day (UTC)")
+    collection = models.CharField(max_length=200)
+    caller = models.CharField(max_length=200, help_text="'view:<url name>', 'command:<name>' or the process")
+    reads = models.BigIntegerField(default=0)
+    calls = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-day', '-hour', '-reads']
+        verbose_name = "Firestore Read Ledger"
+        verbose_name_plural = "Firestore Read Ledger"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'hour', 'collection', 'caller'], name='read_ledger_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.hour:02d}h {self.caller} {self.collection}: {self.reads} reads"
+
+
+class SyncDeadLetter(models.Model):
+    """A document that failed to sync, skipped until its content changes (see accounts.dead_letters)"""
+    collection = models.CharField(max_length=200)
+    document_id = models.CharField(max_length=255)
+    error_class = models.CharField(max_length=200)
+    error_message = models.TextField(blank=True)
+    content_hash = models.CharField(max_length=64, help_text="SHA-256 of the document content that failed")
+    attempts = models.PositiveIntegerField(default=1)
+    document = models.JSONField(default=dict, encoder=DjangoJSONEncoder, help_text="The document as it failed")
+    first_failed_at = models.DateTimeField(auto_now_add=True)
+    last_failed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['collection', '-last_failed_at']
+        verbose_name = "Sync Dead Letter"
+        verbose_name_plural = "Sync Dead Letters"
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'document_id'], name='dead_letter_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.collection}/{self.document_id}: {self.error_class} ({self.attempts} attempts)"
+
+
+class DeletedRow(models.Model):
+    """Id of a synced row deleted since the last columnar export of its model (see accounts.columnar)"""
+    model_label = models.CharField(max_length=100, help_text="app_label.model_name of the deleted row")
+    row_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Deleted Row"
+        verbose_name_plural = "Deleted Rows"
+        indexes = [
+            models.Index(fields=['model_label', 'id'], name='deleted_row_model_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label} #{self.row_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,240 @@
+"""
+Numeric Summary Engine
+Summarizes every numeric field of a Firestore collection payload (sum, count,
+mean, min, max, null rate): one pass over the documents fills a typed float
+column per field, which NumPy reduces in place
+"""
+import math
+from array import array
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Avg, Count, Max, Min, Sum
+
+try:
+    import numpy as np
+except ImportError:  # optional, the pure Python path gives the same results
+    np = None
+
+
+class NumericSummary:
+    """Per-field numeric statistics for a list of documents"""
+
+    # A field counts as numeric when at least this share of its non-empty values
+    # are real numbers (numeric strings are still summed once a field qualifies)
+    NUMERIC_SHARE = 0.5
+
+    # Keys that look numeric but are identifiers
+    EXCLUDED_FIELDS = {'id', 'uid', 'userId', 'user_id'}
+
+    CACHE_TIMEOUT = 60  # matches FirebaseService.CACHE_TIMEOUT_DATA
+
+    @staticmethod
+    def cache_key(collection_name):
+        return f'firebase_collection_{collection_name}_summary'
+
+    @staticmethod
+    def _to_float(value):
+        """Float value of a number or numeric string, None otherwise"""
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float, Decimal)):
+            value = float(value)
+        elif isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                return None
+        else:
+            return None
+        return value if math.isfinite(value) else None
+
+    @classmethod
+    def _columns(cls, documents, fields=None):
+        """
+        Single pass over the documents, appending each numeric value to its field's column
+
+        Columns are typed float buffers (array('d')), which NumPy reads without
+        copying. Plain ints and floats skip the conversion; non-finite values are
+        dropped when the columns are reduced.
+
+        Args:
+            fields (list): Known numeric fields (detected from the values if None)
+
+        Returns:
+            dict: Field name -> array('d') of its numeric values
+        """
+        columns = {}
+        typed = {}
+        non_empty = {}
+        known = set(fields) if fields is not None else None
+        excluded = cls.EXCLUDED_FIELDS
+
+        for doc in documents:
+            for field, value in doc.items():
+                if known is not None and field not in known:
+                    continue
+                if value is None or value == '' or field in excluded:
+                    continue
+                non_empty[field] = non_empty.get(field, 0) + 1
+
+                kind = type(value)
+                if kind is float or kind is int:
+                    number = value
+                    typed[field] = typed.get(field, 0) + 1
+                else:
+                    number = cls._to_float(value)
+                    if number is None:
+                        continue
+                    if kind is not str:
+                        typed[field] = typed.get(field, 0) + 1
+
+                column = columns.get(field)
+                if column is None:
+                    column = columns[field] = array('d')
+                column.append(number)
+
+        if known is not None:
+            return columns
+        return {
+            field: column for field, column in columns.items()
+            if typed.get(field, 0) >= non_empty[field] * cls.NUMERIC_SHARE
+        }
+
+    @staticmethod
+    def _reduce(column):
+        """(sum, count, min, max) of the finite values of a column, or None if it has none"""
+        if np is not None:
+            values = np.frombuffer(column, dtype=np.float64)
+            finite = np.isfinite(values)
+            if not finite.all():
+                values = values[finite]
+            if not values.size:
+                return None
+            return float(values.sum()), int(values.size), float(values.min()), float(values.max())
+
+        values = [value for value in column if math.isfinite(value)]
+        if not values:
+            return None
+        return math.fsum(values), len(values), min(values), max(values)
+
+    @classmethod
+    def summarize(cls, documents, fields=None):
+        """
+        Compute the summary of every numeric field
+
+        Args:
+            documents (list): Document dicts as returned by FirebaseService.get_collection
+            fields (list): Numeric fields from the collection's inferred schema
+                (detected from the documents if None)
+
+        Returns:
+            dict: Display name -> {'field', 'sum', 'count', 'mean', 'min', 'max', 'null_rate'},
+                  ordered by field name
+        """
+        total_docs = len(documents)
+        summary = {}
+        if not total_docs:
+            return summary
+
+        for field, column in sorted(cls._columns(documents, fields).items()):
+            reduced = cls._reduce(column)
+            if reduced is None:
+                continue
+            total, count, minimum, maximum = reduced
+            summary[field.replace('_', ' ').title()] = {
+                'field': field,
+                'sum': total,
+                'count': count,
+                'mean': total / count,
+                'min': minimum,
+                'max': maximum,
+                'null_rate': (total_docs - count) / total_docs,
+            }
+        return summary
+
+    @classmethod
+    def model_fields(cls, model):
+        """Names of a model's numeric columns that aggregate() summarizes"""
+        return [
+            field.name for field in model._meta.concrete_fields
+            if isinstance(field, (models.IntegerField, models.FloatField, models.DecimalField))
+            and not field.primary_key and not field.is_relation and field.name not in cls.EXCLUDED_FIELDS
+        ]
+
+    @classmethod
+    def aggregate(cls, model):
+        """
+        Summary of a model's numeric columns, computed by the database (one query)
+
+        Returns:
+            dict: Same shape as summarize(), keyed by the model's field names
+        """
+        fields = cls.model_fields(model)
+        if not fields:
+            return {}
+
+        aggregates = {'rows': Count('pk')}
+        for field in fields:
+            aggregates.update({
+                f'{field}__sum': Sum(field), f'{field}__count': Count(field), f'{field}__mean': Avg(field),
+                f'{field}__min': Min(field), f'{field}__max': Max(field),
+            })
+        values = model.objects.aggregate(**aggregates)
+
+        total_docs = values['rows']
+        summary = {}
+        for field in sorted(fields):
+            count = values[f'{field}__count']
+            if not count:
+                continue
+            summary[field.replace('_', ' ').title()] = {
+                'field': field,
+                'sum': float(values[f'{field}__sum']),
+                'count': count,
+                'mean': float(values[f'{field}__mean']),
+                'min': float(values[f'{field}__min']),
+                'max': float(values[f'{field}__max']),
+                'null_rate': (total_docs - count) / total_docs,
+            }
+        return summary
+
+    @classmethod
+    def for_collection(cls, collection_name, documents, use_cache=True, fields=None):
+        """
+        Summary of a collection payload, cached alongside it
+
+        FirebaseService drops the cached summary whenever it caches a new payload
+        for the collection, and SchemaInference whenever the collection's schema
+        version changes (so its numeric fields may have), so the summary never
+        disagrees with either.
+
+        Args:
+            documents (list | callable): The documents, or a function returning
+                them that is only called when the summary isn't cached
+        """
+        key = cls.cache_key(collection_name)
+        if use_cache:
+            summary = cache.get(key)
+            if summary is not None:
+                return summary
+
+        if callable(documents):
+            documents = documents()
+        summary = cls.summarize(documents, fields)
+        cache.set(key, summary, cls.CACHE_TIMEOUT)
+        return summary
+
+    @classmethod
+    def for_model(cls, collection_name, model, use_cache=True):
+        """Summary of a collection synced into a model, cached like for_collection()"""
+        key = cls.cache_key(collection_name)
+        if use_cache:
+            summary = cache.get(key)
+            if summary is not None:
+                return summary
+
+        summary = cls.aggregate(model)
+        cache.set(key, summary, cls.CACHE_TIMEOUT)
+        return summary
@@ -0,0 +1,167 @@
+"""
+Keyset Pagination
+Seek-based pagination over (synced_at, id) so deep pages cost the same as
+the first one, plus cheap approximate totals for filtered querysets
+"""
+import base64
+import json
+import logging
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset (iterable like Django's Page)"""
+
+    def __init__(self, object_list, start_index, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._start_index = start_index
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def start_index(self):
+        return self._start_index
+
+    def end_index(self):
+        if self._start_index is None:
+            return None
+        return self._start_index + len(self.object_list) - 1
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest-first by (synced_at, id) using opaque cursors
+
+    A cursor encodes the sort key of the row it continues from, the direction
+    and the 1-based position of the page's first row (used only for display).
+    """
+
+    def __init__(self, queryset, per_page, total=None):
+        self.queryset = queryset.order_by()
+        self.per_page = per_page
+        self.total = total
+
+    @staticmethod
+    def encode_cursor(row, direction, position):
+        payload = [row.synced_at.isoformat(), row.pk, direction, position]
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decode a cursor from the URL
+
+        Returns:
+            tuple: (synced_at, id, direction, position) or None if the cursor is invalid
+        """
+        if cursor == 'last':
+            return None, None, 'last', None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            synced_at, pk, direction, position = json.loads(base64.urlsafe_b64decode(padded))
+            synced_at = parse_datetime(synced_at)
+            if synced_at is None or direction not in ('next', 'prev'):
+                return None
+            return synced_at, int(pk), direction, int(position) if position is not None else None
+        except (ValueError, TypeError):
+            return None
+
+    def page(self, cursor=None):
+        """
+        Get the page a cursor points to (the first page if cursor is empty or invalid)
+
+        Returns:
+            KeysetPage: The page
+        """
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            decoded = (None, None, 'first', 1)
+        synced_at, pk, direction, position = decoded
+
+        if direction in ('first', 'next'):
+            queryset = self.queryset.order_by('-synced_at', '-id')
+            if direction == 'next':
+                queryset = queryset.filter(Q(synced_at__lt=synced_at) | Q(synced_at=synced_at, id__lt=pk))
+        else:
+            queryset = self.queryset.order_by('synced_at', 'id')
+            if direction == 'prev':
+                queryset = queryset.filter(Q(synced_at__gt=synced_at) | Q(synced_at=synced_at, id__gt=pk))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction in ('first', 'next'):
+            has_next, has_previous = has_more, direction == 'next'
+        else:
+            rows.reverse()
+            has_next, has_previous = direction == 'prev', has_more
+
+        if direction == 'last':
+            position = max(1, self.total - len(rows) + 1) if self.total is not None else None
+        elif direction == 'prev' and position is not None:
+            position = max(1, position - len(rows))
+
+        next_position = position + len(rows) if position is not None else None
+        return KeysetPage(
+            rows,
+            start_index=position,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1], 'next', next_position) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0], 'prev', position) if has_previous and rows else None,
+        )
+
+
+def estimate_count(queryset):
+    """
+    Estimate the number of rows a queryset returns from the planner (EXPLAIN)
+
+    Returns:
+        int: Estimated row count, or None if the backend gives no estimate
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'EXPLAIN {sql}', params)
+                columns = [col[0].lower() for col in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                return int(rows[0]['rows'] * (rows[0].get('filtered') or 100) / 100) if rows else None
+
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.error("Error estimating row count: %s", e)
+
+    return None
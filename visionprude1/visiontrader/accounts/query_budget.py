@@ -0,0 +1,294 @@
+"""
+Query Budgets
+Per-view limits on SQL queries, Firestore calls and rows fetched, declared with
+@query_budget (or settings.QUERY_BUDGETS) and checked by the test helpers and
+the opt-in QueryBudgetMiddleware, with a diff of the query shapes when a view
+goes over
+"""
+import difflib
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import QueryDict
+from django.urls import resolve
+
+from .firestore_backends import FirestoreCallTracker
+from .query_shapes import QueryShapeRecorder
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view used more than its budget; the message is the full report"""
+
+
+class QueryBudget:
+    """Limits for one view (None means unlimited)"""
+
+    METRICS = ('sql', 'firestore', 'rows')
+
+    def __init__(self, sql=None, firestore=None, rows=None, when=None):
+        """
+        Args:
+            sql (int): Maximum SQL statements
+            firestore (int): Maximum Firestore calls
+            rows (int): Maximum rows fetched from SQL results
+            when (dict): GET parameter -> limits replacing these when the
+                request sets it, e.g. {'search': {'rows': 60}}
+        """
+        self.sql = sql
+        self.firestore = firestore
+        self.rows = rows
+        self.when = when or {}
+
+    def __repr__(self):
+        limits = ', '.join(f'{metric}={getattr(self, metric)}' for metric in self.METRICS)
+        if self.when:
+            limits += f', when={self.when!r}'
+        return f'QueryBudget({limits})'
+
+    def for_params(self, params):
+        """The limits that apply to a request with these GET parameters"""
+        budget = self.overrides()
+        for name, limits in self.when.items():
+            if params.get(name):
+                budget = budget.overrides(**limits)
+        return budget
+
+    def overrides(self, **limits):
+        """This budget with some limits replaced"""
+        merged = {metric: getattr(self, metric) for metric in self.METRICS}
+        merged.update(limits)
+        return QueryBudget(**merged)
+
+    def violations(self, usage):
+        """
+        Returns:
+            list: (metric, used, limit) for every limit the usage is over
+        """
+        used = usage.totals()
+        return [
+            (metric, used[metric], getattr(self, metric))
+            for metric in self.METRICS
+            if getattr(self, metric) is not None and used[metric] > getattr(self, metric)
+        ]
+
+
+def query_budget(sql=None, firestore=None, rows=None, when=None):
+    """
+    Declare a view's budget
+
+    Usage:
+        @query_budget(sql=8, firestore=0, rows=100, when={'search': {'rows': 150}})
+        @login_required
+        def model_list_view(request, model_name): ...
+    """
+    budget = QueryBudget(sql=sql, firestore=firestore, rows=rows, when=when)
+
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def budget_for(view, url_name=None):
+    """Budget of a view: settings.QUERY_BUDGETS[url_name] if set, else its @query_budget"""
+    configured = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name) if url_name else None
+    if configured is not None:
+        return QueryBudget(**configured)
+    return getattr(view, 'query_budget', None)
+
+
+class QueryUsage:
+    """What a block of code ran: SQL statements, rows fetched and Firestore calls"""
+
+    def __init__(self):
+        self.queries = []  # (sql, milliseconds)
+        self.rows = 0
+        self.firestore = FirestoreCallTracker()
+        self._lock = threading.Lock()
+
+    def totals(self):
+        return {'sql': len(self.queries), 'firestore': self.firestore.count, 'rows': self.rows}
+
+    # Column lists make every SELECT a screen wide without telling them apart
+    _COLUMNS_RE = re.compile(r'^SELECT (DISTINCT )?.+? FROM ')
+
+    @classmethod
+    def brief(cls, sql):
+        """Shape of a statement with its SELECT column list elided"""
+        shape = QueryShapeRecorder.normalize(sql)
+        return cls._COLUMNS_RE.sub(lambda match: f"SELECT {match.group(1) or ''}... FROM ", shape)
+
+    def shapes(self):
+        """Lines of '<count>x <shape>' for the SQL and Firestore calls, in first-seen order"""
+        counts = Counter(self.brief(sql) for sql, _ in self.queries)
+        counts.update(f'firestore {call.op} {call.collection or ""}'.strip() for call in self.firestore.calls)
+        return [f'{count}x {shape}' for shape, count in counts.items()]
+
+    def _count_rows(self, rows):
+        with self._lock:
+            self.rows += rows
+
+    def wrapper(self, execute, sql, params, many, context):
+        """Database execute wrapper recording the statement and counting fetched rows"""
+        cursor = context['cursor']
+        if not getattr(cursor, '_query_budget_counted', False):
+            self._count_fetches(cursor)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+    def _count_fetches(self, cursor):
+        # CursorWrapper proxies fetch* to the driver's cursor through __getattr__,
+        # so attributes set on the instance take precedence
+        fetchone, fetchmany, fetchall = cursor.fetchone, cursor.fetchmany, cursor.fetchall
+
+        def counted_fetchone():
+            row = fetchone()
+            if row is not None:
+                self._count_rows(1)
+            return row
+
+        def counted_fetchmany(*args, **kwargs):
+            rows = fetchmany(*args, **kwargs)
+            self._count_rows(len(rows))
+            return rows
+
+        def counted_fetchall():
+            rows = fetchall()
+            self._count_rows(len(rows))
+            return rows
+
+        cursor.fetchone, cursor.fetchmany, cursor.fetchall = counted_fetchone, counted_fetchmany, counted_fetchall
+        cursor._query_budget_counted = True
+
+
+@contextmanager
+def track_usage():
+    """
+    Record the SQL statements, rows and Firestore calls of a block
+
+    Usage:
+        with track_usage() as usage:
+            client.get('/dashboard/')
+        usage.totals()
+    """
+    usage = QueryUsage()
+    with connection.execute_wrapper(usage.wrapper), usage.firestore:
+        yield usage
+
+
+def format_report(label, budget, usage, baseline=None):
+    """
+    Readable report of a budget violation
+
+    Args:
+        label (str): What ran, e.g. 'GET /dashboard/ (dashboard)'
+        budget (QueryBudget): The budget that was exceeded
+        usage (QueryUsage): What ran
+        baseline (list): Shape lines (QueryUsage.shapes()) of a run within
+            budget; the report diffs against it (against nothing if None)
+    """
+    lines = [f'{label} is over its query budget:']
+    for metric, used, limit in budget.violations(usage):
+        lines.append(f'  {metric}: {used} (budget {limit}, +{used - limit})')
+
+    current = usage.shapes()
+    repeated = [line for line in current if not line.startswith('1x ')]
+    lines.append('')
+    diff = list(difflib.unified_diff(baseline or [], current, 'within budget', 'this request', lineterm='', n=2))
+    if baseline is not None and diff:
+        lines.append('Queries by shape, against the last run within budget:')
+        lines.extend(f'  {line}' for line in diff)
+    else:
+        lines.append('Queries by shape:' if baseline is None else 'Queries by shape (as in the last run within budget):')
+        lines.extend(f'  {line}' for line in current)
+    if repeated:
+        lines.append('')
+        lines.append('Repeated shapes (N+1 suspects):')
+        lines.extend(f'  {line}' for line in repeated)
+    return '\n'.join(lines)
+
+
+class QueryBudgetChecker:
+    """Checks requests against their views' budgets, remembering the last passing run of each view"""
+
+    def __init__(self):
+        self._baselines = {}
+        self._lock = threading.Lock()
+
+    def check(self, request, usage):
+        """
+        Returns:
+            str: The report if the request's view went over budget, else None
+        """
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return None
+        budget = budget_for(match.func, match.view_name)
+        if budget is None:
+            return None
+        budget = budget.for_params(request.GET)
+
+        key = match.view_name or match._func_path
+        if not budget.violations(usage):
+            with self._lock:
+                self._baselines[key] = usage.shapes()
+            return None
+        with self._lock:
+            baseline = self._baselines.get(key)
+        return format_report(f'{request.method} {request.path} ({key})', budget, usage, baseline)
+
+
+# Test helpers
+
+def assert_within_budget(budget, func, *args, **kwargs):
+    """
+    Call func and fail with the report if it goes over budget
+
+    Args:
+        budget (QueryBudget): Limits to enforce
+        func (callable): Code under test, e.g. client.get
+
+    Returns:
+        The result of func
+    """
+    with track_usage() as usage:
+        result = func(*args, **kwargs)
+    if budget.violations(usage):
+        raise QueryBudgetExceeded(format_report(getattr(func, '__name__', repr(func)), budget, usage))
+    return result
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin checking pages against their views' declared budgets
+
+    Usage:
+        class DashboardTests(QueryBudgetTestMixin, TestCase):
+            def test_budget(self):
+                self.client.force_login(self.user)
+                self.assertWithinBudget('/dashboard/')
+    """
+
+    def assertWithinBudget(self, path, data=None, **limits):
+        """GET path and fail if its view goes over budget (limits override the declared ones)"""
+        route, _, query_string = path.partition('?')
+        match = resolve(route)
+        budget = budget_for(match.func, match.view_name)
+        if budget is None and not limits:
+            self.fail(f'{match.view_name or path} has no query budget')
+        params = data if data is not None else QueryDict(query_string)
+        budget = (budget or QueryBudget()).for_params(params).overrides(**limits)
+
+        with track_usage() as usage:
+            response = self.client.get(path, data)
+        if budget.violations(usage):
+            raise QueryBudgetExceeded(format_report(f'GET {path} ({match.view_name})', budget, usage))
+        return response
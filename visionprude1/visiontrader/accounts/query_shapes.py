@@ -0,0 +1,157 @@
+"""
+Query Shape Recorder
+Collects normalized SQL statements seen at runtime so slow or unindexed
+query patterns can be reported by the `query_report` management command
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryShapeRecorder:
+    """Aggregates SQL statements by shape and flushes them to an NDJSON log"""
+
+    # Literals are replaced so that queries differing only by value share a shape
+    _STRING_RE = re.compile(r"'(?:[^']|'')*'")
+    _NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+    _IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+    _WHITESPACE_RE = re.compile(r'\s+')
+
+    FLUSH_INTERVAL = 30  # seconds between flushes to the log file
+
+    _lock = threading.Lock()
+    _shapes = {}
+    _last_flush = time.time()
+
+    @classmethod
+    def is_enabled(cls):
+        return getattr(settings, 'QUERY_SHAPE_LOGGING', False)
+
+    @classmethod
+    def log_path(cls):
+        default_dir = getattr(settings, 'LOG_DIR', os.path.join(tempfile.gettempdir(), 'visiontrader'))
+        return getattr(settings, 'QUERY_SHAPE_LOG', os.path.join(default_dir, 'query_shapes.log'))
+
+    @classmethod
+    def slow_threshold_ms(cls):
+        return getattr(settings, 'QUERY_SHAPE_SLOW_MS', 100)
+
+    @classmethod
+    def normalize(cls, sql):
+        """Reduce a SQL statement to its shape (placeholders instead of literals)"""
+        shape = cls._STRING_RE.sub('?', sql)
+        shape = cls._NUMBER_RE.sub('?', shape)
+        shape = shape.replace('%s', '?')
+        shape = cls._IN_LIST_RE.sub('IN (...)', shape)
+        return cls._WHITESPACE_RE.sub(' ', shape).strip()
+
+    @classmethod
+    def record(cls, sql, params, duration_ms):
+        """Record one executed statement"""
+        shape = cls.normalize(sql)
+
+        with cls._lock:
+            entry = cls._shapes.get(shape)
+            if entry is None:
+                entry = cls._shapes[shape] = {
+                    'shape': shape,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'slow_count': 0,
+                    'sample_sql': sql,
+                    'sample_params': cls._serializable_params(params),
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            if duration_ms > entry['max_ms']:
+                entry['max_ms'] = duration_ms
+                # Keep the slowest instance as the sample to EXPLAIN later
+                entry['sample_sql'] = sql
+                entry['sample_params'] = cls._serializable_params(params)
+            if duration_ms >= cls.slow_threshold_ms():
+                entry['slow_count'] += 1
+
+        if time.time() - cls._last_flush >= cls.FLUSH_INTERVAL:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Append the aggregated shapes to the log file and reset the buffer"""
+        with cls._lock:
+            shapes = cls._shapes
+            cls._shapes = {}
+            cls._last_flush = time.time()
+
+        if not shapes:
+            return
+
+        path = cls.log_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as log_file:
+                for entry in shapes.values():
+                    log_file.write(json.dumps(entry, default=str) + '\n')
+        except OSError as e:
+            logger.error("Error writing query shape log: %s", e)
+
+    @classmethod
+    def load(cls, path=None):
+        """Read the log file and merge entries with the same shape"""
+        merged = {}
+        path = path or cls.log_path()
+        if not os.path.exists(path):
+            return merged
+
+        with open(path, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                existing = merged.get(entry['shape'])
+                if existing is None:
+                    merged[entry['shape']] = entry
+                    continue
+
+                existing['count'] += entry['count']
+                existing['total_ms'] += entry['total_ms']
+                existing['slow_count'] += entry['slow_count']
+                if entry['max_ms'] > existing['max_ms']:
+                    existing['max_ms'] = entry['max_ms']
+                    existing['sample_sql'] = entry['sample_sql']
+                    existing['sample_params'] = entry['sample_params']
+
+        return merged
+
+    @staticmethod
+    def _serializable_params(params):
+        if params is None:
+            return None
+        if isinstance(params, dict):
+            return {key: str(value) for key, value in params.items()}
+        return [value if isinstance(value, (int, float, bool, type(None))) else str(value) for value in params]
+
+
+def query_shape_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper that times each statement and records its shape"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        QueryShapeRecorder.record(sql, params, (time.perf_counter() - start) * 1000)
+
+
+# Don't lose the shapes buffered since the last flush when the worker exits
+atexit.register(QueryShapeRecorder.flush)
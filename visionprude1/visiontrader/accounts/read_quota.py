@@ -0,0 +1,254 @@
+"""
+Firestore Read Quota
+A persistent ledger of the document reads Firestore bills, per collection,
+caller (view or management command) and hour, with daily and hourly budgets
+that switch FirebaseService to serving only cached data once they are used up
+"""
+import atexit
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+_caller = contextvars.ContextVar('firestore_read_caller', default=None)
+_disabled = contextvars.ContextVar('firestore_read_ledger_disabled', default=False)
+
+
+def _process_caller():
+    """Caller of reads made outside a view: the management command, or the program"""
+    program = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+    if program == 'manage.py' and len(sys.argv) > 1:
+        return f'command:{sys.argv[1]}'
+    return f'process:{program}'
+
+
+class ReadQuota:
+    """Accounts billed reads and enforces FIRESTORE_READ_BUDGET"""
+
+    # Seconds between writes of the buffered reads to the ledger
+    FLUSH_INTERVAL = 10
+
+    # Seconds the ledger's totals are reused for budget checks
+    REFRESH_INTERVAL = 10
+
+    _lock = threading.Lock()
+    _pending = {}  # (day, hour, collection, caller) -> [reads, calls]
+    _pending_database = None  # NAME of the database the pending reads belong to
+    _last_flush = time.monotonic()
+    _totals = None  # ((day, hour), hour total, day total) from the ledger
+    _totals_at = 0.0
+    _cache_only = None
+    PROCESS_CALLER = _process_caller()
+
+    @staticmethod
+    def budgets():
+        """(daily, hourly) read budgets; None means unlimited"""
+        config = getattr(settings, 'FIRESTORE_READ_BUDGET', None) or {}
+        return config.get('DAILY'), config.get('HOURLY')
+
+    # Callers
+
+    @staticmethod
+    def set_caller(name):
+        """Attribute the reads from here on to `name`; returns a token for reset_caller()"""
+        return _caller.set(name)
+
+    @staticmethod
+    def reset_caller(token):
+        _caller.reset(token)
+
+    @classmethod
+    @contextmanager
+    def caller(cls, name):
+        """Attribute the reads made in the block to `name`"""
+        token = cls.set_caller(name)
+        try:
+            yield
+        finally:
+            cls.reset_caller(token)
+
+    @classmethod
+    def current_caller(cls):
+        return _caller.get() or cls.PROCESS_CALLER
+
+    # Accounting
+
+    @staticmethod
+    @contextmanager
+    def disabled():
+        """Don't account the reads made in the block (replayed or synthetic data nobody is billed for)"""
+        token = _disabled.set(True)
+        try:
+            yield
+        finally:
+            _disabled.reset(token)
+
+    @staticmethod
+    def _database():
+        return connection.settings_dict['NAME']
+
+    @classmethod
+    def record(cls, collection_name, reads, calls=1):
+        """Account billed reads to the current caller and hour"""
+        if _disabled.get():
+            return
+        now = timezone.now()
+        key = (now.date(), now.hour, collection_name, cls.current_caller())
+        database = cls._database()
+        with cls._lock:
+            if cls._pending_database != database:
+                cls._discard_pending(database)
+            entry = cls._pending.setdefault(key, [0, 0])
+            entry[0] += reads
+            entry[1] += calls
+        if time.monotonic() - cls._last_flush >= cls.FLUSH_INTERVAL:
+            cls.flush()
+
+    @classmethod
+    def _discard_pending(cls, database):
+        """
+        Forget reads buffered against another database (call with the lock held)
+
+        The connection switched databases since they were recorded, e.g. to a
+        test database and back, so the ledger they belong to is gone.
+        """
+        if cls._pending:
+            logger.debug("Discarding Firestore reads recorded against database %s", cls._pending_database)
+        cls._pending = {}
+        cls._pending_database = database
+
+    @classmethod
+    def flush(cls):
+        """Add the buffered reads to the ledger"""
+        if connection.in_atomic_block:
+            return  # a rollback of the caller's transaction would lose them
+        with cls._lock:
+            if cls._pending_database != cls._database():
+                cls._discard_pending(cls._database())
+            pending, cls._pending = cls._pending, {}
+            cls._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        from .models import FirestoreReadLedger
+
+        try:
+            for (day, hour, collection_name, caller), (reads, calls) in pending.items():
+                lookup = {'day': day, 'hour': hour, 'collection': collection_name, 'caller': caller}
+                increment = {'reads': F('reads') + reads, 'calls': F('calls') + calls}
+                if FirestoreReadLedger.objects.filter(**lookup).update(**increment):
+                    continue
+                try:
+                    with transaction.atomic():
+                        FirestoreReadLedger.objects.create(reads=reads, calls=calls, **lookup)
+                except IntegrityError:
+                    # Another process created the row in the meantime
+                    FirestoreReadLedger.objects.filter(**lookup).update(**increment)
+        except Exception as e:
+            logger.error("Error writing the Firestore read ledger: %s", e)
+            with cls._lock:
+                for key, (reads, calls) in pending.items():
+                    entry = cls._pending.setdefault(key, [0, 0])
+                    entry[0] += reads
+                    entry[1] += calls
+            return
+        cls._totals = None  # re-read with what was just written
+
+    # Budgets
+
+    @classmethod
+    def usage(cls, now=None):
+        """
+        Reads of the current hour and day, across processes
+
+        Other processes' reads are included once they have flushed them (every
+        FLUSH_INTERVAL seconds).
+
+        Returns:
+            tuple: (reads this hour, reads today)
+        """
+        now = now or timezone.now()
+        period = (now.date(), now.hour)
+        if cls._totals is None or cls._totals[0] != period or time.monotonic() - cls._totals_at >= cls.REFRESH_INTERVAL:
+            from .models import FirestoreReadLedger
+
+            today = FirestoreReadLedger.objects.filter(day=period[0])
+            hour_total = today.filter(hour=period[1]).aggregate(total=Sum('reads'))['total'] or 0
+            day_total = today.aggregate(total=Sum('reads'))['total'] or 0
+            cls._totals = (period, hour_total, day_total)
+            cls._totals_at = time.monotonic()
+
+        with cls._lock:
+            pending_hour = sum(entry[0] for key, entry in cls._pending.items() if key[:2] == period)
+            pending_day = sum(entry[0] for key, entry in cls._pending.items() if key[0] == period[0])
+        return cls._totals[1] + pending_hour, cls._totals[2] + pending_day
+
+    @classmethod
+    def exhausted(cls, now=None):
+        """
+        The budget that is used up, if any
+
+        Returns:
+            str: 'hourly' or 'daily' while FirebaseService must serve from cache only, else None
+        """
+        daily, hourly = cls.budgets()
+        exhausted = None
+        if daily is not None or hourly is not None:
+            try:
+                hour_reads, day_reads = cls.usage(now)
+            except Exception as e:
+                logger.error("Error reading the Firestore read ledger: %s", e)
+                hour_reads = day_reads = 0
+            if daily is not None and day_reads >= daily:
+                exhausted = 'daily'
+            elif hourly is not None and hour_reads >= hourly:
+                exhausted = 'hourly'
+
+        if exhausted != cls._cache_only:
+            if exhausted:
+                logger.warning("Firestore %s read budget used up, serving cached data only", exhausted)
+            elif cls._cache_only:
+                logger.info("Firestore read budget available again, leaving cache-only mode")
+            cls._cache_only = exhausted
+            metrics.FIRESTORE_CACHE_ONLY.set(1 if exhausted else 0)
+        return exhausted
+
+    # Reporting
+
+    @classmethod
+    def report(cls, days=1, group_by=('caller', 'collection'), now=None):
+        """
+        Reads of the last `days` days (today included), largest first
+
+        Returns:
+            list: Dicts with the group_by fields, 'reads' and 'calls'
+        """
+        cls.flush()
+        from .models import FirestoreReadLedger
+
+        now = now or timezone.now()
+        since = now.date() - timedelta(days=days - 1)
+        return list(
+            FirestoreReadLedger.objects.filter(day__gte=since)
+            .values(*group_by)
+            .annotate(reads=Sum('reads'), calls=Sum('calls'))
+            .order_by('-reads', *group_by)
+        )
+
+
+# Reads buffered since the last flush would otherwise be missing from the ledger
+atexit.register(ReadQuota.flush)
@@ -0,0 +1,189 @@
+"""
+Request Profiling
+Breaks a request's time down into SQL, Firestore, rate-limit waits, cache
+lookups and template rendering, reported in a Server-Timing header and a
+structured log line for a sample of requests
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from .firestore_backends import FirestoreCallTracker
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+class CacheCounter:
+    """Counts hits and misses of a cache (the calling thread's connection) while active"""
+
+    _MISSING = object()
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.cache = caches[self.alias]
+        # Counters can nest: remember what was patched in before
+        self._saved = {name: self.cache.__dict__[name] for name in ('get', 'get_many') if name in self.cache.__dict__}
+        get, get_many = self.cache.get, self.cache.get_many
+
+        def counted_get(key, default=None, version=None):
+            value = get(key, self._MISSING, version=version)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+        def counted_get_many(keys, version=None):
+            keys = list(keys)
+            found = get_many(keys, version=version)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+        self.cache.get, self.cache.get_many = counted_get, counted_get_many
+        return self
+
+    def __exit__(self, *exc_info):
+        for name in ('get', 'get_many'):
+            if name in self._saved:
+                setattr(self.cache, name, self._saved[name])
+            else:
+                delattr(self.cache, name)  # back to the class method
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class RequestProfile:
+    """Where one request spent its time"""
+
+    @staticmethod
+    def sample_rate():
+        return getattr(settings, 'REQUEST_PROFILE_SAMPLE_RATE', 0)
+
+    @classmethod
+    def sampled(cls):
+        rate = cls.sample_rate()
+        return rate >= 1 or random.random() < rate
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.firestore = FirestoreCallTracker(measure_bytes=True)
+        self.cache = CacheCounter()
+        self.started = None
+        self.total_seconds = None
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_seconds += time.perf_counter() - start
+
+    @contextmanager
+    def active(self):
+        """Profile the block (a request)"""
+        token = _current.set(self)
+        self.started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(connection.execute_wrapper(self.sql_wrapper))
+                stack.enter_context(self.firestore)
+                stack.enter_context(self.cache)
+                yield self
+        finally:
+            self.total_seconds = time.perf_counter() - self.started
+            _current.reset(token)
+
+    def metrics(self):
+        """Flat, JSON-serializable metrics (times in milliseconds)"""
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        return {
+            'total_ms': ms(self.total_seconds or 0),
+            'sql_count': self.sql_count,
+            'sql_ms': ms(self.sql_seconds),
+            'firestore_calls': self.firestore.count,
+            'firestore_documents': self.firestore.documents,
+            'firestore_bytes': self.firestore.bytes,
+            'firestore_ms': ms(self.firestore.seconds),
+            'rate_limit_wait_ms': ms(self.firestore.wait),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'template_ms': ms(self.template_seconds),
+        }
+
+    def server_timing(self):
+        """Value of the Server-Timing header"""
+        metrics = self.metrics()
+        entries = [
+            f'sql;dur={metrics["sql_ms"]};desc="{metrics["sql_count"]} queries"',
+            f'firestore;dur={metrics["firestore_ms"]};desc="{metrics["firestore_calls"]} calls, '
+            f'{metrics["firestore_bytes"]} bytes"',
+            f'ratelimit;dur={metrics["rate_limit_wait_ms"]}',
+            f'template;dur={metrics["template_ms"]}',
+            f'cache;desc="{metrics["cache_hits"]} hits, {metrics["cache_misses"]} misses"',
+            f'total;dur={metrics["total_ms"]}',
+        ]
+        return ', '.join(entries)
+
+    def log(self, request, response):
+        """Emit the structured log line of the request"""
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'event': 'request_profile',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+        }
+        record.update(self.metrics())
+        # The JSON formatter writes the fields of `extra` next to the message
+        logger.info("Profiled %s %s", request.method, request.path, extra=record)
+        return record
+
+
+def _timed_render(render):
+    @wraps(render)
+    def timed(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_seconds += time.perf_counter() - start
+    timed._request_profile = True
+    return timed
+
+
+def install_template_timing():
+    """Time the top-level render of every Django template (idempotent)"""
+    from django.template.backends.django import Template
+
+    if not getattr(Template.render, '_request_profile', False):
+        Template.render = _timed_render(Template.render)
@@ -0,0 +1,295 @@
+"""
+Revenue Rollup Service
+Maintains daily revenue totals per (source, day, product/signal type, status)
+so totals, averages and time series are answered in O(days) instead of O(rows)
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Purchase, PremiumSignalPayment, RevenueRollup
+
+
+CENT = Decimal('0.01')
+
+
+class RevenueRollupDelta:
+    """Accumulates the rollup changes caused by writing a batch of rows"""
+
+    def __init__(self, config, existing):
+        self.config = config
+        self.existing = existing  # firebase_id -> current field values
+        self.deltas = defaultdict(lambda: [0, 0, Decimal(0), Decimal(0)])
+
+    def _key(self, values):
+        return (
+            self.config['source'],
+            RevenueRollups.to_day(values.get(self.config['date_field'])),
+            values.get(self.config['dimension_field']) or '',
+            values.get('status') or '',
+        )
+
+    def _add(self, values, sign):
+        amount = RevenueRollups.to_decimal(values.get('amount'))
+        paid = RevenueRollups.to_decimal(values.get('paid'))
+
+        delta = self.deltas[self._key(values)]
+        delta[0] += sign
+        if amount is not None:
+            delta[1] += sign
+            delta[2] += sign * amount
+        if paid is not None:
+            delta[3] += sign * paid
+
+    def replace(self, firebase_id, values):
+        """Record that a row now has `values` (replacing its previous values, if any)"""
+        previous = self.existing.get(firebase_id)
+        if previous is not None:
+            self._add(previous, -1)
+        self._add(values, 1)
+        self.existing[firebase_id] = values
+
+    def remove(self, firebase_id):
+        """Record that a row was deleted"""
+        previous = self.existing.pop(firebase_id, None)
+        if previous is not None:
+            self._add(previous, -1)
+
+    def apply(self):
+        """Write the accumulated deltas to the rollup table"""
+        for (source, day, dimension, status), (count, amount_count, amount_total, paid_total) in self.deltas.items():
+            if not (count or amount_count or amount_total or paid_total):
+                continue
+
+            lookup = {'source': source, 'day': day, 'dimension': dimension, 'status': status}
+            increment = {
+                'count': F('count') + count,
+                'amount_count': F('amount_count') + amount_count,
+                'amount_total': F('amount_total') + amount_total,
+                'paid_total': F('paid_total') + paid_total,
+            }
+            if RevenueRollup.objects.filter(**lookup).update(**increment):
+                continue
+            try:
+                # A savepoint, so losing the race below doesn't abort the caller's batch
+                with transaction.atomic():
+                    RevenueRollup.objects.create(
+                        count=count, amount_count=amount_count,
+                        amount_total=amount_total, paid_total=paid_total, **lookup,
+                    )
+            except IntegrityError:
+                # Another sync created the row in the meantime
+                RevenueRollup.objects.filter(**lookup).update(**increment)
+
+        # Rows whose contributions were fully removed no longer carry information
+        RevenueRollup.objects.filter(count__lte=0).delete()
+        self.deltas.clear()
+
+
+class RevenueRollups:
+    """Maintenance and query API for the revenue rollup table"""
+
+    # Model -> how its rows map onto rollup keys
+    SOURCES = {
+        Purchase: {
+            'source': 'purchase',
+            'date_field': 'purchase_date',
+            'dimension_field': 'product_name',
+        },
+        PremiumSignalPayment: {
+            'source': 'premium_payment',
+            'date_field': 'payment_date',
+            'dimension_field': 'signal_type',
+        },
+    }
+
+    @staticmethod
+    def to_day(value):
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+        return value
+
+    @staticmethod
+    def to_decimal(value):
+        # Synced amounts are already rounded to cents (see FirebaseSyncService.round_decimals)
+        if value is None:
+            return None
+        return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    @classmethod
+    def delta_for(cls, model, firebase_ids):
+        """
+        Start tracking rollup changes for a batch of rows about to be written
+
+        Args:
+            model: Model being written
+            firebase_ids (list): IDs of the rows in the batch
+
+        Returns:
+            RevenueRollupDelta: Delta tracker, or None if the model has no rollups
+        """
+        config = cls.SOURCES.get(model)
+        if config is None:
+            return None
+
+        fields = [config['date_field'], config['dimension_field'], 'status', 'amount', 'paid']
+        existing = {
+            row['firebase_id']: row
+            for row in model.objects.filter(firebase_id__in=[i for i in firebase_ids if i])
+            .values('firebase_id', *fields)
+        }
+        return RevenueRollupDelta(config, existing)
+
+    @classmethod
+    def rebuild(cls, model=None):
+        """
+        Recompute the rollups from the base tables
+
+        Args:
+            model: Only rebuild this model's rollups (all sources if None)
+
+        Returns:
+            int: Number of rollup rows written
+        """
+        written = 0
+        models = [model] if model else list(cls.SOURCES)
+
+        for source_model in models:
+            config = cls.SOURCES[source_model]
+            with transaction.atomic():
+                RevenueRollup.objects.filter(source=config['source']).delete()
+
+                rows = (
+                    source_model.objects.order_by()
+                    .annotate(day=TruncDate(config['date_field']))
+                    .values('day', config['dimension_field'], 'status')
+                    .annotate(
+                        count=Count('id'),
+                        amount_count=Count('amount'),
+                        amount_total=Sum('amount'),
+                        paid_total=Sum('paid'),
+                    )
+                )
+                RevenueRollup.objects.bulk_create([
+                    RevenueRollup(
+                        source=config['source'],
+                        day=row['day'],
+                        dimension=row[config['dimension_field']] or '',
+                        status=row['status'] or '',
+                        count=row['count'],
+                        amount_count=row['amount_count'],
+                        amount_total=row['amount_total'] or 0,
+                        paid_total=row['paid_total'] or 0,
+                    )
+                    for row in rows
+                ], batch_size=1000)
+                written += len(rows)
+
+        return written
+
+    @classmethod
+    def _filter(cls, source=None, start=None, end=None, status=None, dimension=None):
+        filters = Q()
+        if source:
+            filters &= Q(source=source)
+        if start:
+            filters &= Q(day__gte=start)
+        if end:
+            filters &= Q(day__lte=end)
+        if status is not None:
+            filters &= Q(status=status)
+        if dimension is not None:
+            filters &= Q(dimension=dimension)
+        return RevenueRollup.objects.filter(filters).order_by()
+
+    @staticmethod
+    def _with_average(row):
+        row['avg_amount'] = row['amount_total'] / row['amount_count'] if row['amount_count'] else None
+        return row
+
+    @classmethod
+    def totals(cls, **filters):
+        """
+        Total revenue, paid amount, row count and average amount
+
+        Keyword Args:
+            source (str): 'purchase' or 'premium_payment' (both if None)
+            start, end (date): Inclusive day range
+            status (str): Only rows with this status
+            dimension (str): Only this product name / signal type
+
+        Returns:
+            dict: count, amount_count, amount_total, paid_total, avg_amount
+        """
+        row = cls._filter(**filters).aggregate(
+            count=Sum('count'),
+            amount_count=Sum('amount_count'),
+            amount_total=Sum('amount_total'),
+            paid_total=Sum('paid_total'),
+        )
+        row = {key: value or 0 for key, value in row.items()}
+        return cls._with_average(row)
+
+    @classmethod
+    def time_series(cls, period='day', **filters):
+        """
+        Revenue per day or per week
+
+        Args:
+            period (str): 'day' or 'week' (weeks start on Monday)
+
+        Returns:
+            list: Dicts with period start, count, amount_total, paid_total, avg_amount
+        """
+        buckets = {}
+        rows = (
+            cls._filter(**filters).filter(day__isnull=False)
+            .values('day')
+            .annotate(
+                count=Sum('count'),
+                amount_count=Sum('amount_count'),
+                amount_total=Sum('amount_total'),
+                paid_total=Sum('paid_total'),
+            )
+            .order_by('day')
+        )
+
+        for row in rows:
+            day = row.pop('day')
+            period_start = day if period == 'day' else day - timedelta(days=day.weekday())
+            bucket = buckets.setdefault(period_start, {
+                'period': period_start, 'count': 0, 'amount_count': 0,
+                'amount_total': Decimal(0), 'paid_total': Decimal(0),
+            })
+            for key, value in row.items():
+                bucket[key] += value
+
+        return [cls._with_average(bucket) for bucket in buckets.values()]
+
+    @classmethod
+    def breakdown(cls, **filters):
+        """
+        Revenue per product name / signal type
+
+        Returns:
+            list: Dicts with source, dimension, count, amount_total, paid_total, avg_amount
+        """
+        rows = (
+            cls._filter(**filters)
+            .values('source', 'dimension')
+            .annotate(
+                count=Sum('count'),
+                amount_count=Sum('amount_count'),
+                amount_total=Sum('amount_total'),
+                paid_total=Sum('paid_total'),
+            )
+            .order_by('-amount_total')
+        )
+        return [cls._with_average(row) for row in rows]
@@ -0,0 +1,228 @@
+"""
+Collection Schema Inference
+Builds the union schema of a Firestore collection (field types, presence and
+null rates) from the documents the sync already fetched, and keeps it
+versioned in the database with a cache in front
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CollectionSchemaRecord
+from .numeric_summary import NumericSummary
+
+
+class SchemaInference:
+    """Per-collection union schemas, refreshed as documents are synced"""
+
+    CACHE_TIMEOUT = 3600
+    SAMPLE_SIZE = 500
+
+    # Types summed by the numeric summary
+    NUMERIC_TYPES = ('integer', 'float')
+
+    @staticmethod
+    def cache_key(collection_name):
+        return f'collection_schema_{collection_name}'
+
+    @staticmethod
+    def type_name(value):
+        """Schema type of a Firestore value"""
+        if value is None:
+            return 'null'
+        if isinstance(value, bool):
+            return 'boolean'
+        if isinstance(value, int):
+            return 'integer'
+        if isinstance(value, (float, Decimal)):
+            return 'float'
+        if isinstance(value, str):
+            return 'string'
+        if isinstance(value, (datetime, date)):
+            return 'timestamp'
+        if isinstance(value, dict):
+            return 'map'
+        if isinstance(value, (list, tuple)):
+            return 'array'
+        return 'other'
+
+    @classmethod
+    def scan(cls, documents, fields=None):
+        """
+        Accumulate field statistics over documents (one pass)
+
+        Args:
+            documents (list): Document dictionaries
+            fields (dict): Existing statistics to add to (a new dict if None)
+
+        Returns:
+            dict: Field name -> {'position', 'types', 'present', 'nulls'}
+        """
+        fields = {} if fields is None else fields
+        next_position = max((field['position'] for field in fields.values()), default=-1) + 1
+        for doc in documents:
+            for name, value in doc.items():
+                if name == 'id':
+                    continue
+                field = fields.get(name)
+                if field is None:
+                    field = fields[name] = {'position': next_position, 'types': {}, 'present': 0, 'nulls': 0}
+                    next_position += 1
+                field['present'] += 1
+                type_name = cls.type_name(value)
+                if type_name == 'null':
+                    field['nulls'] += 1
+                else:
+                    field['types'][type_name] = field['types'].get(type_name, 0) + 1
+        return fields
+
+    @staticmethod
+    def _shape(fields):
+        return {name: set(field['types']) for name, field in fields.items()}
+
+    @classmethod
+    def observe(cls, collection_name, documents, replace=True, sampled=False):
+        """
+        Update a collection's schema from documents that were just read
+
+        Args:
+            collection_name (str): Firestore collection name
+            documents (list): Document dictionaries
+            replace (bool): The documents are the whole collection (or a fresh
+                sample of it) and replace the statistics; otherwise they are a
+                batch of changes added to them
+            sampled (bool): The documents are only part of the collection
+
+        Returns:
+            dict: The schema (see get())
+        """
+        with transaction.atomic():
+            record, created = CollectionSchemaRecord.objects.select_for_update().get_or_create(
+                collection=collection_name
+            )
+            previous = record.fields or {}
+
+            if replace:
+                # Keep the positions of known fields so columns don't move around
+                fields = {
+                    name: {'position': field['position'], 'types': {}, 'present': 0, 'nulls': 0}
+                    for name, field in previous.items()
+                }
+                fields = cls.scan(documents, fields)
+                fields = {name: field for name, field in fields.items() if field['present']}
+                document_count = len(documents)
+            else:
+                fields = cls.scan(documents, {name: dict(field, types=dict(field['types'])) for name, field in previous.items()})
+                document_count = record.document_count + len(documents)
+
+            reshaped = cls._shape(fields) != cls._shape(previous)
+            if not created and reshaped:
+                record.version += 1
+            record.fields = fields
+            record.document_count = document_count
+            record.sampled = sampled
+            record.save()
+            if reshaped:
+                # The cached numeric summary was computed for the old numeric fields
+                transaction.on_commit(lambda: cache.delete(NumericSummary.cache_key(collection_name)))
+
+        schema = cls._to_schema(record)
+        cache.set(cls.cache_key(collection_name), schema, cls.CACHE_TIMEOUT)
+        return schema
+
+    @classmethod
+    def get(cls, collection_name):
+        """
+        Cached schema of a collection
+
+        Returns:
+            dict: 'collection', 'version', 'document_count', 'sampled' and 'fields'
+                  (list ordered by first appearance, each with name, types,
+                  dominant type, presence and null rate), or None if never inferred
+        """
+        key = cls.cache_key(collection_name)
+        schema = cache.get(key)
+        if schema is None:
+            record = CollectionSchemaRecord.objects.filter(collection=collection_name).first()
+            if record is None:
+                return None
+            schema = cls._to_schema(record)
+            cache.set(key, schema, cls.CACHE_TIMEOUT)
+        return schema
+
+    @classmethod
+    def infer(cls, collection_name, documents=None):
+        """
+        Get a collection's schema, inferring it from a sample if it is unknown
+
+        Args:
+            documents (list): Already fetched documents to infer from (a sample of
+                SAMPLE_SIZE documents is read from Firestore if None)
+        """
+        schema = cls.get(collection_name)
+        if schema is not None:
+            return schema
+
+        if documents is None:
+            from .firebase_service import FirebaseService
+            documents = FirebaseService.get_collection_page(collection_name, cls.SAMPLE_SIZE)
+            sampled = len(documents) >= cls.SAMPLE_SIZE
+        else:
+            sampled = False
+
+        if not documents:
+            return None
+        return cls.observe(collection_name, documents, sampled=sampled)
+
+    @classmethod
+    def columns(cls, collection_name):
+        """Field names of a collection in stable order (None if the schema is unknown)"""
+        schema = cls.get(collection_name)
+        if schema is None:
+            return None
+        return [field['name'] for field in schema['fields']]
+
+    @classmethod
+    def numeric_fields(cls, collection_name):
+        """Fields whose values are mostly numbers (None if the schema is unknown)"""
+        schema = cls.get(collection_name)
+        if schema is None:
+            return None
+        return [field['name'] for field in schema['fields'] if field['dominant_type'] in cls.NUMERIC_TYPES]
+
+    @classmethod
+    def invalidate(cls, collection_name):
+        cache.delete_many([cls.cache_key(collection_name), NumericSummary.cache_key(collection_name)])
+        CollectionSchemaRecord.objects.filter(collection=collection_name).delete()
+
+    @staticmethod
+    def _to_schema(record):
+        total = record.document_count
+        fields = []
+        for name, field in sorted(record.fields.items(), key=lambda item: item[1]['position']):
+            types = field['types']
+            # Integers and floats mixed in one field are still a numeric field
+            numeric = types.get('integer', 0) + types.get('float', 0)
+            if numeric and numeric * 2 >= sum(types.values()):
+                dominant = 'float' if types.get('float') else 'integer'
+            else:
+                dominant = max(types, key=types.get) if types else 'null'
+            fields.append({
+                'name': name,
+                'types': types,
+                'dominant_type': dominant,
+                'present': field['present'],
+                'presence_rate': field['present'] / total if total else 0,
+                'null_rate': (total - field['present'] + field['nulls']) / total if total else 0,
+            })
+
+        return {
+            'collection': record.collection,
+            'version': record.version,
+            'document_count': total,
+            'sampled': record.sampled,
+            'updated_at': record.updated_at,
+            'fields': fields,
+        }
@@ -0,0 +1,185 @@
+"""
+Full-Text Search Service
+Routes model_list_view searches to a real text index: MySQL FULLTEXT, or an
+FTS5 sidecar table on SQLite, with a prefix-match fallback for short terms
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import (
+    Purchase, PremiumSignalPayment, SignalNotification, UserProgress,
+    PremiumSignal, PremiumSignalSubscription, Course, FCMToken,
+    AppNotification, Testimonial, FirebaseUser
+)
+from .pagination import KeysetPage
+
+
+class FullTextSearch:
+    """Relevance-ranked search over the text columns of the synced models"""
+
+    # Terms shorter than this are not indexed (MySQL's innodb_ft_min_token_size)
+    MIN_TERM_LENGTH = 3
+
+    # Ranked searches return at most this many matches
+    RESULT_LIMIT = 500
+
+    # Model -> indexed columns (must match the FULLTEXT / FTS5 definitions in
+    # migration 0008_fulltext_search)
+    FIELDS = {
+        Purchase: ['firebase_user_id', 'product_name', 'status', 'description'],
+        PremiumSignalPayment: ['firebase_user_id', 'signal_type', 'status', 'payment_method'],
+        SignalNotification: ['firebase_user_id', 'title', 'message'],
+        UserProgress: ['firebase_user_id'],
+        PremiumSignal: ['symbol', 'signal_type', 'status', 'title', 'description'],
+        PremiumSignalSubscription: ['firebase_user_id', 'subscription_type', 'status'],
+        Course: ['title', 'instructor', 'description'],
+        FCMToken: ['firebase_user_id', 'platform'],
+        AppNotification: ['title', 'message', 'notification_type', 'target_audience'],
+        Testimonial: ['author_name', 'author_email', 'content'],
+        FirebaseUser: ['email', 'display_name'],
+    }
+
+    _TERM_RE = re.compile(r'\w+', re.UNICODE)
+    _fts_tables = None
+
+    @classmethod
+    def terms(cls, query):
+        return cls._TERM_RE.findall(query)
+
+    @classmethod
+    def fts_table(cls, model):
+        return f'{model._meta.db_table}_fts'
+
+    @classmethod
+    def _has_fts_table(cls, model):
+        if cls._fts_tables is None:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE %s", ['%_fts'])
+                cls._fts_tables = {row[0] for row in cursor.fetchall()}
+        return cls.fts_table(model) in cls._fts_tables
+
+    @classmethod
+    def is_indexed(cls, model, query):
+        """Whether a query can be answered from the text index"""
+        terms = cls.terms(query)
+        if model not in cls.FIELDS or not terms:
+            return False
+        if any(len(term) < cls.MIN_TERM_LENGTH for term in terms):
+            return False
+        return cls._indexed_backend(model)
+
+    @classmethod
+    def _match(cls, model, query):
+        """
+        SQL selecting the rows matching every term (as a prefix)
+
+        Returns:
+            tuple: (FROM ... WHERE clause, its params, ORDER BY expression
+                   ranking the matches, its params, ID column)
+        """
+        terms = cls.terms(query)
+        if connection.vendor == 'mysql':
+            columns = ', '.join(connection.ops.quote_name(field) for field in cls.FIELDS[model])
+            match = f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)'
+            pattern = ' '.join(f'+{term}*' for term in terms)
+            table = connection.ops.quote_name(model._meta.db_table)
+            return f'FROM {table} WHERE {match}', [pattern], f'{match} DESC', [pattern], 'id'
+
+        fts_table = connection.ops.quote_name(cls.fts_table(model))
+        pattern = ' '.join(f'"{term}"*' for term in terms)
+        return f'FROM {fts_table} WHERE {fts_table} MATCH %s', [pattern], 'rank', [], 'rowid'
+
+    @classmethod
+    def ranked_ids(cls, model, query, limit=None, offset=0):
+        """
+        IDs of the rows matching every term (as a prefix), best match first
+
+        Args:
+            limit (int): IDs to read (default RESULT_LIMIT)
+            offset (int): Matches to skip
+
+        Returns:
+            list: Primary keys ordered by relevance
+        """
+        where, params, order, order_params, key = cls._match(model, query)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {key} {where} ORDER BY {order} LIMIT %s OFFSET %s',
+                params + order_params + [limit or cls.RESULT_LIMIT, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def count(cls, model, query):
+        """Number of matches, counted up to RESULT_LIMIT"""
+        where, params, _, _, _ = cls._match(model, query)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 {where} LIMIT %s) matches', params + [cls.RESULT_LIMIT])
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def page(cls, model, query, cursor, per_page):
+        """
+        One page of relevance-ranked results
+
+        Only the page's IDs are read from the index, plus a capped count of the
+        matches, so a broad query costs no more rows than a narrow one.
+
+        Args:
+            cursor (str): Page number from the URL ('last' for the last page)
+
+        Returns:
+            tuple: (KeysetPage, total matches, whether the total hit RESULT_LIMIT)
+        """
+        total = cls.count(model, query)
+        num_pages = max(1, -(-total // per_page))
+
+        if cursor == 'last':
+            number = num_pages
+        else:
+            try:
+                number = min(max(1, int(cursor or 1)), num_pages)
+            except ValueError:
+                number = 1
+
+        page_ids = cls.ranked_ids(model, query, limit=per_page, offset=(number - 1) * per_page) if total else []
+        order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(page_ids)], output_field=IntegerField())
+        rows = list(model.objects.filter(pk__in=page_ids).order_by(order)) if page_ids else []
+
+        page = KeysetPage(
+            rows,
+            start_index=(number - 1) * per_page + 1,
+            has_next=number < num_pages,
+            has_previous=number > 1,
+            next_cursor=str(number + 1),
+            previous_cursor=str(number - 1),
+        )
+        return page, total, total >= cls.RESULT_LIMIT
+
+    @classmethod
+    def fallback_filter(cls, queryset, model, query):
+        """
+        Filter for queries the index can't answer
+
+        Every term must match one of the fields. Where a text index exists (so
+        only very short terms end up here) a term matches the start of a word,
+        as the index would. Without an index it keeps the substring match.
+        """
+        word_prefix = cls._indexed_backend(model)
+        for term in cls.terms(query) or [query]:
+            q_objects = Q()
+            for field in cls.FIELDS.get(model, []):
+                if word_prefix:
+                    q_objects |= Q(**{f"{field}__istartswith": term}) | Q(**{f"{field}__icontains": f' {term}'})
+                else:
+                    q_objects |= Q(**{f"{field}__icontains": term})
+            queryset = queryset.filter(q_objects)
+        return queryset
+
+    @classmethod
+    def _indexed_backend(cls, model):
+        if connection.vendor == 'mysql':
+            return True
+        return connection.vendor == 'sqlite' and cls._has_fts_table(model)
@@ -0,0 +1,155 @@
+"""
+Sync Event Channel
+Publishes sync-completed and new-data events to the SyncEvent table and streams
+them to open data pages as server-sent events, so pages learn about new data
+without reading Firestore themselves
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import SyncEvent
+
+
+class SyncEvents:
+    """Publish and stream sync events"""
+
+    SYNC_COMPLETED = 'sync_completed'
+    NEW_DATA = 'new_data'
+
+    # Seconds between checks for new events; one query per process, however
+    # many streams are open
+    POLL_INTERVAL = 2
+
+    # An ASGI stream ends after this many seconds and the browser reconnects
+    # with Last-Event-ID
+    STREAM_TIMEOUT = 30
+
+    RETRY_MS = 3000
+
+    # Under WSGI a request answers with the events already there and ends; the
+    # browser asks again after this long, so no worker thread waits on a page
+    POLL_RETRY_MS = 5000
+    BATCH_SIZE = 100
+    RETENTION = timedelta(days=1)
+    PRUNE_EVERY = 200  # event ids
+
+    _latest = (0.0, None)  # (checked at, latest event id)
+    _lock = threading.Lock()
+
+    @classmethod
+    def publish(cls, kind, collection='', **data):
+        """
+        Record an event once the current transaction commits
+
+        Args:
+            kind (str): SYNC_COMPLETED or NEW_DATA
+            collection (str): Firestore collection the event is about
+            **data: JSON-serializable event details
+        """
+        def create():
+            event = SyncEvent.objects.create(kind=kind, collection=collection, data=data)
+            with cls._lock:
+                cls._latest = (time.monotonic(), max(event.pk, cls._latest[1] or 0))
+            if event.pk % cls.PRUNE_EVERY == 0:
+                SyncEvent.objects.filter(created_at__lt=timezone.now() - cls.RETENTION).delete()
+
+        transaction.on_commit(create)
+
+    @classmethod
+    def publish_new_data(cls, new_records):
+        """
+        Publish NEW_DATA for the collections whose number of unsynced records changed
+
+        Repeating the same count on every update check would show the same
+        notification again on every open page.
+
+        Args:
+            new_records (dict): Collection -> records in Firestore that aren't
+                synced yet, for every collection checked (0 included)
+        """
+        keys = {f'sync_events_new_data_{collection}': collection for collection in new_records}
+        published = cache.get_many(list(keys))
+        for key, collection in keys.items():
+            count = new_records[collection]
+            if count and published.get(key) != count:
+                cls.publish(cls.NEW_DATA, collection, new_records=count)
+        cache.set_many(
+            {key: new_records[collection] for key, collection in keys.items()}, int(cls.RETENTION.total_seconds())
+        )
+
+    @classmethod
+    def latest_id(cls):
+        """Id of the newest event (shared by every stream of this process)"""
+        with cls._lock:
+            checked_at, latest = cls._latest
+            if latest is None or time.monotonic() - checked_at >= cls.POLL_INTERVAL:
+                latest = SyncEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+                cls._latest = (time.monotonic(), latest)
+            return latest
+
+    @classmethod
+    def since(cls, last_id):
+        """Events after last_id, oldest first (at most BATCH_SIZE)"""
+        if cls.latest_id() <= last_id:
+            return []
+        return list(SyncEvent.objects.filter(id__gt=last_id).order_by('id')[:cls.BATCH_SIZE])
+
+    @staticmethod
+    def to_dict(event):
+        return {
+            'id': event.pk,
+            'kind': event.kind,
+            'collection': event.collection,
+            'created_at': event.created_at,
+            **event.data,
+        }
+
+    @classmethod
+    def format(cls, event):
+        """Server-sent event frame of an event"""
+        data = json.dumps(cls.to_dict(event), cls=DjangoJSONEncoder)
+        return f'id: {event.pk}\nevent: {event.kind}\ndata: {data}\n\n'
+
+    @classmethod
+    def poll(cls, last_id):
+        """
+        Server-sent events already recorded after last_id, for WSGI servers
+
+        Returns:
+            str: The frames, after a retry line telling the browser when to poll again
+        """
+        frames = [f'retry: {cls.POLL_RETRY_MS}\n\n']
+        frames.extend(cls.format(event) for event in cls.since(last_id))
+        return ''.join(frames)
+
+    @classmethod
+    async def astream(cls, last_id):
+        """
+        Server-sent events after last_id, for STREAM_TIMEOUT seconds (ASGI servers:
+        idle connections only cost a sleeping task)
+
+        Yields:
+            str: Event frames, and a comment line while idle to keep proxies from
+                 closing the connection
+        """
+        since = sync_to_async(cls.since)
+        deadline = time.monotonic() + cls.STREAM_TIMEOUT
+        yield f'retry: {cls.RETRY_MS}\n\n'
+        while time.monotonic() < deadline:
+            events = await since(last_id)
+            for event in events:
+                last_id = event.pk
+                yield cls.format(event)
+            if not events:
+                yield ': idle\n\n'
+                await asyncio.sleep(cls.POLL_INTERVAL)
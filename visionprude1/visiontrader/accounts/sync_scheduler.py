@@ -0,0 +1,263 @@
+"""
+Adaptive Sync Scheduler
+Syncs each collection on its own cadence, adapted from the rate at which its
+documents change, with freshness SLOs taking priority and every sync drawing
+on one global Firestore read budget
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .firebase_service import FirebaseService
+from .firebase_sync import FirebaseSyncService
+from .models import SyncSchedule
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    """Pick the collections due for a sync and adapt their intervals"""
+
+    # Weight of the newest sample in the smoothed change rate
+    SMOOTHING = 0.3
+
+    # An interval at most doubles from one sync to the next, so a collection that
+    # was briefly quiet is not pushed straight to the maximum interval
+    MAX_GROWTH = 2
+
+    # Reads assumed for a collection that has never been synced
+    DEFAULT_COST = 500
+
+    # A claimed collection isn't due again for this long, so another scheduler
+    # skips it while it syncs (and picks it up if the claiming process died)
+    LEASE_SECONDS = 900
+
+    @staticmethod
+    def config():
+        return {
+            'min_interval': getattr(settings, 'SYNC_SCHEDULE_MIN_INTERVAL', 60),
+            'max_interval': getattr(settings, 'SYNC_SCHEDULE_MAX_INTERVAL', 86400),
+            'initial_interval': getattr(settings, 'SYNC_SCHEDULE_INITIAL_INTERVAL', 3600),
+            'target_changes': getattr(settings, 'SYNC_SCHEDULE_TARGET_CHANGES', 5),
+            'read_budget': getattr(settings, 'SYNC_READ_BUDGET_PER_HOUR', 20000),
+        }
+
+    @staticmethod
+    def slo(collection_name):
+        """Freshness SLO of a collection in seconds (None if it has none)"""
+        return getattr(settings, 'SYNC_FRESHNESS_SLO', {}).get(collection_name)
+
+    @classmethod
+    def interval_for(cls, change_rate, current, slo=None):
+        """
+        Interval that lets about target_changes documents change between syncs
+
+        Args:
+            change_rate (float): Changed documents per hour
+            current (int): Current interval in seconds
+            slo (int): Freshness SLO in seconds, which the interval never exceeds
+
+        Returns:
+            int: Interval in seconds, within the configured bounds
+        """
+        config = cls.config()
+        if change_rate > 0:
+            interval = config['target_changes'] * 3600 / change_rate
+        else:
+            interval = config['max_interval']
+        interval = min(interval, current * cls.MAX_GROWTH)
+        interval = max(config['min_interval'], min(interval, config['max_interval']))
+        if slo:
+            interval = min(interval, max(slo, config['min_interval']))
+        return int(interval)
+
+    @classmethod
+    def schedules(cls, collections, now=None):
+        """Schedules of the collections, creating missing ones (due immediately)"""
+        now = now or timezone.now()
+        existing = {schedule.collection: schedule for schedule in SyncSchedule.objects.filter(collection__in=collections)}
+        initial = cls.config()['initial_interval']
+        for collection_name in collections:
+            if collection_name not in existing:
+                slo = cls.slo(collection_name)
+                existing[collection_name], _ = SyncSchedule.objects.get_or_create(
+                    collection=collection_name,
+                    defaults={'interval_seconds': min(initial, slo) if slo else initial, 'next_run_at': now},
+                )
+        return [existing[collection_name] for collection_name in collections]
+
+    @staticmethod
+    def reads_since(schedules, since):
+        return sum(reads for schedule in schedules for timestamp, reads in schedule.read_log if timestamp > since)
+
+    @classmethod
+    def urgency(cls, schedule, now):
+        """Time since the last sync relative to the SLO (or the interval); above 1 is late"""
+        if schedule.last_run_at is None:
+            return float('inf')
+        target = cls.slo(schedule.collection) or schedule.interval_seconds
+        return (now - schedule.last_run_at).total_seconds() / target
+
+    @classmethod
+    def plan(cls, collections, now=None):
+        """
+        Collections to sync now, most urgent first, within the read budget
+
+        Collections with a freshness SLO come first. Once the next collection's
+        expected reads don't fit in what is left of the hourly budget, it and
+        everything after it wait, so a large collection isn't starved by small ones.
+
+        Returns:
+            tuple: (due, deferred) lists of SyncSchedule
+        """
+        now = now or timezone.now()
+        schedules = cls.schedules(collections, now)
+        budget_left = cls.config()['read_budget'] - cls.reads_since(schedules, now.timestamp() - 3600)
+
+        waiting = [schedule for schedule in schedules if schedule.next_run_at <= now]
+        waiting.sort(key=lambda schedule: (cls.slo(schedule.collection) is None, -cls.urgency(schedule, now)))
+
+        due = []
+        for index, schedule in enumerate(waiting):
+            cost = schedule.last_reads or cls.DEFAULT_COST
+            if cost > budget_left:
+                return due, waiting[index:]
+            due.append(schedule)
+            budget_left -= cost
+        return due, []
+
+    @classmethod
+    def record(cls, collection_name, stats, now=None):
+        """
+        Update a collection's change rate and interval after it was synced
+
+        Args:
+            collection_name (str): Collection that was synced
+            stats (dict): Statistics returned by the sync
+        """
+        now = now or timezone.now()
+        changed = stats.get('changed', stats.get('created', 0) + stats.get('updated', 0))
+        reads = stats.get('total', 0)
+
+        with transaction.atomic():
+            schedule = SyncSchedule.objects.select_for_update().get(collection=collection_name)
+            if schedule.last_run_at is not None:
+                hours = max((now - schedule.last_run_at).total_seconds(), 1) / 3600
+                sample = changed / hours
+                schedule.change_rate = cls.SMOOTHING * sample + (1 - cls.SMOOTHING) * schedule.change_rate
+                schedule.interval_seconds = cls.interval_for(
+                    schedule.change_rate, schedule.interval_seconds, cls.slo(collection_name)
+                )
+            # The first sync finds every document new, which says nothing about the rate
+
+            schedule.last_run_at = now
+            schedule.next_run_at = now + timedelta(seconds=schedule.interval_seconds)
+            schedule.consecutive_failures = 0
+            schedule.last_reads = reads
+            schedule.last_changed = changed
+            hour_ago = now.timestamp() - 3600
+            schedule.read_log = [entry for entry in schedule.read_log if entry[0] > hour_ago] + [[now.timestamp(), reads]]
+            schedule.save()
+        return schedule
+
+    @classmethod
+    def record_failure(cls, collection_name, now=None):
+        """
+        Retry a failed sync after an exponential backoff
+
+        The delay starts at the minimum interval and doubles with every
+        consecutive failure, up to the collection's own interval.
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            schedule = SyncSchedule.objects.select_for_update().get(collection=collection_name)
+            schedule.consecutive_failures += 1
+            delay = min(
+                cls.config()['min_interval'] * 2 ** (schedule.consecutive_failures - 1),
+                schedule.interval_seconds,
+            )
+            schedule.next_run_at = now + timedelta(seconds=delay)
+            schedule.save(update_fields=['consecutive_failures', 'next_run_at', 'updated_at'])
+        return schedule
+
+    @classmethod
+    def claim(cls, schedule, now=None):
+        """
+        Mark a due collection as being synced
+
+        Returns:
+            bool: False if another scheduler claimed or synced it since plan()
+        """
+        now = now or timezone.now()
+        return bool(
+            SyncSchedule.objects.filter(pk=schedule.pk, next_run_at=schedule.next_run_at)
+            .update(next_run_at=now + timedelta(seconds=cls.LEASE_SECONDS))
+        )
+
+    @classmethod
+    def scheduled_collections(cls):
+        """Collections the scheduler syncs: all of them, except those kept current by listeners"""
+        listened = set(getattr(settings, 'FIRESTORE_LISTENERS', {}))
+        return [name for name in FirebaseService.get_all_collections() if name not in listened]
+
+    @classmethod
+    def run_due(cls, now=None):
+        """
+        Sync the collections that are due
+
+        Each one is claimed first, so schedulers running side by side don't
+        sync the same collection twice. A failed sync is retried with backoff.
+
+        Returns:
+            tuple: (collection -> sync statistics, deferred collection names)
+        """
+        due, deferred = cls.plan(cls.scheduled_collections(), now)
+        metrics.QUEUE_DEPTH.set(len(deferred), queue='sync_deferred')
+        results = {}
+        for schedule in due:
+            if not cls.claim(schedule, now):
+                logger.info(
+                    "Skipping %s: another scheduler is syncing it", schedule.collection,
+                    extra={'collection': schedule.collection},
+                )
+                continue
+            try:
+                stats = FirebaseSyncService.sync_collection(schedule.collection)
+            except Exception as e:
+                logger.error(
+                    "Error syncing %s: %s", schedule.collection, e, extra={'collection': schedule.collection}
+                )
+                cls.record_failure(schedule.collection, now)
+                continue
+            cls.record(schedule.collection, stats, now)
+            results[schedule.collection] = stats
+        return results, [schedule.collection for schedule in deferred]
+
+    @classmethod
+    def status(cls, now=None):
+        """
+        Schedule of every known collection
+
+        Returns:
+            list: Dicts with the schedule fields plus 'slo', 'urgency' and
+                  'reads_per_hour' (projected at the current interval)
+        """
+        now = now or timezone.now()
+        rows = []
+        for schedule in SyncSchedule.objects.all():
+            rows.append({
+                'collection': schedule.collection,
+                'interval_seconds': schedule.interval_seconds,
+                'change_rate': schedule.change_rate,
+                'last_run_at': schedule.last_run_at,
+                'next_run_at': schedule.next_run_at,
+                'slo': cls.slo(schedule.collection),
+                'urgency': cls.urgency(schedule, now),
+                'reads_per_hour': (schedule.last_reads or cls.DEFAULT_COST) * 3600 / schedule.interval_seconds,
+            })
+        return rows
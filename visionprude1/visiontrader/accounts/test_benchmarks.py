@@ -0,0 +1,55 @@
+"""
+Benchmark Tests
+The benchmark suite's cases at a small scale, with budgets loose enough for a
+slow CI machine; `manage.py run_benchmarks` is for real measurements. Collected
+by `manage.py test` and by pytest (see conftest.py)
+"""
+from django.core.cache import cache
+from django.test import TestCase
+
+from .benchmarks import BenchmarkSuite
+
+
+class BenchmarkTests(TestCase):
+    """Sync throughput and page latency on a seeded InMemoryBackend"""
+
+    SCALE = 500
+    VIEW_ROUNDS = 5
+
+    # Budgets
+    MIN_DOCS_PER_SEC = 20
+    MAX_P99_MS = 2000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.suite = BenchmarkSuite(cls.SCALE, view_rounds=cls.VIEW_ROUNDS)
+        cls.suite.seed()
+
+    def test_sync_throughput(self):
+        with self.suite.active():
+            results = self.suite.run_syncs()
+        for collection_name, row in results.items():
+            with self.subTest(collection=collection_name):
+                self.assertEqual(row['initial']['errors'], 0)
+                self.assertEqual(row['initial']['changed'], row['documents'])
+                self.assertEqual(row['resync']['changed'], 0)
+                self.assertGreaterEqual(row['initial']['docs_per_sec'], self.MIN_DOCS_PER_SEC)
+
+    def test_page_latency(self):
+        with self.suite.active():
+            self.suite.run_syncs()
+            views, totals = self.suite.run_views()
+        for name, stats in views.items():
+            with self.subTest(view=name):
+                self.assertEqual(stats['status'], 200)
+                self.assertEqual(stats['rounds'], self.VIEW_ROUNDS)
+                self.assertLessEqual(stats['p99_ms'], self.MAX_P99_MS)
+        self.assertGreater(totals['hits'], 0)
+
+    def test_default_cache_is_left_alone(self):
+        cache.set('kept', 1)
+        self.addCleanup(cache.delete, 'kept')
+        with self.suite.active():
+            self.suite.run_views()
+        self.assertEqual(cache.get('kept'), 1)
@@ -1,3 +1,1268 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from google.api_core.exceptions import ResourceExhausted
+
+from . import numeric_summary
+from .benchmarks import seed_firestore
+from .change_listener import ChangeListener, FakeListenerSource
+from .collection_stats import CollectionCounters
+from .columnar import ColumnarSnapshot
+from .conditional import SyncGeneration
+from .dashboard_snapshot import DashboardSnapshot
+from .data_browser import DataBrowser
+from .dead_letters import DeadLetters
+from .document_mirror import DocumentMirror
+from .exports import DataExport
+from .firebase_service import FirebaseService
+from .firebase_sync import FirebaseSyncService
+from .firestore_backends import InMemoryBackend
+from .firestore_capture import Anonymizer, RecordingBackend
+from .log_handlers import AsyncHandler, RateLimitFilter
+from .metrics import MetricsRegistry
+from .models import (
+    CollectionStats, DashboardSnapshotRecord, DeletedRow, FirestoreReadLedger, Purchase, RevenueRollup,
+    SignalNotification, SyncDeadLetter, SyncEvent, SyncSchedule,
+)
+from .numeric_summary import NumericSummary
+from .pagination import KeysetPaginator, estimate_count
+from .query_budget import QueryBudgetTestMixin
+from .query_shapes import QueryShapeRecorder
+from .rollups import RevenueRollups
+from .read_quota import ReadQuota
+from .schema_inference import SchemaInference
+from .search import FullTextSearch
+from .sync_events import SyncEvents
+from .sync_scheduler import SyncScheduler
+
+
+class SearchFallbackTests(TestCase):
+    """Queries the text index can't answer (terms shorter than MIN_TERM_LENGTH)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Purchase.objects.create(firebase_id='p1', product_name='Gold course', status='paid')
+        Purchase.objects.create(firebase_id='p2', product_name='Gold signals', status='pending')
+        Purchase.objects.create(firebase_id='p3', product_name='Silver course', status='paid')
+
+    def search(self, query):
+        queryset = FullTextSearch.fallback_filter(Purchase.objects.all(), Purchase, query)
+        return sorted(queryset.values_list('firebase_id', flat=True))
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('go pa'), ['p1'])
+        self.assertEqual(self.search('si pa'), ['p3'])
+
+    def test_single_term(self):
+        self.assertEqual(self.search('gol'), ['p1', 'p2'])
+
+    def test_terms_in_any_order(self):
+        # Matching the whole query as one string found nothing here
+        self.assertEqual(self.search('co go'), ['p1'])
+        self.assertEqual(self.search('co'), ['p1', 'p3'])
+
+
+class QueryShapeTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.log = os.path.join(directory, 'logs', 'query_shapes.log')
+        settings_override = override_settings(QUERY_SHAPE_LOG=self.log, QUERY_SHAPE_SLOW_MS=50)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        QueryShapeRecorder.flush()
+
+    def test_literals_share_a_shape(self):
+        self.assertEqual(
+            QueryShapeRecorder.normalize("SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s)  AND c > 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ?',
+        )
+
+    def test_flushed_runs_are_merged(self):
+        QueryShapeRecorder.record('SELECT 1 FROM t WHERE id = 1', None, 10)
+        QueryShapeRecorder.flush()
+        QueryShapeRecorder.record('SELECT 1 FROM t WHERE id = 2', None, 80)
+        QueryShapeRecorder.flush()
+
+        entry = QueryShapeRecorder.load(self.log)['SELECT ? FROM t WHERE id = ?']
+        self.assertEqual((entry['count'], entry['total_ms'], entry['max_ms'], entry['slow_count']), (2, 90, 80, 1))
+        self.assertEqual(entry['sample_sql'], 'SELECT 1 FROM t WHERE id = 2')
+
+    def test_report_flags_full_scans(self):
+        QueryShapeRecorder.record('SELECT "product_name" FROM "accounts_purchase" WHERE "description" = %s', ['x'], 120)
+        QueryShapeRecorder.record('SELECT "id" FROM "accounts_purchase" WHERE "id" = %s', [1], 1)
+        out = io.StringIO()
+        call_command('query_report', '--clear', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn('2 query shapes recorded', lines[0])
+        self.assertIn('UNINDEXED', lines[1])
+        self.assertIn('full scan on: SCAN accounts_purchase', out.getvalue())
+        self.assertFalse(os.path.exists(self.log))
+
+
+@unittest.skipUnless(ColumnarSnapshot.is_available(), 'pyarrow is not installed')
+class ColumnarExportTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(COLUMNAR_EXPORT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for n in range(3):
+            Purchase.objects.create(firebase_id=f'p{n}', product_name=f'Course {n}')
+
+    def exported_ids(self):
+        return sorted(ColumnarSnapshot.read('purchases', columns=['firebase_id']).column('firebase_id').to_pylist())
+
+    def test_incremental_export(self):
+        self.assertEqual(ColumnarSnapshot.export_model('purchases'), (3, 0))
+        Purchase.objects.create(firebase_id='p3')
+        self.assertEqual(ColumnarSnapshot.export_model('purchases'), (1, 0))
+        self.assertEqual(self.exported_ids(), ['p0', 'p1', 'p2', 'p3'])
+
+    def remove(self, *firebase_ids):
+        FirebaseSyncService.remove_documents('purchases', list(firebase_ids))
+
+    def test_deleted_rows_leave_the_export(self):
+        ColumnarSnapshot.export_model('purchases')
+        self.remove('p1')
+        self.assertEqual(ColumnarSnapshot.export_model('purchases'), (0, 1))
+        self.assertEqual(self.exported_ids(), ['p0', 'p2'])
+        # Tombstones are only written once
+        self.assertEqual(ColumnarSnapshot.export_model('purchases'), (0, 0))
+        self.assertFalse(DeletedRow.objects.exists())
+
+    def test_deletions_do_not_read_the_table(self):
+        ColumnarSnapshot.export_model('purchases')
+        self.remove('p0', 'p2')
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.assertEqual(ColumnarSnapshot.export_model('purchases'), (0, 2))
+        self.assertFalse([query for query in queries if 'FROM "accounts_purchase"' in query['sql']
+                          and 'WHERE' not in query['sql']])
+        self.assertEqual(self.exported_ids(), ['p1'])
+
+    def test_deletions_before_the_first_export_are_dropped(self):
+        self.remove('p0')
+        self.assertEqual(ColumnarSnapshot.export_model('purchases'), (2, 0))
+        self.assertFalse(DeletedRow.objects.exists())
+
+    def test_arrow_format(self):
+        ColumnarSnapshot.export_model('purchases', 'arrow')
+        self.remove('p0')
+        self.assertEqual(ColumnarSnapshot.export_model('purchases', 'arrow'), (0, 1))
+        self.assertEqual(self.exported_ids(), ['p1', 'p2'])
+
+    def test_numeric_summary_matches_the_database(self):
+        Purchase.objects.filter(firebase_id='p0').update(amount='10.50', paid='4.00')
+        Purchase.objects.filter(firebase_id='p1').update(amount='2.25')
+        self.assertIsNone(ColumnarSnapshot.numeric_summary('purchases'))
+        ColumnarSnapshot.export_model('purchases')
+        self.assertEqual(ColumnarSnapshot.numeric_summary('purchases'), NumericSummary.aggregate(Purchase))
+
+        out = io.StringIO()
+        call_command('export_columnar', 'purchases', '--summary', stdout=out)
+        self.assertRegex(out.getvalue(), r'Amount +sum +12\.75 +mean +6\.38')
+
+    def test_verify(self):
+        call_command('export_columnar', 'purchases', '--verify', stdout=io.StringIO())
+
+
+class NumericSummaryTests(TestCase):
+
+    DOCUMENTS = [
+        {'id': '1', 'amount': 10, 'paid': '5.5', 'status': 'paid', 'userId': 7},
+        {'id': '2', 'amount': 2.5, 'paid': None, 'status': 'paid'},
+        {'id': '3', 'amount': 'n/a', 'paid': 4, 'status': 'open'},
+        {'id': '4', 'paid': 1, 'status': 'open'},
+    ]
+
+    def test_detects_numeric_fields(self):
+        summary = NumericSummary.summarize(self.DOCUMENTS)
+        self.assertEqual(sorted(summary), ['Amount', 'Paid'])
+        self.assertEqual(summary['Amount'], {
+            'field': 'amount', 'sum': 12.5, 'count': 2, 'mean': 6.25, 'min': 2.5, 'max': 10.0, 'null_rate': 0.5,
+        })
+        self.assertEqual(summary['Paid']['sum'], 10.5)
+        self.assertEqual(summary['Paid']['count'], 3)
+
+    def test_known_fields(self):
+        self.assertEqual(list(NumericSummary.summarize(self.DOCUMENTS, fields=['paid'])), ['Paid'])
+
+    def test_schema_change_drops_cached_summary(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        documents = [{'id': '1', 'amount': 3}]
+        with self.captureOnCommitCallbacks(execute=True):
+            SchemaInference.observe('orders', documents)
+        fields = SchemaInference.numeric_fields('orders')
+        self.assertEqual(list(NumericSummary.for_collection('orders', documents, fields=fields)), ['Amount'])
+
+        documents.append({'id': '2', 'amount': 4, 'fee': 1.5})
+        with self.captureOnCommitCallbacks(execute=True):
+            SchemaInference.observe('orders', documents)
+        fields = SchemaInference.numeric_fields('orders')
+        self.assertEqual(list(NumericSummary.for_collection('orders', documents, fields=fields)), ['Amount', 'Fee'])
+
+    def test_pure_python_path_matches(self):
+        with_numpy = NumericSummary.summarize(self.DOCUMENTS)
+        with mock.patch.object(numeric_summary, 'np', None):
+            self.assertEqual(NumericSummary.summarize(self.DOCUMENTS), with_numpy)
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Rows sharing a synced_at are ordered by id, so pages must split the ties cleanly
+        now = timezone.now()
+        for n, hours in enumerate([0, 0, 0, 1, 1, 2, 2]):
+            purchase = Purchase.objects.create(firebase_id=f'p{n}')
+            Purchase.objects.filter(pk=purchase.pk).update(synced_at=now - timedelta(hours=hours))
+        cls.newest_first = list(Purchase.objects.order_by('-synced_at', '-id').values_list('pk', flat=True))
+
+    def paginator(self, total=None):
+        return KeysetPaginator(Purchase.objects.all(), 2, total=total)
+
+    def test_cursor_round_trip(self):
+        row = Purchase.objects.get(firebase_id='p3')
+        cursor = KeysetPaginator.encode_cursor(row, 'next', 5)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))),
+                         [row.synced_at.isoformat(), row.pk, 'next', 5])
+        self.assertEqual(KeysetPaginator.decode_cursor(cursor), (row.synced_at, row.pk, 'next', 5))
+
+    def test_next_pages_cover_every_row_once(self):
+        paginator = self.paginator()
+        page = paginator.page()
+        seen, starts = [], []
+        while True:
+            seen += [row.pk for row in page]
+            starts.append(page.start_index())
+            if not page.has_next():
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual(starts, [1, 3, 5, 7])
+        self.assertFalse(paginator.page().has_previous())
+
+    def test_previous_pages_from_the_last(self):
+        paginator = self.paginator(total=len(self.newest_first))
+        page = paginator.page('last')
+        self.assertEqual([row.pk for row in page], self.newest_first[-2:])
+        self.assertEqual((page.start_index(), page.end_index()), (6, 7))
+        self.assertFalse(page.has_next())
+
+        seen = []
+        while True:
+            seen = [row.pk for row in page] + seen
+            if not page.has_previous():
+                break
+            page = paginator.page(page.previous_cursor)
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual(page.start_index(), 1)
+
+    def test_previous_after_next_returns_the_same_page(self):
+        paginator = self.paginator()
+        second = paginator.page(paginator.page().next_cursor)
+        third = paginator.page(second.next_cursor)
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual([row.pk for row in back], [row.pk for row in second])
+        self.assertEqual(back.start_index(), second.start_index())
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        row = Purchase.objects.first()
+
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        cursors = [
+            'garbage', '!!!', encode({'a': 1}), encode(5), encode(['not a date', row.pk, 'next', 1]),
+            encode([row.synced_at.isoformat(), 'x', 'next', 1]),
+            encode([row.synced_at.isoformat(), row.pk, 'sideways', 1]),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        first = [row.pk for row in self.paginator().page()]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(KeysetPaginator.decode_cursor(cursor))
+                page = self.paginator().page(cursor)
+                self.assertEqual([row.pk for row in page], first)
+                self.assertEqual(page.start_index(), 1)
+
+    def test_estimate_count(self):
+        # SQLite's planner gives no row estimate
+        self.assertIsNone(estimate_count(Purchase.objects.all()))
+
+        with mock.patch('accounts.pagination.connection') as connection:
+            connection.vendor = 'mysql'
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.description = [('id',), ('ROWS',), ('filtered',)]
+            cursor.fetchall.return_value = [(1, 400, 25.0)]
+            self.assertEqual(estimate_count(Purchase.objects.filter(status='paid')), 100)
+            self.assertTrue(cursor.execute.call_args[0][0].startswith('EXPLAIN SELECT'))
+
+            cursor.execute.side_effect = Exception('no EXPLAIN')
+            with self.assertLogs('accounts.pagination', 'ERROR'):
+                self.assertIsNone(estimate_count(Purchase.objects.all()))
+
+
+class ExportTests(QueryBudgetTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        day = timezone.make_aware(timezone.datetime(2024, 3, 10, 12))
+        for n, status in enumerate(['paid', 'paid', 'pending', 'paid', 'refunded']):
+            Purchase.objects.create(
+                firebase_id=f'p{n}', status=status, amount=n, product_name=f'Course, "{n}"',
+                purchase_date=day + timedelta(days=n),
+            )
+        SignalNotification.objects.create(firebase_id='n1', signal_data={'pair': 'EURUSD', 'levels': [1.1, 1.2]})
+        cls.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, model_name='purchases', **params):
+        return self.client.get(reverse('model_export', args=[model_name]), params)
+
+    def csv_rows(self, response):
+        return list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_staff_only(self):
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+        self.assertEqual(self.export().status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.export().status_code, 302)
+
+    def test_within_budget(self):
+        response = self.assertWithinBudget(reverse('model_export', args=['purchases']) + '?status=paid')
+        self.assertEqual(response.status_code, 200)
+
+    def test_csv(self):
+        response = self.export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="purchases-\d{8}-\d{6}\.csv"')
+        rows = self.csv_rows(response)
+        self.assertEqual([row['firebase_id'] for row in rows], ['p0', 'p1', 'p2', 'p3', 'p4'])
+        self.assertEqual(rows[1]['product_name'], 'Course, "1"')
+        self.assertEqual(list(rows[0]), DataExport.fields(Purchase))
+
+    def test_csv_json_fields_are_json(self):
+        rows = self.csv_rows(self.export('signal_notifications'))
+        self.assertEqual(json.loads(rows[0]['signal_data']), {'pair': 'EURUSD', 'levels': [1.1, 1.2]})
+
+    def test_ndjson(self):
+        response = self.export(format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['firebase_id'] for row in rows], ['p0', 'p1', 'p2', 'p3', 'p4'])
+        self.assertEqual(rows[2]['amount'], '2.00')
+        self.assertTrue(rows[0]['purchase_date'].startswith('2024-03-10T12:00:00'))
+
+    def test_filters(self):
+        def exported(**params):
+            return [row['firebase_id'] for row in self.csv_rows(self.export(**params))]
+
+        self.assertEqual(exported(status='paid'), ['p0', 'p1', 'p3'])
+        # Both ends are inclusive days
+        self.assertEqual(exported(start='2024-03-11', end='2024-03-13'), ['p1', 'p2', 'p3'])
+        self.assertEqual(exported(start='2024-03-11', end='2024-03-13', status='paid'), ['p1', 'p3'])
+
+    def test_invalid_requests(self):
+        for model_name, params, status in [
+            ('purchases', {'start': '10/03/2024'}, 400),
+            ('purchases', {'end': '2024-13-01'}, 400),
+            ('purchases', {'format': 'xlsx'}, 400),
+            ('courses', {'status': 'paid'}, 400),
+            ('nothing', {}, 404),
+        ]:
+            with self.subTest(model_name=model_name, params=params):
+                response = self.export(model_name, **params)
+                self.assertEqual(response.status_code, status)
+                self.assertIn('error', response.json())
+
+    def test_rows_are_read_in_chunks(self):
+        response = self.export(format='ndjson')
+        with mock.patch.object(DataExport, 'CHUNK_SIZE', 2), CaptureQueriesContext(connections['default']) as queries:
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        # Windows of 2, 2 and 1 rows, each continuing after the last id
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all('LIMIT 2' in query['sql'] for query in queries))
+
+
+class CollectionCounterTests(TestCase):
+
+    def create(self, *ids):
+        for firebase_id in ids:
+            Purchase.objects.create(firebase_id=firebase_id)
+
+    def stats(self):
+        return CollectionStats.objects.get(model_label=CollectionCounters.key(Purchase))
+
+    def test_counts_follow_writes(self):
+        self.create('p1', 'p2')
+        CollectionCounters.record_write(Purchase, 2)
+        self.assertEqual((self.stats().row_count, self.stats().generation), (2, 1))
+
+        self.create('p3')
+        CollectionCounters.record_write(Purchase, 1)
+        CollectionCounters.record_write(Purchase, 0, updated=2)
+        self.assertEqual((self.stats().row_count, self.stats().generation), (3, 3))
+
+        Purchase.objects.filter(firebase_id='p1').delete()
+        CollectionCounters.record_write(Purchase, 0, deleted=1)
+        self.assertEqual((self.stats().row_count, self.stats().generation), (2, 4))
+        self.assertEqual(CollectionCounters.count(Purchase), Purchase.objects.count())
+
+    def test_unchanged_batch_keeps_the_generation(self):
+        CollectionCounters.record_write(Purchase, 0, updated=1)
+        changed_at = self.stats().last_changed_at
+        CollectionCounters.record_write(Purchase, 0)
+        stats = self.stats()
+        self.assertEqual((stats.generation, stats.last_changed_at), (1, changed_at))
+        self.assertGreater(stats.last_synced_at, changed_at)
+
+    def test_watermark_only_moves_forward(self):
+        now = timezone.now().replace(microsecond=0)
+        CollectionCounters.get(Purchase)
+        self.assertIsNone(self.stats().last_remote_watermark)
+
+        # The stored watermark starts out NULL, which GREATEST() alone would keep
+        CollectionCounters.record_write(Purchase, 0, now)
+        self.assertEqual(self.stats().last_remote_watermark, now)
+        CollectionCounters.record_write(Purchase, 0, now - timedelta(hours=1))
+        self.assertEqual(self.stats().last_remote_watermark, now)
+        CollectionCounters.record_write(Purchase, 0)
+        self.assertEqual(self.stats().last_remote_watermark, now)
+        CollectionCounters.record_write(Purchase, 0, now + timedelta(hours=1))
+        self.assertEqual(self.stats().last_remote_watermark, now + timedelta(hours=1))
+
+    def test_cached_generation_is_invalidated_after_commit(self):
+        with mock.patch.object(SyncGeneration, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks() as callbacks:
+                CollectionCounters.record_write(Purchase, 0, updated=1)
+                CollectionCounters.record_write(Purchase, 0)
+                invalidate.assert_not_called()
+            self.assertEqual(len(callbacks), 1)
+            callbacks[0]()
+        invalidate.assert_called_once_with(CollectionCounters.key(Purchase))
+
+
+class FirestoreTestCase(TestCase):
+    """Runs against an InMemoryBackend with an empty cache"""
+
+    COLLECTIONS = {}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.backend = InMemoryBackend({name: list(documents) for name, documents in self.COLLECTIONS.items()})
+        FirebaseService.set_backend(self.backend)
+        self.addCleanup(FirebaseService.set_backend, None)
+
+
+class DashboardSnapshotTests(FirestoreTestCase):
+
+    COLLECTIONS = {'purchases': [
+        {'id': 'p0', 'amount': 10, 'paid': 10, 'status': 'paid', 'purchase_date': '2020-01-01T00:00:00Z'},
+        {'id': 'p1', 'amount': 20, 'paid': 0, 'status': 'pending'},
+    ]}
+
+    def sync(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FirebaseSyncService.sync_collection('purchases')
+
+    def purchases(self):
+        return cache.get(DashboardSnapshot.CACHE_KEY)['sections']['purchases']
+
+    def test_sync_refreshes_the_cached_snapshot(self):
+        self.sync()
+        DashboardSnapshot.get()
+        self.backend.set('purchases', 'p2', {'amount': 5, 'status': 'paid', 'purchase_date': timezone.now().isoformat()})
+        self.sync()
+
+        purchases = self.purchases()
+        self.assertEqual((purchases['count'], purchases['recent']), (3, 1))
+        self.assertEqual(float(purchases['total_revenue']), 35)
+        self.assertEqual(DashboardSnapshot.context()['db_stats']['purchases'], 3)
+
+    def test_sync_without_a_cached_snapshot_computes_nothing(self):
+        with mock.patch.object(DashboardSnapshot, 'compute') as compute:
+            self.sync()
+        compute.assert_not_called()
+        self.assertIsNone(cache.get(DashboardSnapshot.CACHE_KEY))
+
+    @override_settings(DASHBOARD_SNAPSHOT_TABLE=True)
+    def test_cold_cache_is_rebuilt_from_the_record(self):
+        self.sync()
+        computed = DashboardSnapshot.get()
+        self.assertTrue(DashboardSnapshotRecord.objects.filter(key=DashboardSnapshot.CACHE_KEY).exists())
+
+        cache.clear()
+        with mock.patch.object(DashboardSnapshot, 'compute') as compute:
+            loaded = DashboardSnapshot.get()
+        compute.assert_not_called()
+        self.assertEqual(loaded['sections']['purchases']['count'], computed['sections']['purchases']['count'])
+        self.assertIsNotNone(cache.get(DashboardSnapshot.CACHE_KEY))
+
+    @override_settings(DASHBOARD_SNAPSHOT_TABLE=True)
+    def test_stale_record_is_recomputed(self):
+        self.sync()
+        DashboardSnapshot.get()
+        DashboardSnapshotRecord.objects.update(
+            computed_at=timezone.now() - timedelta(seconds=DashboardSnapshot.CACHE_TIMEOUT + 1)
+        )
+        cache.clear()
+        self.assertEqual(DashboardSnapshot.get()['sections']['purchases']['count'], 2)
+        self.assertGreater(
+            DashboardSnapshotRecord.objects.get().computed_at,
+            timezone.now() - timedelta(seconds=DashboardSnapshot.CACHE_TIMEOUT),
+        )
+
+
+class RevenueRollupTests(FirestoreTestCase):
+
+    # Amounts that round differently as floats and as decimal strings
+    COLLECTIONS = {'purchases': [
+        {'id': f'p{n}', 'amount': amount, 'paid': amount, 'status': 'paid', 'product_name': f'Course {n % 2}',
+         'purchase_date': f'2024-01-0{1 + n % 3}T12:00:00Z'}
+        for n, amount in enumerate([1.005, 2.675, 3.335, 10, None])
+    ]}
+
+    def rollup_rows(self):
+        return sorted(RevenueRollups.breakdown(), key=lambda row: row['dimension'])
+
+    def test_resyncs_match_a_rebuild(self):
+        for _ in range(3):
+            FirebaseService.clear_cache('purchases')
+            FirebaseSyncService.sync_collection('purchases')
+        incremental = (RevenueRollups.totals(), self.rollup_rows())
+        RevenueRollups.rebuild()
+        self.assertEqual((RevenueRollups.totals(), self.rollup_rows()), incremental)
+
+    def test_changed_and_deleted_rows_match_a_rebuild(self):
+        FirebaseSyncService.sync_collection('purchases')
+        FirebaseSyncService.sync_collection('purchases', documents=[
+            {'id': 'p0', 'amount': 7.125, 'status': 'refunded', 'product_name': 'Course 0'},
+        ])
+        FirebaseSyncService.remove_documents('purchases', ['p1'])
+        incremental = self.rollup_rows()
+        RevenueRollups.rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_racing_insert_adds_to_the_existing_row(self):
+        day = timezone.localdate()
+        RevenueRollup.objects.create(source='purchase', day=day, dimension='Course', status='paid', count=1)
+        delta = RevenueRollups.delta_for(Purchase, [])
+        delta.replace('new', {'purchase_date': day, 'product_name': 'Course', 'status': 'paid', 'amount': 1, 'paid': 1})
+
+        queryset = type(RevenueRollup.objects.all())
+        real_update = queryset.update
+        calls = []
+
+        def update(queryset, **kwargs):
+            # The first update misses the row, as if another sync created it just after
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(queryset, 'update', update):
+            delta.apply()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(RevenueRollups.totals(), {
+            'count': 2, 'amount_count': 1, 'amount_total': 1, 'paid_total': 1, 'avg_amount': 1,
+        })
+
+    def test_report(self):
+        FirebaseSyncService.sync_collection('purchases')
+        with mock.patch('django.utils.timezone.localdate', return_value=timezone.datetime(2024, 1, 3).date()):
+            days = RevenueRollups.time_series(start=timezone.datetime(2024, 1, 1).date())
+            out = io.StringIO()
+            call_command('revenue_report', '--by', 'product', '--days', '3', stdout=out)
+        self.assertEqual([str(row['period']) for row in days], ['2024-01-01', '2024-01-02', '2024-01-03'])
+        self.assertEqual(sum(row['count'] for row in days), 5)
+        self.assertIn('purchase / Course 0', out.getvalue())
+        self.assertIn('5 rows', out.getvalue())
+
+
+class DataBrowserTests(FirestoreTestCase):
+
+    COLLECTIONS = {
+        'purchases': [{'id': f'p{n:03d}', 'amount': n, 'status': 'paid'} for n in range(120)],
+        'watchlists': [{'id': f'w{n}', 'symbol': f'S{n}', 'size': n} for n in range(5)],
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(self.user)
+
+    def load_all(self, collection_name, limit):
+        page = DataBrowser.page(collection_name, limit=limit)
+        ids = [row['id'] for row in page['rows']]
+        sources = {page['source']}
+        while page['next_cursor']:
+            page = DataBrowser.page(collection_name, cursor=page['next_cursor'], limit=limit, source=page['source'])
+            ids += [row['id'] for row in page['rows']]
+            sources.add(page['source'])
+        return ids, sources
+
+    def test_synced_collection_is_read_locally(self):
+        FirebaseSyncService.sync_collection('purchases')
+        reads = self.backend.reads
+        response = self.client.get(reverse('firebase_data'), {'collection': 'purchases'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.backend.reads, reads)
+        self.assertEqual(response.context['document_count'], 120)
+        self.assertEqual(response.context['first_page']['source'], 'model')
+        self.assertEqual(response.context['collection_totals']['Amount']['sum'], sum(range(120)))
+
+    def test_load_more_goes_past_the_overview(self):
+        self.client.get(reverse('firebase_data'))
+        ids, sources = self.load_all('purchases', DataBrowser.OVERVIEW_PAGE_SIZE)
+        self.assertEqual(len(ids), 120)
+        self.assertEqual(sources, {'model'})
+
+    def test_session_keeps_its_source(self):
+        first = DataBrowser.page('watchlists', limit=2)
+        self.assertEqual(first['source'], 'firestore')
+
+        # Synced halfway through: the session still reads Firestore, the next one the mirror
+        FirebaseSyncService.sync_collection('watchlists')
+        second = DataBrowser.page('watchlists', cursor=first['next_cursor'], limit=2, source=first['source'])
+        self.assertEqual(second['source'], 'firestore')
+        self.assertEqual([row['id'] for row in second['rows']], ['w2', 'w3'])
+
+        mirrored = DataBrowser.page('watchlists', limit=2)
+        self.assertEqual(mirrored['source'], 'mirror')
+        self.assertEqual(mirrored['column_keys'], second['column_keys'])
+
+    def test_model_source_cannot_be_overridden(self):
+        FirebaseSyncService.sync_collection('purchases')
+        page = DataBrowser.page('purchases', limit=5, source='firestore')
+        self.assertEqual(page['source'], 'model')
+
+
+class DocumentMirrorTests(FirestoreTestCase):
+
+    COLLECTIONS = {'watchlists': [{'id': f'w{n}', 'symbol': f'S{n}', 'size': n} for n in range(4)]}
+
+    def mirrored_ids(self):
+        return sorted(DocumentMirror.queryset('watchlists').values_list('firebase_id', flat=True))
+
+    def test_full_sync_deletes_removed_documents(self):
+        FirebaseSyncService.sync_collection('watchlists')
+        self.backend.delete('watchlists', 'w1')
+        stats = FirebaseSyncService.sync_collection('watchlists')
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(self.mirrored_ids(), ['w0', 'w2', 'w3'])
+        self.assertEqual(DataBrowser.document_count('watchlists'), 3)
+
+    def test_changed_documents_keep_the_others(self):
+        FirebaseSyncService.sync_collection('watchlists')
+        FirebaseSyncService.sync_collection('watchlists', documents=[{'id': 'w0', 'symbol': 'X', 'size': 9}])
+        self.assertEqual(self.mirrored_ids(), ['w0', 'w1', 'w2', 'w3'])
+
+    def test_unknown_columns_are_ignored(self):
+        FirebaseSyncService.sync_collection('watchlists')
+        page = DataBrowser.page('watchlists', columns=['size', 'symbol__icontains', 'missing'])
+        self.assertEqual(page['column_keys'], ['size'])
+        self.assertEqual([row['cells'][0]['text'] for row in page['rows']], ['0', '1', '2', '3'])
+
+
+class ConditionalPageTests(FirestoreTestCase):
+
+    COLLECTIONS = {'purchases': [{'id': f'p{n}', 'amount': n, 'status': 'paid'} for n in range(3)]}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(self.user)
+        self.url = reverse('model_list', args=['purchases'])
+
+    def revalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unsynced_model_has_no_etag(self):
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+
+    def test_unchanged_page_is_not_modified(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FirebaseSyncService.sync_collection('purchases')
+        self.assertEqual(self.revalidate().status_code, 304)
+
+    def test_etag_depends_on_the_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FirebaseSyncService.sync_collection('purchases')
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_data_browser_always_renders(self):
+        FirebaseSyncService.sync_collection('purchases')
+        url = reverse('firebase_data')
+        response = self.client.get(url, {'collection': 'purchases'})
+        self.assertFalse(response.has_header('ETag') or response.has_header('Last-Modified'))
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, FirestoreTestCase):
+    """Every budgeted page within its declared @query_budget, on synced data"""
+
+    SCALE = 300  # 66 purchases, all named 'Course ...'
+
+    def setUp(self):
+        super().setUp()
+        seed_firestore(self.SCALE, self.backend)
+        with self.captureOnCommitCallbacks(execute=True):
+            FirebaseSyncService.sync_all_collections()
+        cache.clear()
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+
+    def test_dashboard(self):
+        self.assertWithinBudget(reverse('dashboard'))
+
+    def test_settings(self):
+        self.assertWithinBudget(reverse('settings'))
+
+    def test_data_browser(self):
+        self.assertWithinBudget(reverse('firebase_data') + '?collection=purchases')
+        self.assertWithinBudget(reverse('firebase_data') + '?collection=watchlists')
+        self.assertWithinBudget(reverse('firebase_data') + '?collection=purchases&refresh=true')
+
+    def test_data_browser_page(self):
+        page = self.client.get(reverse('firebase_data'), {'collection': 'purchases'}).context['first_page']
+        self.assertWithinBudget(reverse('firebase_data_page') + f"?collection=purchases&cursor={page['next_cursor']}")
+
+    def test_check_updates(self):
+        self.assertWithinBudget(reverse('check_firebase_updates') + '?collection=purchases')
+
+    def test_model_list(self):
+        url = reverse('model_list', args=['purchases'])
+        self.assertWithinBudget(url)
+        self.assertWithinBudget(url + '?cursor=last')
+
+    def test_model_list_search(self):
+        url = reverse('model_list', args=['purchases'])
+        response = self.assertWithinBudget(url + '?search=Course')
+        self.assertEqual(response.context['total_count'], Purchase.objects.count())
+        last = self.assertWithinBudget(url + '?search=Course&cursor=last')
+        self.assertEqual(len(last.context['page_obj']), Purchase.objects.count() % 25 or 25)
+
+    def test_model_detail(self):
+        purchase = Purchase.objects.first()
+        self.assertWithinBudget(reverse('model_detail', args=['purchases', purchase.pk]))
+
+
+class RequestProfileTests(FirestoreTestCase):
+
+    COLLECTIONS = {'purchases': [{'id': f'p{n}', 'amount': n, 'status': 'paid'} for n in range(3)]}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+
+    def get(self):
+        return self.client.get(reverse('firebase_data'), {'collection': 'purchases', 'refresh': 'true'})
+
+    def profiled(self):
+        """GET the page and return the profile's log record (None if it wasn't profiled)"""
+        with mock.patch('accounts.request_profile.logger') as logger, \
+                CaptureQueriesContext(connections['default']) as queries:
+            calls = self.backend.calls
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.firestore_calls = self.backend.calls - calls
+        self.queries = len(queries)
+        if not logger.info.called:
+            self.assertNotIn('Server-Timing', response)
+            return None
+        self.assertIn('Server-Timing', response)
+        self.server_timing = response['Server-Timing']
+        return logger.info.call_args.kwargs['extra']
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(self.profiled())
+
+    @override_settings(REQUEST_PROFILE_SAMPLE_RATE=1)
+    def test_recorded_figures(self):
+        record = self.profiled()
+        self.assertEqual((record['event'], record['view'], record['status']), ('request_profile', 'firebase_data', 200))
+        self.assertEqual(record['sql_count'], self.queries)
+        self.assertEqual(record['firestore_calls'], self.firestore_calls)
+        self.assertGreater(record['firestore_calls'], 0)
+        self.assertGreaterEqual(record['firestore_documents'], 3)
+        self.assertGreater(record['firestore_bytes'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreaterEqual(record['total_ms'], max(record['sql_ms'], record['firestore_ms'], record['template_ms']))
+        self.assertIn(f'sql;dur={record["sql_ms"]};desc="{record["sql_count"]} queries"', self.server_timing)
+        self.assertIn(f'total;dur={record["total_ms"]}', self.server_timing)
+
+    @override_settings(REQUEST_PROFILE_SAMPLE_RATE=0.25)
+    def test_sampling(self):
+        with mock.patch('accounts.request_profile.random.random', return_value=0.5):
+            self.assertIsNone(self.profiled())
+        with mock.patch('accounts.request_profile.random.random', return_value=0.1):
+            self.assertIsNotNone(self.profiled())
+
+
+class LogHandlerTests(unittest.TestCase):
+
+    def handler(self, maxsize=10000):
+        self.stream = io.StringIO()
+        handler = AsyncHandler(target_options={'stream': self.stream}, maxsize=maxsize)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        return handler
+
+    def record(self, msg, *args, level=logging.ERROR, name='accounts.firebase_sync'):
+        return logging.LogRecord(name, level, __file__, 0, msg, args, None)
+
+    def lines(self):
+        return self.stream.getvalue().splitlines()
+
+    def test_full_queue_drops_and_reports(self):
+        handler = self.handler(maxsize=2)
+        # Nothing drains the queue while the listener is stopped
+        handler.listener.stop()
+        for n in range(4):
+            handler.handle(self.record('record %d', n))
+        self.assertEqual(handler.dropped, 2)
+
+        handler.listener.start()
+        handler.handle(self.record('record %d', 4))
+        self.assertEqual(handler.dropped, 0)
+        handler.close()
+        self.assertEqual(self.lines(), [
+            'record 0', 'record 1', 'Dropped 2 log records: the logging queue was full', 'record 4',
+        ])
+
+    def test_close_writes_what_is_queued(self):
+        handler = self.handler()
+        for n in range(500):
+            handler.handle(self.record('record %d', n))
+        handler.close()
+        self.assertEqual(self.lines(), [f'record {n}' for n in range(500)])
+        self.assertIsNone(handler.listener)
+
+    def test_rate_limit(self):
+        log_filter = RateLimitFilter(rate=2, per=60)
+        clock = [1000.0]
+
+        def passed(*records):
+            with mock.patch('accounts.log_handlers.time.monotonic', lambda: clock[0]):
+                return [record for record in records if log_filter.filter(record)]
+
+        errors = [self.record('Error syncing %s', n) for n in range(5)]
+        self.assertEqual(passed(*errors), errors[:2])
+        # Other messages, loggers and lower levels have their own allowance or none
+        other = [
+            self.record('Error fetching %s', 1), self.record('Error syncing %s', 1, name='accounts.views'),
+            self.record('Error syncing %s', 1, level=logging.WARNING),
+        ]
+        self.assertEqual(passed(*other), other)
+
+        clock[0] += 60
+        summary = self.record('Error syncing %s', 5)
+        self.assertEqual(passed(summary, self.record('Error syncing %s', 6)), [summary, mock.ANY])
+        self.assertEqual(summary.suppressed, 3)
+        self.assertEqual(summary.getMessage(), 'Error syncing 5 [3 similar messages suppressed]')
+
+    def test_module_loggers_propagate_to_accounts(self):
+        self.assertEqual(list(settings.LOGGING['loggers']), ['accounts'])
+        parent = logging.getLogger('accounts')
+        self.assertEqual([type(handler) for handler in parent.handlers], [AsyncHandler])
+        for name in ('accounts.views', 'accounts.firebase_sync', 'accounts.sync_scheduler', 'accounts.pagination'):
+            with self.subTest(logger=name):
+                module_logger = logging.getLogger(name)
+                self.assertEqual(module_logger.handlers, [])
+                self.assertTrue(module_logger.propagate)
+                self.assertEqual(module_logger.getEffectiveLevel(), logging.INFO)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_staff_only_without_a_token(self):
+        url = reverse('metrics')
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url).status_code, 401)
+            self.client.force_login(User.objects.create_user('viewer', password='secret'))
+            self.assertEqual(self.client.get(url).status_code, 401)
+            self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_token(self):
+        url = reverse('metrics')
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(url).status_code, 401)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_exited_processes_are_folded_in(self):
+        registry = MetricsRegistry()
+        requests = registry.counter('requests_total', 'Requests')
+        depth = registry.gauge('depth', 'Queue depth', mode='livesum')
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        pid = int(exited.stdout)
+        with open(os.path.join(self.directory, f'metrics-{pid}.json'), 'w') as handle:
+            json.dump({'pid': pid, 'values': [['requests_total', [], 5], ['depth', [], [3, 0]]]}, handle)
+
+        with self.settings(METRICS_DIR=self.directory):
+            requests.inc(2)
+            depth.set(1)
+            merged = registry.merged()
+            self.assertEqual(merged[('requests_total', ())], 7)
+            self.assertEqual(merged[('depth', ())], 1)
+            self.assertEqual(os.listdir(self.directory), [f'metrics-{os.getpid()}.json'])
+            self.assertEqual(registry.merged()[('requests_total', ())], 7)
+
+
+class SyncEventTests(FirestoreTestCase):
+
+    COLLECTIONS = {'purchases': [{'id': f'p{n}', 'amount': n} for n in range(3)]}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('viewer', password='secret'))
+
+    def check_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(reverse('check_firebase_updates'), {'collection': 'purchases'}).json()
+
+    def new_data_events(self):
+        return list(SyncEvent.objects.filter(kind=SyncEvents.NEW_DATA).values_list('data__new_records', flat=True))
+
+    def test_new_data_is_published_when_the_count_changes(self):
+        self.assertEqual(self.check_updates()['total_new'], 3)
+        self.check_updates()
+        self.assertEqual(self.new_data_events(), [3])
+
+        self.backend.set('purchases', 'p3', {'amount': 3})
+        self.check_updates()
+        self.assertEqual(self.new_data_events(), [3, 4])
+
+    def test_wsgi_request_returns_without_waiting(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            SyncEvents.publish(SyncEvents.NEW_DATA, 'purchases', new_records=1)
+        response = self.client.get(reverse('sync_events'), {'after': 0})
+        self.assertFalse(response.streaming)
+        body = response.content.decode()
+        self.assertTrue(body.startswith(f'retry: {SyncEvents.POLL_RETRY_MS}'))
+        self.assertIn('event: new_data', body)
+
+
+@override_settings(
+    SYNC_SCHEDULE_MIN_INTERVAL=60, SYNC_SCHEDULE_MAX_INTERVAL=86400, SYNC_SCHEDULE_INITIAL_INTERVAL=3600,
+    SYNC_SCHEDULE_TARGET_CHANGES=5, SYNC_READ_BUDGET_PER_HOUR=20000, SYNC_FRESHNESS_SLO={}, FIRESTORE_LISTENERS={},
+)
+class SyncSchedulerTests(FirestoreTestCase):
+    """Runs on a fake clock: every call gets `now` explicitly"""
+
+    COLLECTIONS = {
+        'purchases': [{'id': f'p{n}', 'amount': n, 'status': 'paid'} for n in range(3)],
+        'watchlists': [{'id': f'w{n}', 'symbol': f'S{n}'} for n in range(2)],
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(microsecond=0)
+
+    def run_at(self, seconds):
+        return SyncScheduler.run_due(self.now + timedelta(seconds=seconds))[0]
+
+    def schedule(self, collection_name='purchases'):
+        return SyncSchedule.objects.get(collection=collection_name)
+
+    def test_collections_run_when_due(self):
+        self.assertEqual(sorted(self.run_at(0)), ['purchases', 'watchlists'])
+        schedule = self.schedule()
+        self.assertEqual((schedule.last_run_at, schedule.last_reads), (self.now, 3))
+        self.assertEqual(schedule.next_run_at, self.now + timedelta(hours=1))
+
+        self.assertEqual(self.run_at(1800), {})
+        self.assertEqual(sorted(self.run_at(3600)), ['purchases', 'watchlists'])
+
+    def test_quiet_collection_backs_off(self):
+        self.run_at(0)
+        elapsed, intervals = 0, []
+        for _ in range(3):
+            elapsed += self.schedule().interval_seconds
+            self.run_at(elapsed)
+            intervals.append(self.schedule().interval_seconds)
+        # Nothing changes, so the interval doubles each time (never more)
+        self.assertEqual(intervals, [7200, 14400, 28800])
+
+        # A burst of new documents brings it back down
+        for n in range(3, 40):
+            self.backend.set('purchases', f'p{n}', {'amount': n, 'status': 'paid'})
+        FirebaseService.clear_cache('purchases')
+        self.run_at(elapsed + intervals[-1])
+        schedule = self.schedule()
+        self.assertEqual(schedule.last_changed, 37)
+        self.assertLess(schedule.interval_seconds, intervals[-1])
+
+    def test_failed_sync_retries_with_backoff(self):
+        self.run_at(0)
+        elapsed, delays = 3600, []
+        with mock.patch.object(FirebaseSyncService, 'sync_collection', side_effect=RuntimeError('down')), \
+                self.assertLogs('accounts.sync_scheduler', 'ERROR'):
+            for _ in range(8):
+                self.run_at(elapsed)
+                delay = (self.schedule().next_run_at - (self.now + timedelta(seconds=elapsed))).total_seconds()
+                delays.append(delay)
+                elapsed += delay
+        self.assertEqual(delays, [60, 120, 240, 480, 960, 1920, 3600, 3600])
+        self.assertEqual(self.schedule().consecutive_failures, 8)
+
+        self.assertIn('purchases', self.run_at(elapsed))
+        schedule = self.schedule()
+        self.assertEqual(schedule.consecutive_failures, 0)
+        self.assertEqual(schedule.next_run_at, self.now + timedelta(seconds=elapsed + schedule.interval_seconds))
+
+    def test_collection_being_synced_is_skipped(self):
+        sync = FirebaseSyncService.sync_collection
+        second = {}
+
+        def sync_collection(collection_name, *args, **kwargs):
+            if 'results' not in second:
+                # A second scheduler starts while the first is syncing its first collection
+                second['results'] = None
+                second['results'] = SyncScheduler.run_due(self.now)[0]
+            return sync(collection_name, *args, **kwargs)
+
+        with mock.patch.object(FirebaseSyncService, 'sync_collection', side_effect=sync_collection) as patched:
+            first = SyncScheduler.run_due(self.now)[0]
+        # Each collection is synced once, by whichever scheduler claimed it
+        self.assertEqual(sorted(call.args[0] for call in patched.call_args_list), ['purchases', 'watchlists'])
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second['results']), 1)
+        self.assertNotEqual(list(first), list(second['results']))
+
+    def test_claim_expires(self):
+        schedule = SyncScheduler.schedules(['purchases'], self.now)[0]
+        self.assertTrue(SyncScheduler.claim(schedule, self.now))
+        self.assertFalse(SyncScheduler.claim(schedule, self.now))
+        # The claiming process died: the collection is due again once the lease runs out
+        self.assertEqual(list(self.run_at(SyncScheduler.LEASE_SECONDS - 1)), ['watchlists'])
+        self.assertEqual(list(self.run_at(SyncScheduler.LEASE_SECONDS)), ['purchases'])
+
+
+class ChangeListenerTests(FirestoreTestCase):
+
+    COLLECTIONS = {'watchlists': [{'id': f'w{n}', 'symbol': f'S{n}', 'size': n} for n in range(3)]}
+
+    def listener(self, **options):
+        self.source = FakeListenerSource()
+        listener = ChangeListener({'watchlists': options}, source=self.source)
+        listener.connect('watchlists')
+        return listener
+
+    def snapshot(self):
+        return [('added', dict(doc)) for doc in self.COLLECTIONS['watchlists']]
+
+    def mirrored(self):
+        return dict(DocumentMirror.queryset('watchlists').values_list('firebase_id', 'data__size'))
+
+    def test_snapshot_changes_and_removals(self):
+        listener = self.listener()
+        self.source.push('watchlists', *self.snapshot())
+        self.assertEqual(listener.flush()['watchlists']['created'], 3)
+
+        self.source.push('watchlists', ('modified', {'id': 'w0', 'symbol': 'S0', 'size': 10}))
+        self.source.push('watchlists', ('removed', {'id': 'w2'}))
+        stats = listener.flush()['watchlists']
+        self.assertEqual((stats['updated'], stats['removed']), (1, 1))
+        self.assertEqual(self.mirrored(), {'w0': 10, 'w1': 1})
+
+    def test_reconnect_replaces_the_snapshot(self):
+        listener = self.listener()
+        self.source.push('watchlists', *self.snapshot())
+        listener.flush()
+
+        # While disconnected w2 is deleted; the new snapshot doesn't have it
+        self.source.disconnect('watchlists')
+        listener.ensure_connected()
+        self.assertEqual(listener.reconnects, 1)
+        self.source.push('watchlists', *self.snapshot()[:2])
+        self.assertEqual(listener.flush()['watchlists']['removed'], 1)
+        self.assertEqual(sorted(self.mirrored()), ['w0', 'w1'])
+
+        # Replaying the snapshot doesn't count its documents twice
+        schema = SchemaInference.get('watchlists')
+        self.assertEqual(schema['document_count'], 2)
+        self.assertEqual(schema['fields'][0]['presence_rate'], 1)
+
+    def test_empty_snapshot(self):
+        listener = self.listener()
+        self.source.push('watchlists', *self.snapshot())
+        listener.flush()
+        self.source.disconnect('watchlists')
+        listener.ensure_connected()
+        self.source.push('watchlists')
+        listener.flush()
+        self.assertEqual(self.mirrored(), {})
+
+    def test_resumed_listener_finds_deletions(self):
+        listener = self.listener(resume_field='updated_at')
+        self.source.push('watchlists', *self.snapshot())
+        listener.flush()
+
+        self.backend.delete('watchlists', 'w1')
+        self.source.disconnect('watchlists')
+        listener.ensure_connected()
+        self.source.push('watchlists')  # nothing updated since the watermark
+        self.assertEqual(listener.flush()['watchlists']['removed'], 1)
+        self.assertEqual(sorted(self.mirrored()), ['w0', 'w2'])
+
+    def test_backend_listen_is_one_call(self):
+        changes = []
+        watch = self.backend.listen('watchlists', changes.extend, filters=[('size', '>=', 1)])
+        self.addCleanup(watch.unsubscribe)
+        self.assertEqual((self.backend.calls, self.backend.reads), (1, 2))
+        self.assertEqual([(change.kind, change.document_id) for change in changes], [('added', 'w1'), ('added', 'w2')])
+
+        # A listen that fails counts its call once too
+        self.backend.fail_next()
+        with self.assertRaises(ResourceExhausted):
+            self.backend.listen('watchlists', changes.extend)
+        self.assertEqual(self.backend.calls, 2)
+
+
+class DeadLetterTests(FirestoreTestCase):
+
+    COLLECTIONS = {'purchases': [{'id': f'p{n}', 'amount': n, 'status': 'paid'} for n in range(3)]}
+
+    def failing(self, *document_ids):
+        """Make the writes of these documents fail"""
+        update_or_create = Purchase.objects.update_or_create
+
+        def write(firebase_id, defaults):
+            if firebase_id in document_ids:
+                raise ValueError(f'cannot write {firebase_id}')
+            return update_or_create(firebase_id=firebase_id, defaults=defaults)
+
+        return mock.patch.object(Purchase.objects, 'update_or_create', side_effect=write)
+
+    def synced_ids(self):
+        return sorted(Purchase.objects.values_list('firebase_id', flat=True))
+
+    def test_failure_is_recorded(self):
+        with self.failing('p1'):
+            stats = FirebaseSyncService.sync_collection('purchases')
+        self.assertEqual(stats['errors'], 1)
+        letter = SyncDeadLetter.objects.get()
+        self.assertEqual((letter.document_id, letter.error_class, letter.attempts), ('p1', 'ValueError', 1))
+        self.assertEqual(letter.document['amount'], 1)
+
+    def test_unchanged_failure_is_skipped(self):
+        with self.failing('p1'):
+            FirebaseSyncService.sync_collection('purchases')
+        stats = FirebaseSyncService.sync_collection('purchases')
+        self.assertEqual((stats['skipped'], stats['errors']), (1, 0))
+        self.assertEqual(self.synced_ids(), ['p0', 'p2'])
+        self.assertEqual(SyncDeadLetter.objects.get().attempts, 1)
+
+    def test_changed_content_is_retried(self):
+        with self.failing('p1'):
+            FirebaseSyncService.sync_collection('purchases')
+            self.backend.set('purchases', 'p1', {'amount': 10, 'status': 'paid'})
+            stats = FirebaseSyncService.sync_collection('purchases')
+        self.assertEqual((stats['skipped'], stats['errors']), (0, 1))
+        letter = SyncDeadLetter.objects.get()
+        self.assertEqual((letter.attempts, letter.document['amount']), (2, 10))
+
+    def test_success_removes_the_dead_letter(self):
+        with self.failing('p1'):
+            FirebaseSyncService.sync_collection('purchases')
+        self.backend.set('purchases', 'p1', {'amount': 10, 'status': 'paid'})
+        stats = FirebaseSyncService.sync_collection('purchases')
+        self.assertEqual(stats['errors'], 0)
+        self.assertFalse(SyncDeadLetter.objects.exists())
+        self.assertEqual(self.synced_ids(), ['p0', 'p1', 'p2'])
+
+    def test_retry_from_the_stored_copy(self):
+        with self.failing('p1'):
+            FirebaseSyncService.sync_collection('purchases')
+        # The stored copy is retried even though Firestore has changed (or is gone)
+        self.backend.delete('purchases', 'p1')
+        FirebaseService.set_backend(None)
+        results = DeadLetters.retry('purchases')
+        self.assertEqual((results['purchases']['created'], results['purchases']['missing']), (1, 0))
+        self.assertFalse(SyncDeadLetter.objects.exists())
+        self.assertEqual(Purchase.objects.get(firebase_id='p1').amount, 1)
+
+
+class ReadQuotaTests(TestCase):
+
+    def test_reads_of_another_database_are_dropped(self):
+        # e.g. recorded in a test database that has been destroyed since
+        with mock.patch.object(ReadQuota, '_database', return_value='test_database'):
+            ReadQuota.record('purchases', 5)
+        self.assertTrue(ReadQuota._pending)
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            ReadQuota.flush()
+        self.assertEqual(ReadQuota._pending, {})
+        self.assertFalse(FirestoreReadLedger.objects.exists())
+
+
+class ReplayCaptureTests(TestCase):
+
+    def capture(self, payloads):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        backend = InMemoryBackend({'purchases': [{'id': f'p{n}', 'amount': n, 'status': 'paid'} for n in range(3)]})
+        recorder = RecordingBackend(backend, directory, payloads=payloads)
+        recorder.query('purchases')
+        recorder.close()
+        return directory
+
+    def replay(self, *args):
+        call_command('replay_capture', *args, '--no-timing', stdout=io.StringIO())
+
+    def test_replays_into_the_database_only_when_asked(self):
+        self.replay(self.capture('anonymized'), '--sync', 'purchases', '--into-database')
+        self.assertEqual(Purchase.objects.count(), 3)
+        with self.assertRaises(CommandError):
+            self.replay(self.capture('anonymized'), '--into-database')
+
+    def test_replayed_reads_are_not_accounted(self):
+        capture = self.capture('anonymized')
+        pending = dict(ReadQuota._pending)
+        self.replay(capture, '--sync', 'purchases', '--into-database')
+        self.assertEqual(Purchase.objects.count(), 3)
+        self.assertEqual(ReadQuota._pending, pending)
+
+    def test_refuses_captures_without_payloads(self):
+        with self.assertRaises(CommandError):
+            self.replay(self.capture('none'), '--sync', 'purchases', '--into-database')
+        self.assertEqual(Purchase.objects.count(), 0)
+
+    def test_tokens_are_stable_across_processes(self):
+        self.assertEqual(Anonymizer.from_settings().token('user-1'), Anonymizer.from_settings().token('user-1'))
+        self.assertNotEqual(Anonymizer.from_settings('a').token('user-1'), Anonymizer.from_settings('b').token('user-1'))
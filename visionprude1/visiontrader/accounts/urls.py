@@ -9,9 +9,13 @@ urlpatterns = [
     path('dashboard/', views.dashboard_view, name='dashboard'),
     path('settings/', views.settings_view, name='settings'),
     path('firebase-data/', views.firebase_data_view, name='firebase_data'),
+    path('firebase-data/page/', views.firebase_data_page, name='firebase_data_page'),
+    path('firebase-data/events/', views.sync_events_view, name='sync_events'),
     path('sync-firebase/', views.sync_firebase_to_db, name='sync_firebase'),
     path('check-firebase-updates/', views.check_firebase_updates, name='check_firebase_updates'),
     path('test-database/', views.test_database_connection, name='test_database'),
+    path('metrics/', views.metrics_view, name='metrics'),
     path('data/<str:model_name>/', views.model_list_view, name='model_list'),
+    path('data/<str:model_name>/export/', views.model_export_view, name='model_export'),
     path('data/<str:model_name>/<int:pk>/', views.model_detail_view, name='model_detail'),
 ]
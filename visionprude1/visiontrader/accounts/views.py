@@ -1,54 +1,37 @@
+import logging
+import time
+
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import condition
+from django.utils.crypto import constant_time_compare
+from django.conf import settings as django_settings
 from .models import (
-    UserProfile, SystemSettings, Purchase, PremiumSignalPayment,
-    SignalNotification, UserProgress, PremiumSignal, PremiumSignalSubscription,
-    Course, FCMToken, AppNotification, Testimonial, FirebaseUser
+    Purchase, PremiumSignalPayment, SignalNotification, UserProgress,
+    PremiumSignal, PremiumSignalSubscription, Course, FCMToken,
+    AppNotification, Testimonial, FirebaseUser
 )
-from django.db.models import Count
 from .firebase_service import FirebaseService
 from .firebase_sync import FirebaseSyncService
+from .dashboard_snapshot import DashboardSnapshot
+from .collection_stats import CollectionCounters
+from .pagination import KeysetPaginator, estimate_count
+from .search import FullTextSearch
+from .exports import DataExport
+from .data_browser import DataBrowser
+from .schema_inference import SchemaInference
+from .conditional import SyncGeneration
+from .sync_events import SyncEvents
+from .query_budget import query_budget
+from .metrics import REGISTRY
 
 
-def calculate_collection_totals(data, fields):
-    """
-    Calculate totals for numeric fields in a collection
-
-    Args:
-        data (list): List of documents
-        fields (list): List of field names to calculate totals for
-
-    Returns:
-        dict: Dictionary with field names and their totals
-    """
-    totals = {}
-    for field in fields:
-        total = 0
-        count = 0
-        for doc in data:
-            value = doc.get(field, 0)
-            # Try to convert to float if it's a numeric value
-            try:
-                if value is not None and value != '':
-                    total += float(value)
-                    count += 1
-            except (ValueError, TypeError):
-                continue
-
-        if count > 0:
-            # Format field name for display
-            display_name = field.replace('_', ' ').title()
-            totals[display_name] = {
-                'value': total,
-                'count': count,
-                'average': total / count if count > 0 else 0
-            }
-
-    return totals
+logger = logging.getLogger(__name__)
 
 
 def login_view(request):
@@ -102,104 +85,24 @@ def logout_view(request):
     return redirect('login')
 
 
+@query_budget(sql=16, firestore=0, rows=60)
 @login_required
 def dashboard_view(request):
-    from django.db.models import Sum, Avg
-    from datetime import timedelta
-    from django.utils import timezone
-
     user = request.user
     profile = user.profile
     settings = user.settings
 
-    # Get database statistics
-    db_stats = {
-        'purchases': Purchase.objects.count(),
-        'premium_payments': PremiumSignalPayment.objects.count(),
-        'signal_notifications': SignalNotification.objects.count(),
-        'user_progress': UserProgress.objects.count(),
-        'premium_signals': PremiumSignal.objects.count(),
-        'premium_signal_subscriptions': PremiumSignalSubscription.objects.count(),
-        'courses': Course.objects.count(),
-        'fcm_tokens': FCMToken.objects.count(),
-        'app_notifications': AppNotification.objects.count(),
-        'testimonials': Testimonial.objects.count(),
-        'firebase_users': FirebaseUser.objects.count(),
-    }
-
-    # Calculate total records
-    total_records = sum(db_stats.values())
-
-    # Revenue statistics
-    purchase_stats = Purchase.objects.aggregate(
-        total_revenue=Sum('amount'),
-        total_paid=Sum('paid'),
-        avg_purchase=Avg('amount')
-    )
-
-    premium_stats = PremiumSignalPayment.objects.aggregate(
-        total_revenue=Sum('amount'),
-        total_paid=Sum('paid'),
-        avg_payment=Avg('amount')
-    )
-
-    # Recent activity - last 7 days
-    week_ago = timezone.now() - timedelta(days=7)
-
-    recent_purchases = Purchase.objects.filter(
-        purchase_date__gte=week_ago
-    ).count() if Purchase.objects.filter(purchase_date__isnull=False).exists() else 0
-
-    recent_payments = PremiumSignalPayment.objects.filter(
-        payment_date__gte=week_ago
-    ).count() if PremiumSignalPayment.objects.filter(payment_date__isnull=False).exists() else 0
-
-    recent_notifications = SignalNotification.objects.filter(
-        notification_date__gte=week_ago
-    ).count() if SignalNotification.objects.filter(notification_date__isnull=False).exists() else 0
-
-    # Latest records
-    latest_purchases = Purchase.objects.all()[:5]
-    latest_payments = PremiumSignalPayment.objects.all()[:5]
-    latest_signals = PremiumSignal.objects.all()[:5]
-    latest_users = FirebaseUser.objects.all()[:10]
-
-    # User engagement
-    active_subscriptions = PremiumSignalSubscription.objects.filter(
-        status='active'
-    ).count()
-
-    unread_notifications = SignalNotification.objects.filter(
-        read=False
-    ).count()
-
-    # Calculate totals
-    total_revenue = (purchase_stats['total_revenue'] or 0) + (premium_stats['total_revenue'] or 0)
-    total_paid = (purchase_stats['total_paid'] or 0) + (premium_stats['total_paid'] or 0)
-
     context = {
         'user': user,
         'profile': profile,
         'settings': settings,
-        'db_stats': db_stats,
-        'total_records': total_records,
-        'total_revenue': total_revenue,
-        'total_paid': total_paid,
-        'purchase_stats': purchase_stats,
-        'premium_stats': premium_stats,
-        'recent_purchases': recent_purchases,
-        'recent_payments': recent_payments,
-        'recent_notifications': recent_notifications,
-        'latest_purchases': latest_purchases,
-        'latest_payments': latest_payments,
-        'latest_signals': latest_signals,
-        'latest_users': latest_users,
-        'active_subscriptions': active_subscriptions,
-        'unread_notifications': unread_notifications,
     }
+    # All database statistics come from the cached snapshot (refreshed after each sync)
+    context.update(DashboardSnapshot.context())
     return render(request, 'accounts/dashboard.html', context)
 
 
+@query_budget(sql=10, firestore=0, rows=10)
 @login_required
 def settings_view(request):
     user = request.user
@@ -333,19 +236,100 @@ def settings_view(request):
     return render(request, 'accounts/settings.html', context)
 
 
+def _page_etag(request, *parts):
+    """
+    ETag of an HTML page, or None while the page has to be rendered
+
+    Pages show the logged-in user and their flash messages, so the user is
+    part of the ETag and a page with messages waiting is never answered with 304.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    return SyncGeneration.etag('html', request.user.pk, *parts)
+
+
+def _model_etag(request, model_name, pk=None):
+    """ETag of the model list/detail pages: the model's sync state"""
+    entry = DataExport.MODELS.get(model_name)
+    if entry is None:
+        return None
+    label = CollectionCounters.key(entry[0])
+    state = SyncGeneration.get([label])[label]
+    if not state[0]:
+        # Never synced: there is no generation telling versions of the page apart
+        return None
+    return _page_etag(request, model_name, pk, state, sorted(request.GET.lists()))
+
+
+def _firebase_data_page_etag(request):
+    """ETag of a data browser page served from the local mirror"""
+    collection_name = request.GET.get('collection')
+    if not collection_name:
+        return None
+    if DataBrowser.source(collection_name, request.GET.get('source')) == 'firestore':
+        return None
+    label = FirebaseSyncService.counter_key(collection_name)
+    state = SyncGeneration.get([label])[label]
+    if not state[0]:
+        # Never written locally: the page comes from Firestore
+        return None
+    return SyncGeneration.etag('page', state, sorted(request.GET.lists()))
+
+
+def _firebase_updates_etag(request):
+    """
+    ETag of the update check
+
+    The check compares Firestore with the local tables, so the ETag also changes
+    every CACHE_TIMEOUT_DATA seconds to pick up remote changes the sync hasn't seen.
+    """
+    collection_name = request.GET.get('collection')
+    if collection_name:
+        label = FirebaseSyncService.counter_key(collection_name)
+        state = SyncGeneration.get([label])[label]
+    else:
+        state = SyncGeneration.get_all()
+    bucket = int(time.time() // FirebaseService.CACHE_TIMEOUT_DATA)
+    return SyncGeneration.etag('updates', collection_name, state, request.user.pk, bucket)
+
+
+def _auto_sync(request, collection_name):
+    """
+    Sync a collection from Firestore for the data browser
+
+    Returns:
+        int: Documents created or updated
+    """
+    try:
+        sync_stats = FirebaseSyncService.sync_collection(collection_name)
+    except Exception as e:
+        logger.error("Error auto-syncing %s: %s", collection_name, e, extra={'collection': collection_name})
+        return 0
+    if 'error' in sync_stats:
+        return 0
+
+    logger.info(
+        "Auto-synced %s: %s created, %s updated",
+        collection_name, sync_stats['created'], sync_stats['updated'], extra={'collection': collection_name},
+    )
+    if request is not None:
+        messages.success(request, f"Synced {collection_name}: {sync_stats['created']} created, {sync_stats['updated']} updated")
+    return sync_stats['created'] + sync_stats['updated']
+
+
+# A refresh syncs the selected collection, so its SQL grows with the data
+@query_budget(sql=16, firestore=1, rows=80, when={'refresh': {'sql': None, 'firestore': 30, 'rows': None}})
 @login_required
 def firebase_data_view(request):
     """View to display Firebase data with caching and pagination"""
     collection_name = request.GET.get('collection', None)
     refresh = request.GET.get('refresh', '').lower() == 'true'
+    columns = DataBrowser.parse_columns(','.join(request.GET.getlist('columns')))
 
     # Check if database is empty and auto-fetch from Firebase
-    total_records = (
-        Purchase.objects.count() +
-        PremiumSignalPayment.objects.count() +
-        SignalNotification.objects.count() +
-        UserProgress.objects.count()
-    )
+    total_records = sum(CollectionCounters.counts(
+        [Purchase, PremiumSignalPayment, SignalNotification, UserProgress]
+    ).values())
 
     if total_records == 0 and not refresh:
         # Database is empty, force a refresh from Firebase
@@ -358,135 +342,171 @@ def firebase_data_view(request):
             FirebaseService.clear_cache(collection_name)
         else:
             FirebaseService.clear_cache()
-        print("Cache cleared due to refresh request")
+        logger.info("Cache cleared due to refresh request", extra={'collection': collection_name})
 
     # Get all collections (with caching)
     all_collections_raw = FirebaseService.get_all_collections(use_cache=not refresh)
-    print("\n" + "="*80)
-    print(f"ALL COLLECTIONS FOUND: {all_collections_raw}")
-    print("="*80 + "\n")
+    logger.debug("Collections found: %s", all_collections_raw)
 
     # Format collection names for display - [(original_name, display_name), ...]
     all_collections = [(coll, coll.replace('_', ' ').title()) for coll in all_collections_raw]
 
     # Get data from selected collection or all collections
-    firebase_data = []
+    first_page = None
+    document_count = None
     all_data = {}
-    field_names = []
     collection_display_name = collection_name.replace('_', ' ').title() if collection_name else None
     collection_totals = {}
     error_message = None
 
     if collection_name:
-        # Fetch specific collection with caching
         try:
-            firebase_data = FirebaseService.get_collection(collection_name, use_cache=not refresh)
-
-            if firebase_data:
-                print(f"\nFETCHED {len(firebase_data)} documents from '{collection_name}' collection")
-                print("-"*80)
-                for i, doc in enumerate(firebase_data[:5], 1):  # Only print first 5 for performance
-                    print(f"\nDocument {i}: {doc.get('id', 'NO ID')}")
-                    for key, value in doc.items():
-                        if key != 'id':
-                            print(f"  {key}: {value}")
-                if len(firebase_data) > 5:
-                    print(f"\n... and {len(firebase_data) - 5} more documents")
-                print("-"*80 + "\n")
-
-                # Automatically sync to database after fetching
-                try:
-                    sync_stats = FirebaseSyncService.sync_collection(collection_name)
-                    if 'error' not in sync_stats:
-                        print(f"Auto-synced {collection_name}: {sync_stats['created']} created, {sync_stats['updated']} updated")
-                        messages.success(request, f"Synced {collection_name}: {sync_stats['created']} created, {sync_stats['updated']} updated")
-                except Exception as e:
-                    print(f"Error auto-syncing {collection_name}: {e}")
-
-                # Format field names - remove underscores and title case
-                field_names = [(key, key.replace('_', ' ').title()) for key in firebase_data[0].keys()
-                              if key not in ['id', 'uid', 'userId', 'user_id']]
-
-                # Calculate totals for specific collections
-                if collection_name.lower() in ['purchases', 'purchases_collection']:
-                    collection_totals = calculate_collection_totals(firebase_data, ['amount', 'paid', 'total_amount'])
-                elif collection_name.lower() in ['premium_signals_payments', 'premium_signals_payments_collection']:
-                    collection_totals = calculate_collection_totals(firebase_data, ['amount', 'paid', 'total_amount', 'price'])
-            else:
+            # Read Firestore only to refresh or to fill a collection that was never
+            # synced; every page after that is served from the local mirror
+            if refresh or not DataBrowser.is_synced(collection_name):
+                _auto_sync(request, collection_name)
+
+            if DataBrowser.source(collection_name) == 'firestore':
+                # The sync failed: pages come straight from Firestore, with the
+                # columns of a sampled schema so every page has the same ones
+                SchemaInference.infer(collection_name)
+
+            # Only the first page is rendered; the rest is loaded from firebase_data_page
+            first_page = DataBrowser.page(collection_name, columns=columns)
+            if first_page['source'] != 'firestore':
+                document_count = DataBrowser.document_count(collection_name)
+                # Summarize every numeric field of the mirror (cached for a minute)
+                collection_totals = DataBrowser.numeric_summary(collection_name, use_cache=not refresh)
+
+            if not first_page['rows']:
                 error_message = f"No data found in collection '{collection_name}' or request timed out."
         except Exception as e:
             error_message = f"Error loading collection '{collection_name}': {str(e)}"
-            print(f"ERROR: {error_message}")
+            logger.error(error_message, extra={'collection': collection_name})
     elif not collection_name and all_collections_raw:
-        # Fetch all collections if none selected (LIMIT TO 100 docs per collection)
-        print(f"\nFETCHING DATA FROM ALL {len(all_collections_raw)} COLLECTIONS...")
-        print("-"*80)
-        all_data_formatted = {}
+        logger.info("Loading data from all %d collections", len(all_collections_raw))
         total_synced = 0
 
         try:
             for coll in all_collections_raw:
                 try:
-                    # Limit to 100 documents per collection to avoid quota issues
-                    coll_data = FirebaseService.get_collection(coll, use_cache=not refresh, limit=100)
-
-                    if coll_data:
-                        # Format field names for each collection
-                        coll_field_names = [(key, key.replace('_', ' ').title()) for key in coll_data[0].keys()
-                                           if key not in ['id', 'uid', 'userId', 'user_id']]
-                        coll_display_name = coll.replace('_', ' ').title()
-                        all_data_formatted[coll] = {
-                            'data': coll_data,
-                            'field_names': coll_field_names,
-                            'display_name': coll_display_name
+                    if refresh or not DataBrowser.is_synced(coll):
+                        total_synced += _auto_sync(None, coll)
+
+                    # The first page of each collection, from the mirror once synced
+                    page = DataBrowser.page(coll, limit=DataBrowser.OVERVIEW_PAGE_SIZE)
+                    if page['rows']:
+                        all_data[coll] = {
+                            'count': DataBrowser.document_count(coll) if page['source'] != 'firestore' else None,
+                            'display_name': coll.replace('_', ' ').title(),
+                            'page': page,
                         }
-                        print(f"\n{coll}: {len(coll_data)} documents")
-                        # Only print first 2 documents to reduce console spam
-                        for i, doc in enumerate(coll_data[:2], 1):
-                            print(f"  Document {i} ID: {doc.get('id', 'NO ID')}")
-                        if len(coll_data) > 2:
-                            print(f"  ... and {len(coll_data) - 2} more documents")
-
-                        # Automatically sync to database
-                        try:
-                            sync_stats = FirebaseSyncService.sync_collection(coll)
-                            if 'error' not in sync_stats:
-                                print(f"  Auto-synced: {sync_stats['created']} created, {sync_stats['updated']} updated")
-                                total_synced += sync_stats['created'] + sync_stats['updated']
-                        except Exception as e:
-                            print(f"  Error auto-syncing {coll}: {e}")
-
                 except Exception as e:
-                    print(f"Error fetching collection {coll}: {e}")
+                    logger.error("Error loading collection %s: %s", coll, e, extra={'collection': coll})
                     error_message = f"Some collections failed to load due to quota limits. Try selecting a specific collection."
 
-            all_data = all_data_formatted
-            print(f"\nTOTAL: Fetched data from {len(all_data)} collections, synced {total_synced} records")
-            print("-"*80 + "\n")
+            logger.info("Loaded data from %d collections, synced %d records", len(all_data), total_synced)
 
             if total_synced > 0:
                 messages.success(request, f"Successfully synced {total_synced} records from {len(all_data)} collections to database")
 
         except Exception as e:
             error_message = f"Error loading collections: {str(e)}"
-            print(f"ERROR: {error_message}")
+            logger.error(error_message)
     else:
-        print("\nNO COLLECTIONS FOUND OR NO DATA FETCHED")
-        print("-"*80 + "\n")
+        logger.warning("No collections found or no data fetched")
 
     context = {
         'all_collections': all_collections,
         'selected_collection': collection_name,
         'collection_display_name': collection_display_name,
-        'firebase_data': firebase_data,
+        'document_count': document_count,
+        'first_page': first_page,
         'all_data': all_data,
-        'field_names': field_names,
         'collection_totals': collection_totals,
         'error_message': error_message,
+        'last_event_id': SyncEvents.latest_id(),
     }
     return render(request, 'accounts/firebase_data.html', context)
 
 
+@query_budget(sql=6, firestore=1, rows=210)
+@login_required
+@condition(etag_func=_firebase_data_page_etag)
+def firebase_data_page(request):
+    """
+    JSON page of a collection for the data browser's "Load more"
+
+    Query parameters: collection, cursor (last document ID of the previous page),
+    columns (comma-separated), limit and source (the first page's, so the whole
+    session reads one source).
+    """
+    collection_name = request.GET.get('collection')
+    if not collection_name:
+        return JsonResponse({'error': 'collection is required'}, status=400)
+
+    try:
+        limit = int(request.GET.get('limit', DataBrowser.PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer'}, status=400)
+
+    page = DataBrowser.page(
+        collection_name,
+        cursor=request.GET.get('cursor') or None,
+        columns=DataBrowser.parse_columns(request.GET.get('columns')),
+        limit=max(1, limit),
+        source=request.GET.get('source') or None,
+    )
+    return JsonResponse(page)
+
+
+@login_required
+def sync_events_view(request):
+    """
+    Server-sent events stream of sync events for the data page
+
+    Starts after the Last-Event-ID header (sent by the browser on reconnect) or
+    the `after` parameter, or at the newest event if neither is given. Under
+    WSGI the response holds the events recorded so far and the browser's
+    EventSource reconnects to poll.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('after')
+    if last_id:
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            return JsonResponse({'error': 'after must be an event id'}, status=400)
+    else:
+        last_id = SyncEvents.latest_id()
+
+    if isinstance(request, ASGIRequest):
+        # An async generator, so idle connections don't hold a thread
+        response = StreamingHttpResponse(SyncEvents.astream(last_id), content_type='text/event-stream')
+    else:
+        # A WSGI worker would be held for the whole stream: answer at once and let the browser poll
+        response = HttpResponse(SyncEvents.poll(last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx would otherwise buffer the stream
+    return response
+
+
+def metrics_view(request):
+    """
+    Counters, gauges and histograms in the Prometheus text format
+
+    Scrapers send METRICS_TOKEN as a bearer token. Without a token configured
+    only staff users and INTERNAL_IPS may read them.
+    """
+    token = getattr(django_settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_staff or request.META.get('REMOTE_ADDR') in django_settings.INTERNAL_IPS
+    if not allowed:
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def test_database_connection(request):
     """
@@ -578,7 +598,9 @@ def test_database_connection(request):
         }, status=500)
 
 
+@query_budget(sql=20, firestore=20, rows=20)
 @login_required
+@condition(etag_func=_firebase_updates_etag)
 def check_firebase_updates(request):
     """
     Check if there are new updates in Firebase compared to database
@@ -589,6 +611,7 @@ def check_firebase_updates(request):
     try:
         collection_name = request.GET.get('collection', None)
         updates_available = {}
+        checked = {}
         total_new = 0
 
         # Model mapping for supported collections
@@ -609,11 +632,12 @@ def check_firebase_updates(request):
         if collection_name:
             # Check specific collection
             if collection_name.lower() in model_map:
-                firebase_data = FirebaseService.get_collection(collection_name, use_cache=False)
+                # A count aggregation costs one read per 1000 documents instead of reading them all
+                firebase_count = FirebaseService.count_collection(collection_name) or 0
                 model = model_map[collection_name.lower()]
-                db_count = model.objects.count()
-                firebase_count = len(firebase_data) if firebase_data else 0
+                db_count = CollectionCounters.count(model)
                 new_records = max(0, firebase_count - db_count)
+                checked[collection_name] = new_records
 
                 if new_records > 0:
                     updates_available[collection_name] = {
@@ -629,11 +653,11 @@ def check_firebase_updates(request):
             for coll in all_collections:
                 if coll.lower() in model_map:
                     try:
-                        firebase_data = FirebaseService.get_collection(coll, use_cache=False, limit=1000)
+                        firebase_count = FirebaseService.count_collection(coll) or 0
                         model = model_map[coll.lower()]
-                        db_count = model.objects.count()
-                        firebase_count = len(firebase_data) if firebase_data else 0
+                        db_count = CollectionCounters.count(model)
                         new_records = max(0, firebase_count - db_count)
+                        checked[coll] = new_records
 
                         if new_records > 0:
                             updates_available[coll] = {
@@ -643,7 +667,10 @@ def check_firebase_updates(request):
                             }
                             total_new += new_records
                     except Exception as e:
-                        print(f"Error checking {coll}: {e}")
+                        logger.error("Error checking %s: %s", coll, e, extra={'collection': coll})
+
+        # Let every open data page know, so they don't have to check themselves
+        SyncEvents.publish_new_data(checked)
 
         return JsonResponse({
             'success': True,
@@ -654,7 +681,7 @@ def check_firebase_updates(request):
         })
 
     except Exception as e:
-        print(f"ERROR checking updates: {e}")
+        logger.exception("Error checking updates: %s", e)
         return JsonResponse({
             'success': False,
             'error': str(e)
@@ -675,9 +702,7 @@ def sync_firebase_to_db(request):
     try:
         if collection_name:
             # Sync specific collection
-            print(f"\n{'='*80}")
-            print(f"Syncing collection: {collection_name}")
-            print(f"{'='*80}\n")
+            logger.info("Syncing collection: %s", collection_name, extra={'collection': collection_name})
 
             stats = FirebaseSyncService.sync_collection(collection_name)
 
@@ -687,10 +712,11 @@ def sync_firebase_to_db(request):
                     'error': stats['error']
                 }, status=400)
 
-            print(f"\n{'='*80}")
-            print(f"Sync completed for {collection_name}")
-            print(f"Created: {stats['created']}, Updated: {stats['updated']}, Errors: {stats['errors']}")
-            print(f"{'='*80}\n")
+            logger.info(
+                "Sync completed for %s: %s created, %s updated, %s errors",
+                collection_name, stats['created'], stats['updated'], stats['errors'],
+                extra={'collection': collection_name},
+            )
 
             messages.success(
                 request,
@@ -705,9 +731,7 @@ def sync_firebase_to_db(request):
             })
         else:
             # Sync all collections
-            print(f"\n{'='*80}")
-            print("Syncing ALL collections")
-            print(f"{'='*80}\n")
+            logger.info("Syncing all collections")
 
             all_stats = FirebaseSyncService.sync_all_collections()
 
@@ -715,10 +739,9 @@ def sync_firebase_to_db(request):
             total_updated = sum(s['updated'] for s in all_stats.values())
             total_errors = sum(s['errors'] for s in all_stats.values())
 
-            print(f"\n{'='*80}")
-            print(f"All collections synced")
-            print(f"Total - Created: {total_created}, Updated: {total_updated}, Errors: {total_errors}")
-            print(f"{'='*80}\n")
+            logger.info(
+                "All collections synced: %s created, %s updated, %s errors", total_created, total_updated, total_errors
+            )
 
             messages.success(
                 request,
@@ -737,19 +760,19 @@ def sync_firebase_to_db(request):
             })
 
     except Exception as e:
-        print(f"ERROR syncing: {e}")
+        logger.exception("Error syncing: %s", e)
         return JsonResponse({
             'success': False,
             'error': str(e)
         }, status=500)
 
 
+# A search reads the page's ranked IDs and a capped count before the rows
+@query_budget(sql=8, firestore=0, rows=40, when={'search': {'sql': 9, 'rows': 75}})
 @login_required
+@condition(etag_func=_model_etag)
 def model_list_view(request, model_name):
     """Generic view to list data from any Firebase-synced model"""
-    from django.core.paginator import Paginator
-    from django.db.models import Q
-
     # Model mapping
     model_map = {
         'purchases': {
@@ -757,77 +780,66 @@ def model_list_view(request, model_name):
             'display_name': 'Purchases',
             'icon': '💰',
             'fields': ['firebase_id', 'firebase_user_id', 'product_name', 'amount', 'paid', 'status', 'purchase_date'],
-            'searchable': ['firebase_user_id', 'product_name', 'status'],
         },
         'premium_payments': {
             'model': PremiumSignalPayment,
             'display_name': 'Premium Signal Payments',
             'icon': '💎',
             'fields': ['firebase_id', 'firebase_user_id', 'signal_id', 'amount', 'paid', 'status', 'payment_date'],
-            'searchable': ['firebase_user_id', 'signal_id', 'status'],
         },
         'signal_notifications': {
             'model': SignalNotification,
             'display_name': 'Signal Notifications',
             'icon': '📢',
             'fields': ['firebase_id', 'firebase_user_id', 'signal_id', 'title', 'message', 'read', 'notification_date'],
-            'searchable': ['firebase_user_id', 'signal_id', 'title', 'message'],
         },
         'user_progress': {
             'model': UserProgress,
             'display_name': 'User Progress',
             'icon': '📊',
             'fields': ['firebase_id', 'firebase_user_id', 'course_id', 'lesson_id', 'completed', 'progress_percentage', 'last_accessed'],
-            'searchable': ['firebase_user_id', 'course_id', 'lesson_id'],
         },
         'premium_signals': {
             'model': PremiumSignal,
             'display_name': 'Premium Signals',
             'icon': '📈',
             'fields': ['firebase_id', 'signal_type', 'symbol', 'entry_price', 'target_price', 'stop_loss', 'status', 'signal_date'],
-            'searchable': ['symbol', 'signal_type', 'status'],
         },
         'premium_subscriptions': {
             'model': PremiumSignalSubscription,
             'display_name': 'Premium Subscriptions',
             'icon': '⭐',
             'fields': ['firebase_id', 'firebase_user_id', 'subscription_type', 'status', 'start_date', 'end_date'],
-            'searchable': ['firebase_user_id', 'subscription_type', 'status'],
         },
         'courses': {
             'model': Course,
             'display_name': 'Courses',
             'icon': '📚',
             'fields': ['firebase_id', 'title', 'instructor', 'description', 'duration', 'is_published', 'created_at'],
-            'searchable': ['title', 'instructor', 'description'],
         },
         'fcm_tokens': {
             'model': FCMToken,
             'display_name': 'FCM Tokens',
             'icon': '🔔',
             'fields': ['firebase_id', 'firebase_user_id', 'token', 'platform', 'is_active', 'created_at'],
-            'searchable': ['firebase_user_id', 'platform'],
         },
         'app_notifications': {
             'model': AppNotification,
             'display_name': 'App Notifications',
             'icon': '📬',
             'fields': ['firebase_id', 'title', 'message', 'notification_type', 'target_audience', 'is_sent', 'sent_at'],
-            'searchable': ['title', 'message', 'notification_type', 'target_audience'],
         },
         'testimonials': {
             'model': Testimonial,
             'display_name': 'Testimonials',
             'icon': '⭐',
             'fields': ['firebase_id', 'author_name', 'author_email', 'rating', 'comment', 'is_approved', 'created_at'],
-            'searchable': ['author_name', 'author_email', 'comment'],
         },
         'users': {
             'model': FirebaseUser,
             'display_name': 'Firebase Users',
             'icon': '👤',
             'fields': ['firebase_id', 'email', 'display_name', 'is_premium', 'premium_expiry', 'is_active', 'created_at'],
-            'searchable': ['email', 'display_name'],
         },
     }
 
@@ -842,33 +854,90 @@ def model_list_view(request, model_name):
     # Get search query
     search_query = request.GET.get('search', '').strip()
 
-    # Build queryset
-    queryset = model.objects.all().order_by('-synced_at')
+    # Build queryset (ordering is applied by the paginator)
+    queryset = model.objects.all()
 
-    # Apply search filter
-    if search_query:
-        q_objects = Q()
-        for field in model_config['searchable']:
-            q_objects |= Q(**{f"{field}__icontains": search_query})
-        queryset = queryset.filter(q_objects)
+    total_is_estimate = False
+    total_is_capped = False
+
+    if search_query and FullTextSearch.is_indexed(model, search_query):
+        # Relevance-ranked matches from the text index, paged by page number
+        page_obj, total_count, total_is_capped = FullTextSearch.page(
+            model, search_query, request.GET.get('cursor'), 25
+        )
+    else:
+        # Apply search filter (only short terms, or backends without a text index)
+        if search_query:
+            queryset = FullTextSearch.fallback_filter(queryset, model, search_query)
+
+        # Unfiltered totals come from the sync-maintained counters instead of COUNT(*);
+        # search results use the planner's estimate where the backend provides one
+        if search_query:
+            total_count = estimate_count(queryset)
+            total_is_estimate = total_count is not None
+            if total_count is None:
+                total_count = queryset.count()
+        else:
+            total_count = CollectionCounters.count(model)
 
-    # Pagination
-    paginator = Paginator(queryset, 25)  # 25 items per page
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+        # Keyset pagination on (synced_at, id), 25 items per page
+        paginator = KeysetPaginator(queryset, 25, total=None if total_is_estimate else total_count)
+        page_obj = paginator.page(request.GET.get('cursor'))
 
     context = {
         'model_name': model_name,
         'model_config': model_config,
         'page_obj': page_obj,
         'search_query': search_query,
-        'total_count': queryset.count(),
+        'total_count': total_count,
+        'total_is_estimate': total_is_estimate,
+        'total_is_capped': total_is_capped,
     }
 
     return render(request, 'accounts/model_list.html', context)
 
 
+@query_budget(sql=3, firestore=0, rows=3)
+@login_required
+def model_export_view(request, model_name):
+    """
+    Stream a synced model as CSV or NDJSON (staff only)
+
+    Query parameters: format (csv|ndjson), start and end (YYYY-MM-DD, inclusive)
+    and status. The budget covers the request up to the first row; the export
+    itself reads one query per DataExport.CHUNK_SIZE rows.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Exports are restricted to staff'}, status=403)
+
+    if model_name not in DataExport.MODELS:
+        return JsonResponse({'error': f'Invalid model: {model_name}'}, status=404)
+
+    export_format = request.GET.get('format', 'csv').lower()
+    if export_format not in DataExport.FORMATS:
+        return JsonResponse({'error': f'Unsupported format: {export_format}'}, status=400)
+
+    try:
+        queryset = DataExport.queryset(
+            model_name,
+            start=request.GET.get('start'),
+            end=request.GET.get('end'),
+            status=request.GET.get('status'),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        DataExport.stream(queryset, export_format),
+        content_type=DataExport.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{DataExport.filename(model_name, export_format)}"'
+    return response
+
+
+@query_budget(sql=6, firestore=0, rows=8)
 @login_required
+@condition(etag_func=_model_etag)
 def model_detail_view(request, model_name, pk):
     """Generic view to display detail of a single record"""
     from django.shortcuts import get_object_or_404
@@ -0,0 +1,27 @@
+"""
+pytest configuration
+Lets pytest collect the Django test cases (accounts/test_*.py) without
+pytest-django: sets Django up and runs the session against a throwaway test
+database, as `manage.py test` does
+"""
+import importlib.util
+import os
+
+import pytest
+
+
+if importlib.util.find_spec('pytest_django') is None:
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'visiontrader.settings')
+    django.setup()
+
+    @pytest.fixture(scope='session', autouse=True)
+    def django_test_databases():
+        from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False)
+        yield
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,12 +43,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'accounts.middleware.RequestProfileMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'accounts.middleware.FirestoreCallerMiddleware',
+    'accounts.middleware.QueryShapeMiddleware',
+    'accounts.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'visiontrader.urls'
@@ -144,10 +149,144 @@ LOGOUT_REDIRECT_URL = 'login'
 # Using local memory cache for development (simple and fast)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'accounts.cache_backend.InstrumentedLocMemCache',  # LocMemCache with metrics
         'LOCATION': 'firebase-cache',
         'OPTIONS': {
             'MAX_ENTRIES': 1000,
         }
     }
 }
+
+# Query shape logging
+# Records normalized SQL statements so `manage.py query_report` can list
+# slow or unindexed query patterns seen at runtime. Off by default; the log
+# is written under LOG_DIR, outside the source tree
+LOG_DIR = Path(tempfile.gettempdir()) / 'visiontrader'
+QUERY_SHAPE_LOGGING = False
+QUERY_SHAPE_LOG = LOG_DIR / 'query_shapes.log'
+QUERY_SHAPE_SLOW_MS = 100
+
+# Dashboard snapshot
+# Also persist the cached dashboard statistics to a table so other worker
+# processes (and restarts) can reuse them instead of recomputing
+DASHBOARD_SNAPSHOT_TABLE = False
+
+# Columnar analytics export
+# Where `manage.py export_columnar` writes the partitioned Parquet/Arrow files
+# (requires the optional pyarrow package)
+COLUMNAR_EXPORT_DIR = BASE_DIR / 'analytics'
+
+# Generic document mirror
+# Collections without a dedicated model are synced into MirroredDocument as
+# JSON. Up to three fields per collection can be copied into indexed columns
+# for filtering, e.g. {'orders': ['status', 'userId']}; run
+# `manage.py refresh_mirror_fields` after changing this
+MIRROR_EXTRACTED_FIELDS = {}
+
+# Firestore change listeners
+# Collections mirrored in real time by `manage.py listen_firestore`, e.g.
+# {'premium_signals': {'resume_field': 'updated_at'}}. With a resume_field a
+# reconnect only reads documents updated since the last synced watermark (and
+# documents without that field are not listened to, and a count aggregation
+# after each reconnect detects deletions); without one, every (re)connect reads
+# the whole collection once and deletes what it no longer contains
+FIRESTORE_LISTENERS = {}
+
+# Adaptive sync scheduling
+# `manage.py schedule_syncs` syncs each collection every target_changes
+# expected changes (from its observed change rate), within these bounds in
+# seconds. Collections with a freshness SLO (seconds) are synced at least that
+# often and go first; all syncs share one hourly Firestore read budget
+SYNC_SCHEDULE_MIN_INTERVAL = 60
+SYNC_SCHEDULE_MAX_INTERVAL = 86400
+SYNC_SCHEDULE_INITIAL_INTERVAL = 3600
+SYNC_SCHEDULE_TARGET_CHANGES = 5
+SYNC_READ_BUDGET_PER_HOUR = 20000
+SYNC_FRESHNESS_SLO = {
+    'premium_signals': 120,
+    'signal_notifications': 300,
+}
+
+# Firestore backend
+# Where FirebaseService reads documents from. The default is the real
+# Firestore (firebase-credentials.json); for offline runs and benchmarks use
+# the in-memory backend, e.g.
+# {'ENGINE': 'accounts.firestore_backends.InMemoryBackend',
+#  'FIXTURE': BASE_DIR / 'fixtures' / 'firestore.json', 'LATENCY': 0.05}
+# (other keys are passed to the backend in lower case)
+FIRESTORE_BACKEND = {
+    'ENGINE': 'accounts.firestore_backends.FirestoreBackend',
+}
+
+# Firestore capture
+# Record every Firestore call (and, with PAYLOADS 'anonymized' or 'full', its
+# results) to NDJSON segments in DIR, for replay with
+# `manage.py replay_capture` or the ReplayBackend, e.g.
+# {'DIR': BASE_DIR / 'captures', 'PAYLOADS': 'anonymized'}. Anonymized
+# tokens are keyed by ANONYMIZE_KEY (derived from SECRET_KEY by default), so
+# every process of a deployment produces the same tokens
+FIRESTORE_CAPTURE = None
+
+# Query budgets
+# Check each request against its view's @query_budget (SQL statements,
+# Firestore calls, rows fetched): 'warn' logs a report with a diff of the
+# query shapes, 'raise' fails the request with it, None turns the check off.
+# QUERY_BUDGETS overrides budgets by URL name, e.g.
+# {'model_list': {'sql': 8, 'firestore': 0, 'rows': 40}}
+QUERY_BUDGET_MODE = None
+QUERY_BUDGETS = {}
+
+# Request profiling
+# Share of requests (0 to 1) that get a Server-Timing header breaking their
+# time down into SQL, Firestore, rate-limit waits, templates and cache, plus a
+# JSON line on the 'accounts.request_profile' logger. 0 turns profiling off
+REQUEST_PROFILE_SAMPLE_RATE = 0
+
+# Logging
+# Every accounts module logs JSON lines, through the `accounts` logger, to a
+# queue drained by a background thread, so requests never wait on the console
+# (records are dropped, and counted, if the queue fills up). Errors repeating the same
+# message are limited to 5 a minute per logger. Set a module's logger (e.g.
+# 'accounts.firebase_service': {'level': 'DEBUG'}) to DEBUG to see cache hits
+# and dumps of the fetched documents
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'accounts.log_handlers.JsonFormatter'},
+    },
+    'filters': {
+        'rate_limit': {'()': 'accounts.log_handlers.RateLimitFilter', 'rate': 5, 'per': 60, 'level': 'ERROR'},
+    },
+    'handlers': {
+        'async_console': {
+            'class': 'accounts.log_handlers.AsyncHandler',
+            'formatter': 'json',
+            'filters': ['rate_limit'],
+        },
+    },
+    'loggers': {
+        # The module loggers (accounts.views, accounts.firebase_sync, ...) propagate here
+        'accounts': {'handlers': ['async_console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Metrics
+# /metrics serves the counters of accounts.metrics in the Prometheus text
+# format. With several worker processes, set METRICS_DIR to a directory they
+# share so a scrape sees all of them; the files of exited workers are folded
+# into a live one's. Scrapers send METRICS_TOKEN as "Authorization: Bearer
+# <token>"; while it is None only staff users and INTERNAL_IPS get /metrics
+METRICS_DIR = None
+METRICS_TOKEN = None
+
+# Firestore read budget
+# Billed document reads are recorded per collection, caller and hour in the
+# FirestoreReadLedger (report: `manage.py firestore_reads`). Once the reads of
+# the day or the current hour reach a budget, FirebaseService serves cached
+# data only until the next day or hour. None means unlimited, e.g.
+# {'DAILY': 45000, 'HOURLY': 5000}
+FIRESTORE_READ_BUDGET = {
+    'DAILY': None,
+    'HOURLY': None,
+}